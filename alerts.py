@@ -0,0 +1,230 @@
+"""Правила уведомлений о движении курсов.
+
+Правила сгруппированы по паре валют. Пороговые правила хранятся в
+отсортированных списках порогов, поэтому на каждом обновлении курса
+двоичным поиском выбираются только пороги между прошлым и новым курсом.
+Правила на изменение в процентах сгруппированы по длине окна: для окна
+поддерживаются минимум и максимум курса (монотонные очереди), а правила
+отсортированы по проценту, так что сработавшие — это префикс списка.
+"""
+import bisect
+import itertools
+import logging
+import threading
+import time
+from collections import deque, namedtuple
+
+logger = logging.getLogger(__name__)
+
+ABOVE = "above"
+BELOW = "below"
+CROSS = "cross"
+
+ThresholdRule = namedtuple("ThresholdRule", ["id", "pair", "threshold", "direction", "recipient"])
+MoveRule = namedtuple("MoveRule", ["id", "pair", "percent", "window", "recipient"])
+Alert = namedtuple("Alert", ["rule", "rate", "message", "at"])
+
+
+class _Thresholds:
+    """Пороги одной пары для одного направления пересечения"""
+
+    def __init__(self):
+        self.values = []
+        self.rules = []
+
+    def add(self, rule):
+        i = bisect.bisect_right(self.values, rule.threshold)
+        self.values.insert(i, rule.threshold)
+        self.rules.insert(i, rule)
+
+    def remove(self, rule):
+        i = bisect.bisect_left(self.values, rule.threshold)
+        while self.rules[i].id != rule.id:
+            i += 1
+        del self.values[i]
+        del self.rules[i]
+
+    def between(self, lo, hi, side):
+        """Правила с порогом в (lo, hi] при side="right" или [lo, hi) при side="left" """
+        search = bisect.bisect_right if side == "right" else bisect.bisect_left
+        return self.rules[search(self.values, lo):search(self.values, hi)]
+
+
+class _Window:
+    """Скользящее окно курса с минимумом и максимумом за O(1) в среднем"""
+
+    def __init__(self, length):
+        self.length = length
+        self.points = deque()
+        self.mins = deque()
+        self.maxs = deque()
+        self.percents = []
+        self.rules = []
+
+    def add_rule(self, rule):
+        i = bisect.bisect_right(self.percents, rule.percent)
+        self.percents.insert(i, rule.percent)
+        self.rules.insert(i, rule)
+
+    def remove_rule(self, rule):
+        i = self.rules.index(rule)
+        del self.percents[i]
+        del self.rules[i]
+
+    def push(self, at, rate):
+        self.points.append((at, rate))
+        while self.mins and self.mins[-1][1] >= rate:
+            self.mins.pop()
+        self.mins.append((at, rate))
+        while self.maxs and self.maxs[-1][1] <= rate:
+            self.maxs.pop()
+        self.maxs.append((at, rate))
+        start = at - self.length
+        while self.points[0][0] < start:
+            self.points.popleft()
+        while self.mins[0][0] < start:
+            self.mins.popleft()
+        while self.maxs[0][0] < start:
+            self.maxs.popleft()
+
+    def move(self, rate):
+        """Наибольшее отклонение курса от экстремумов окна, в процентах"""
+        low, high = self.mins[0][1], self.maxs[0][1]
+        return max(rate / low - 1, 1 - rate / high) * 100
+
+
+class _PairRules:
+    def __init__(self):
+        self.above = _Thresholds()
+        self.below = _Thresholds()
+        self.windows = {}
+        self.last_rate = None
+
+    def empty(self):
+        return not self.above.rules and not self.below.rules and not self.windows
+
+
+class AlertEngine:
+    """Проверка правил на каждом обновлении курсов.
+
+    ``notify(alert)`` вызывается для каждого сработавшего правила, прошедшего
+    дедупликацию (правило молчит ``cooldown`` секунд после срабатывания) и
+    ограничение частоты (не больше ``rate_limit`` писем адресату за
+    ``rate_period`` секунд).
+    """
+
+    def __init__(self, notify, cooldown=15 * 60, rate_limit=10, rate_period=60 * 60, clock=time.time):
+        self.notify = notify
+        self.cooldown = cooldown
+        self.rate_limit = rate_limit
+        self.rate_period = rate_period
+        self.clock = clock
+        self._pairs = {}
+        self._rules = {}
+        self._fired = {}
+        self._sent = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._rules)
+
+    def rules(self):
+        return list(self._rules.values())
+
+    def add_threshold(self, pair, threshold, direction, recipient):
+        """Уведомление при пересечении курсом пары порога ``threshold``"""
+        if direction not in (ABOVE, BELOW, CROSS):
+            raise ValueError(f"Неизвестное направление: {direction}")
+        rule = ThresholdRule(next(self._ids), tuple(pair), float(threshold), direction, recipient)
+        with self._lock:
+            rules = self._pairs.setdefault(rule.pair, _PairRules())
+            if direction in (ABOVE, CROSS):
+                rules.above.add(rule)
+            if direction in (BELOW, CROSS):
+                rules.below.add(rule)
+            self._rules[rule.id] = rule
+        return rule
+
+    def add_move(self, pair, percent, window, recipient):
+        """Уведомление при изменении курса более чем на ``percent`` % за ``window`` секунд"""
+        rule = MoveRule(next(self._ids), tuple(pair), float(percent), float(window), recipient)
+        with self._lock:
+            rules = self._pairs.setdefault(rule.pair, _PairRules())
+            window_state = rules.windows.get(rule.window)
+            if window_state is None:
+                window_state = rules.windows[rule.window] = _Window(rule.window)
+            window_state.add_rule(rule)
+            self._rules[rule.id] = rule
+        return rule
+
+    def remove(self, rule_id):
+        with self._lock:
+            rule = self._rules.pop(rule_id, None)
+            if rule is None:
+                return
+            rules = self._pairs[rule.pair]
+            if isinstance(rule, ThresholdRule):
+                if rule.direction in (ABOVE, CROSS):
+                    rules.above.remove(rule)
+                if rule.direction in (BELOW, CROSS):
+                    rules.below.remove(rule)
+            else:
+                window_state = rules.windows[rule.window]
+                window_state.remove_rule(rule)
+                if not window_state.rules:
+                    del rules.windows[rule.window]
+            if rules.empty():
+                del self._pairs[rule.pair]
+            self._fired.pop(rule_id, None)
+
+    def evaluate(self, rate_for):
+        """Проверка всех пар по функции ``rate_for(base, quote)``; возвращает уведомления"""
+        now = self.clock()
+        alerts = []
+        with self._lock:
+            for pair, rules in self._pairs.items():
+                rate = rate_for(*pair)
+                if rate is None:
+                    continue
+                alerts.extend(self._check_pair(pair, rules, rate, now))
+            alerts = [alert for alert in alerts if self._allow(alert, now)]
+        for alert in alerts:
+            try:
+                self.notify(alert)
+            except Exception as e:
+                logger.warning("Не удалось отправить уведомление %s: %s", alert.rule.id, e)
+        return alerts
+
+    def _check_pair(self, pair, rules, rate, now):
+        name = f"{pair[0]}/{pair[1]}"
+        previous = rules.last_rate
+        rules.last_rate = rate
+        if previous is not None and rate > previous:
+            for rule in rules.above.between(previous, rate, "right"):
+                yield Alert(rule, rate, f"{name} поднялся выше {rule.threshold:g}: {rate:g}", now)
+        elif previous is not None and rate < previous:
+            for rule in rules.below.between(rate, previous, "left"):
+                yield Alert(rule, rate, f"{name} опустился ниже {rule.threshold:g}: {rate:g}", now)
+
+        for window in rules.windows.values():
+            window.push(now, rate)
+            move = window.move(rate)
+            for rule in window.rules[:bisect.bisect_right(window.percents, move)]:
+                minutes = rule.window / 60
+                yield Alert(rule, rate, f"{name} изменился на {move:.2f}% за {minutes:g} мин: {rate:g}", now)
+
+    def _allow(self, alert, now):
+        rule = alert.rule
+        last = self._fired.get(rule.id)
+        if last is not None and now - last < self.cooldown:
+            return False
+        sent = self._sent.setdefault(rule.recipient, deque())
+        while sent and sent[0] <= now - self.rate_period:
+            sent.popleft()
+        if len(sent) >= self.rate_limit:
+            logger.info("Уведомление для %s пропущено: превышен лимит", rule.recipient)
+            return False
+        sent.append(now)
+        self._fired[rule.id] = now
+        return True
@@ -0,0 +1,400 @@
+"""Замеры горячих путей приложения без графического интерфейса.
+
+Методы окна (конвертация, страница истории, график) вызываются на
+экземпляре приложения, у которого виджеты Tk заменены заглушками, а
+график рисуется в бэкенде Agg, поэтому дисплей не нужен. Время самих
+виджетов Tk в замеры не входит.
+
+    python benchmarks/bench.py
+    python benchmarks/bench.py --sizes 100 10000 --only convert history
+    python benchmarks/bench.py --save-baseline
+
+Для каждого замера выводятся перцентили задержки и пиковая память
+(tracemalloc). Если есть файл базовых значений, медиана и память
+сравниваются с ним, и при регрессии больше ``--tolerance`` скрипт
+завершается с кодом 1. Базовые значения зависят от машины: их стоит
+сохранять на той же машине, где потом идут сравнения.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from catalog import CurrencyCatalog
+from converter import convert_many
+from export import export_history
+from gg import CurrencyConverterApp
+from history import HistoryStore
+from ratematrix import Quotes, RateMatrix
+from rates import CRYPTO, CRYPTO_CODES, FIAT, FIAT_CODES, RateCache, make_providers
+from timeseries import TimeSeriesStore
+
+DEFAULT_SIZES = [100, 1000, 10000, 100000, 1000000]
+CHART_DAYS = [7, 30, 365]
+MATRIX_SIZES = [10, 100, 1000]
+CATALOG_SIZE = 10000
+# Запросы поиска валют: короткий префикс, слово названия, опечатка (нечеткий поиск)
+CATALOG_QUERIES = {"prefix": "b", "name": "dollar", "fuzzy": "bitcon"}
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+class FakeVar:
+    """Заглушка для StringVar, Entry и Combobox"""
+
+    def __init__(self, value=""):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        self.value = value
+
+
+class FakeTree:
+    """Заглушка для Treeview: хранит строки в списке"""
+
+    def __init__(self):
+        self.rows = []
+        self.counter = 0
+
+    def insert(self, parent, index, values=()):
+        self.counter += 1
+        iid = f"I{self.counter}"
+        if index == "end":
+            self.rows.append((iid, values))
+        else:
+            self.rows.insert(index, (iid, values))
+        return iid
+
+    def delete(self, *iids):
+        removed = set(iids)
+        self.rows = [row for row in self.rows if row[0] not in removed]
+
+    def get_children(self):
+        return tuple(iid for iid, _ in self.rows)
+
+
+class FakeRoot:
+    def after(self, ms, func=None, *args):
+        return None
+
+    def after_cancel(self, job):
+        pass
+
+
+class HeadlessApp(CurrencyConverterApp):
+    """Приложение без окна: данные настоящие, виджеты — заглушки"""
+
+    def __init__(self, history, timeseries):
+        self.root = FakeRoot()
+        rate_cache = RateCache(make_providers())
+        rate_cache.refresh_all()
+        self.init_state(rate_cache, history, timeseries)
+        self.history_tree = FakeTree()
+        self.history_page_var = FakeVar()
+
+        self.amount_entry = FakeVar("1234.56")
+        self.from_currency = FakeVar("USD")
+        self.to_currency = FakeVar("EUR")
+        self.exact_var = FakeVar(False)
+        self.result_var = FakeVar()
+        self.live_convert_var = FakeVar(False)
+
+        self.chart_currency = FakeVar("BTC")
+        self.chart_quote = FakeVar("RUB")
+        self.chart_live = FakeVar(False)
+        self.create_chart_figure()
+        self.canvas = FigureCanvasAgg(self.fig)
+        # Отрисовка выполняется сразу, чтобы ее время попало в замер
+        self.canvas.draw_idle = self.canvas.draw
+        self.canvas.mpl_connect("draw_event", self.on_chart_draw)
+
+
+def measure(func, repeat, warmup=1):
+    """Задержки ``repeat`` запусков и пиковая память отдельного запуска"""
+    for _ in range(warmup):
+        func()
+    gc.collect()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    p50, p95, p99 = np.percentile(times, [50, 95, 99])
+    return {
+        "runs": repeat,
+        "p50_ms": p50 * 1000,
+        "p95_ms": p95 * 1000,
+        "p99_ms": p99 * 1000,
+        "max_ms": max(times) * 1000,
+        "peak_kb": peak / 1024,
+    }
+
+
+def default_repeat(size):
+    if size <= 10000:
+        return 30
+    if size <= 100000:
+        return 10
+    return 3
+
+
+def fill_history(store, count, rng):
+    """Дописывает в историю ``count`` случайных операций"""
+    codes = FIAT_CODES + CRYPTO_CODES
+    now = time.time()
+    start = now - 365 * 24 * 60 * 60
+    pairs = rng.integers(0, len(codes), size=(count, 2))
+    amounts = rng.uniform(1, 10000, count).round(2).tolist()
+    rates = rng.uniform(0.001, 1000, count).tolist()
+    stamps = np.linspace(start, now, count, endpoint=False).tolist()
+    for i in range(count):
+        amount, rate = amounts[i], rates[i]
+        store.append(stamps[i], amount, codes[pairs[i, 0]], codes[pairs[i, 1]], amount * rate, rate)
+    store.flush()
+
+
+def fill_timeseries(store, days, step, rng):
+    """Ряды котировок с шагом ``step`` секунд за ``days`` дней"""
+    end = time.time()
+    timestamps = np.arange(end - days * 24 * 60 * 60, end, step)
+    start_rates = {"USD": 1.0, "EUR": 0.9, "RUB": 90.0, "BTC": 1 / 60000, "ETH": 1 / 3000}
+    for code, start_rate in start_rates.items():
+        if code == "USD":
+            values = np.ones(len(timestamps))
+        else:
+            walk = np.cumsum(rng.normal(0, 0.0005, len(timestamps)))
+            values = start_rate * np.exp(walk)
+        store.append_many(code, timestamps, values)
+
+
+def history_benchmarks(app, size, repeat, export_dir):
+    """Замеры, зависящие от размера истории"""
+    store = app.history
+    results = {}
+
+    amounts_typed = iter(range(10 ** 9))
+
+    def convert():
+        # Новая сумма при каждом запуске: одинаковый ввод не пишется в историю повторно
+        app.amount_entry.set(f"{1000 + next(amounts_typed) * 0.01:.2f}")
+        app.convert()
+
+    def first_page():
+        app.show_history_page(0)
+
+    def last_page():
+        app.show_history_page(app.history_page_count() - 1)
+
+    results[f"convert/{size}"] = convert
+    results[f"history_first_page/{size}"] = first_page
+    results[f"history_last_page/{size}"] = last_page
+
+    for fmt in ("json", "csv"):
+        path = os.path.join(export_dir, f"history.{fmt}")
+        results[f"export_{fmt}/{size}"] = lambda fmt=fmt, path=path: export_history(store, path, fmt)
+
+    snapshot = app.rate_cache.snapshot()
+    codes = np.array(FIAT_CODES + CRYPTO_CODES)
+    rng = np.random.default_rng(size)
+    amounts = rng.uniform(1, 10000, size).round(2)
+    from_codes = codes[rng.integers(0, len(codes), size)]
+    to_codes = codes[rng.integers(0, len(codes), size)]
+    results[f"convert_many/{size}"] = lambda: convert_many(amounts, from_codes, to_codes, snapshot)
+    results[f"convert_many_exact/{size}"] = lambda: convert_many(
+        amounts, from_codes, to_codes, snapshot, exact=True
+    )
+
+    for name, func in results.items():
+        yield name, func, repeat
+
+
+def chart_benchmarks(app, repeat):
+    for days in CHART_DAYS:
+        yield f"chart/{days}d", lambda days=days: app.update_chart(days), repeat
+
+
+def matrix_benchmarks(repeat):
+    """Построение таблицы кросс-курсов при росте числа валют"""
+    rng = np.random.default_rng(0)
+    for count in MATRIX_SIZES:
+        codes = [f"C{i:04d}" for i in range(count)]
+        quotes = [Quotes("USD", dict(zip(codes, rng.uniform(0.001, 1000, count).tolist())), 1.0)]
+        yield f"matrix/{count}", lambda quotes=quotes: RateMatrix.from_quotes(quotes), repeat
+
+
+class _CatalogSource:
+    def __init__(self, currencies):
+        self._currencies = currencies
+
+    def currencies(self):
+        return self._currencies
+
+
+def catalog_benchmarks(repeat):
+    """Поиск по каталогу с тысячами криптоактивов, как при вводе в поле валюты"""
+    rng = np.random.default_rng(1)
+    letters = np.array(list("abcdefghijklmnopqrstuvwxyz"))
+    crypto = {}
+    while len(crypto) < CATALOG_SIZE:
+        code = "".join(rng.choice(letters, rng.integers(3, 6))).upper()
+        crypto[code] = " ".join("".join(rng.choice(letters, 7)).title() for _ in range(2))
+    fiat = {f"F{i:02d}": f"Dollar {i}" for i in range(150)}
+    catalog = CurrencyCatalog()
+    catalog.refresh({FIAT: _CatalogSource(fiat), CRYPTO: _CatalogSource(crypto)})
+    for name, query in CATALOG_QUERIES.items():
+        yield (f"catalog_search/{name}",
+               lambda query=query: catalog.search(query, limit=CurrencyConverterApp.CURRENCY_LIST_LIMIT),
+               repeat)
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix="gg-bench-")
+    rng = np.random.default_rng(42)
+    try:
+        history = HistoryStore(os.path.join(workdir, "history.sqlite3"),
+                               memory_limit=CurrencyConverterApp.HISTORY_MEMORY_LIMIT)
+        timeseries = TimeSeriesStore(os.path.join(workdir, "rates"))
+        app = HeadlessApp(history, timeseries)
+
+        def selected(name):
+            return not args.only or any(name.startswith(prefix) for prefix in args.only)
+
+        def bench(name, func, repeat):
+            if not selected(name):
+                return
+            result = measure(func, args.repeat or repeat)
+            yield name, result
+
+        if not args.only or any(prefix.startswith("chart") for prefix in args.only):
+            fill_timeseries(timeseries, max(CHART_DAYS), args.chart_step, rng)
+            for item in chart_benchmarks(app, 20):
+                yield from bench(*item)
+
+        for item in matrix_benchmarks(20):
+            yield from bench(*item)
+
+        for item in catalog_benchmarks(50):
+            yield from bench(*item)
+
+        for size in sorted(args.sizes):
+            # История растет до нужного размера; конвертации из замеров тоже попадают в нее
+            if len(history) < size:
+                fill_history(history, size - len(history), rng)
+            for item in history_benchmarks(app, size, default_repeat(size), workdir):
+                yield from bench(*item)
+        history.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def compare(name, result, baseline, tolerance, min_delta, min_memory_delta):
+    """Отметка о регрессии относительно базовых значений.
+
+    Ухудшение меньше ``min_delta`` мс или ``min_memory_delta`` КБ не
+    считается регрессией: такой разброс определяется шумом, а не кодом.
+    """
+    base = baseline.get(name)
+    if base is None:
+        return "", False
+    ratio = result["p50_ms"] / base["p50_ms"] if base["p50_ms"] else 1.0
+    memory = result["peak_kb"] / base["peak_kb"] if base["peak_kb"] else 1.0
+    slower = ratio > 1 + tolerance and result["p50_ms"] - base["p50_ms"] > min_delta
+    heavier = memory > 1 + tolerance and result["peak_kb"] - base["peak_kb"] > min_memory_delta
+    regressed = slower or heavier
+    mark = f"x{ratio:.2f}" + (" РЕГРЕССИЯ" if regressed else "")
+    return mark, regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры горячих путей конвертера")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="размеры истории")
+    parser.add_argument("--only", nargs="+", help="префиксы имен замеров")
+    parser.add_argument("--repeat", type=int, help="число запусков каждого замера")
+    parser.add_argument("--chart-step", type=float, default=60.0,
+                        help="шаг синтетических котировок для графиков, с")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="файл базовых значений")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="сохранить результаты как базовые")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="допустимое ухудшение медианы и памяти")
+    parser.add_argument("--min-delta", type=float, default=1.0,
+                        help="минимальное ухудшение медианы в мс, считающееся регрессией")
+    # Рост памяти на десятки килобайт — это строки и кэши, а не утечка
+    parser.add_argument("--min-memory-delta", type=float, default=64.0,
+                        help="минимальный рост пиковой памяти в КБ, считающийся регрессией")
+    parser.add_argument("--json", help="записать результаты в файл")
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+
+    header = f"{'замер':32} {'p50, мс':>10} {'p95, мс':>10} {'p99, мс':>10} {'макс, мс':>10} {'память, КБ':>11}"
+    print(header)
+    print("-" * len(header))
+    results = {}
+    regressions = []
+    for name, result in run(args):
+        results[name] = result
+        mark, regressed = compare(name, result, baseline, args.tolerance, args.min_delta,
+                                   args.min_memory_delta)
+        if regressed:
+            regressions.append(name)
+        print(f"{name:32} {result['p50_ms']:10.3f} {result['p95_ms']:10.3f} {result['p99_ms']:10.3f} "
+              f"{result['max_ms']:10.3f} {result['peak_kb']:11.1f}  {mark}", flush=True)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.platform(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.save_baseline:
+        # Новые значения дополняют прежние, чтобы частичный прогон не стирал остальные
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding="utf-8") as f:
+                previous = json.load(f)["results"]
+            report["results"] = {**previous, **results}
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Базовые значения сохранены в {args.baseline}")
+
+    if regressions:
+        print(f"Регрессии: {', '.join(regressions)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
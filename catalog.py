@@ -0,0 +1,269 @@
+"""Каталог валют с поиском по коду и названию.
+
+Список валют запрашивается у поставщиков котировок (сотни обычных валют
+и криптоактивы, по которым запрашиваются котировки), кэшируется на диске
+и обновляется в фоне раз в сутки. Коды, пришедшие в котировках,
+добавляются в каталог сразу.
+
+Для поиска строится отсортированный массив ключей — кодов и слов
+названий в нижнем регистре; совпадения по префиксу находятся двумя
+двоичными поисками. Если по префиксу почти ничего нет, добавляются нечеткие
+совпадения по кодам и названиям на ту же букву (``difflib``). Индекс неизменяемый:
+обновление каталога строит новый и подменяет ссылку, поэтому поток
+интерфейса ищет без блокировок.
+"""
+import bisect
+import difflib
+import json
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+
+from rates import CRYPTO, CRYPTO_CODES, FIAT, FIAT_CODES
+
+logger = logging.getLogger(__name__)
+
+Currency = namedtuple("Currency", ["code", "name", "kind"])
+
+# Каталог запрашивается у поставщиков раз в сутки
+DEFAULT_TTL = 24 * 60 * 60
+
+# Названия валют, известные без обращения к поставщикам
+BUILTIN_NAMES = {
+    "USD": "Доллар США",
+    "EUR": "Евро",
+    "RUB": "Российский рубль",
+    "GBP": "Фунт стерлингов",
+    "JPY": "Японская иена",
+    "CNY": "Китайский юань",
+    "BTC": "Bitcoin",
+    "ETH": "Ethereum",
+    "XRP": "XRP",
+    "LTC": "Litecoin",
+    "ADA": "Cardano",
+    "DOGE": "Dogecoin",
+}
+
+# Нечеткий поиск заметно медленнее префиксного и запускается,
+# только если по префиксу нашлось меньше стольких совпадений
+FUZZY_BELOW = 5
+
+# Эти валюты стоят в начале списков, остальные — в порядке поставщика
+PRIORITY = {FIAT: FIAT_CODES, CRYPTO: CRYPTO_CODES}
+
+
+def display(currency):
+    """Строка для списка выбора: код и название"""
+    if currency.name and currency.name != currency.code:
+        return f"{currency.code} — {currency.name}"
+    return currency.code
+
+
+def code_from_text(text):
+    """Код валюты из строки списка выбора или из ввода пользователя"""
+    text = text.strip()
+    return text.split(" ", 1)[0].upper() if text else ""
+
+
+class _Index:
+    """Валюты в порядке показа и отсортированные ключи поиска"""
+
+    def __init__(self, currencies):
+        self.currencies = currencies
+        self.ranks = {currency.code: rank for rank, currency in enumerate(currencies)}
+        pairs = []
+        for rank, currency in enumerate(currencies):
+            pairs.append((currency.code.lower(), rank))
+            for word in currency.name.lower().split():
+                pairs.append((word, rank))
+        pairs.sort()
+        self.keys = [key for key, _ in pairs]
+        self.key_ranks = [rank for _, rank in pairs]
+        # Для нечеткого поиска: строка -> ранги валют с таким кодом или названием
+        self.fuzzy = {}
+        for rank, currency in enumerate(currencies):
+            self.fuzzy.setdefault(currency.code.lower(), []).append(rank)
+            if currency.name:
+                self.fuzzy.setdefault(currency.name.lower(), []).append(rank)
+        self.fuzzy_keys = sorted(self.fuzzy)
+
+    def prefix(self, prefix):
+        """Ранги валют, у которых код или слово названия начинается с ``prefix``"""
+        lo = bisect.bisect_left(self.keys, prefix)
+        hi = bisect.bisect_left(self.keys, prefix + "\uffff")
+        return set(self.key_ranks[lo:hi])
+
+    def close(self, query, limit):
+        # Опечатка в первой букве редка: сравниваются только строки на ту же букву
+        lo = bisect.bisect_left(self.fuzzy_keys, query[0])
+        hi = bisect.bisect_left(self.fuzzy_keys, query[0] + "\uffff")
+        matches = difflib.get_close_matches(query, self.fuzzy_keys[lo:hi], n=limit, cutoff=0.6)
+        ranks = []
+        for match in matches:
+            ranks.extend(self.fuzzy[match])
+        return ranks
+
+
+class CurrencyCatalog:
+    """Валюты по типам (``FIAT``, ``CRYPTO``) с поиском и кэшем в файле ``path``"""
+
+    def __init__(self, path=None, ttl=DEFAULT_TTL, clock=time.time):
+        self.path = path
+        self.ttl = ttl
+        self.clock = clock
+        self.fetched_at = None
+        self._lock = threading.Lock()
+        self._names = None
+        self._index = None
+
+    def _ensure_loaded(self):
+        # Каталог читается с диска при первом обращении, а не при запуске окна
+        with self._lock:
+            if self._names is not None:
+                return
+            names = {FIAT: {}, CRYPTO: {}}
+            for kind, codes in PRIORITY.items():
+                for code in codes:
+                    names[kind][code] = BUILTIN_NAMES.get(code, code)
+            if self.path and os.path.exists(self.path):
+                try:
+                    with open(self.path, encoding="utf-8") as f:
+                        data = json.load(f)
+                    for kind in names:
+                        for code, name in data.get(kind, []):
+                            names[kind].setdefault(code, name)
+                    self.fetched_at = data.get("fetched_at")
+                except (OSError, ValueError) as e:
+                    logger.warning("Не удалось прочитать каталог валют: %s", e)
+            self._names = names
+            self._index = self._build(names)
+
+    @staticmethod
+    def _build(names):
+        currencies = []
+        seen = set()
+        for kind in (FIAT, CRYPTO):
+            for code, name in names[kind].items():
+                # Код, который есть в обоих списках, остается обычной валютой
+                if code not in seen:
+                    seen.add(code)
+                    currencies.append(Currency(code, name or code, kind))
+        return _Index(currencies)
+
+    def __len__(self):
+        self._ensure_loaded()
+        return len(self._index.currencies)
+
+    def get(self, code):
+        self._ensure_loaded()
+        index = self._index
+        rank = index.ranks.get(code)
+        return None if rank is None else index.currencies[rank]
+
+    def codes(self, kind=None):
+        self._ensure_loaded()
+        return [c.code for c in self._index.currencies if kind is None or c.kind == kind]
+
+    def search(self, query="", kind=None, limit=50):
+        """Валюты по началу кода или слова названия; при нехватке — нечеткие совпадения"""
+        self._ensure_loaded()
+        index = self._index
+        query = query.strip().lower()
+        currencies = index.currencies
+        if not query:
+            return [c for c in currencies if kind is None or c.kind == kind][:limit]
+
+        code = query.split(" ", 1)[0]
+        # Точное совпадение кода первым, затем по порядку каталога
+        ranks = sorted(index.prefix(query), key=lambda rank: (currencies[rank].code.lower() != code, rank))
+        result = [currencies[rank] for rank in ranks if kind is None or currencies[rank].kind == kind]
+        if len(result) < min(limit, FUZZY_BELOW) and len(query) >= 3:
+            found = {c.code for c in result}
+            for rank in index.close(query, limit):
+                currency = currencies[rank]
+                if currency.code not in found and (kind is None or currency.kind == kind):
+                    found.add(currency.code)
+                    result.append(currency)
+        return result[:limit]
+
+    def add_codes(self, kind, codes):
+        """Добавление кодов из котировок; возвращает True, если каталог изменился"""
+        self._ensure_loaded()
+        with self._lock:
+            known = self._index.ranks
+            new = [code for code in codes if code not in known]
+            if not new:
+                return False
+            names = {k: dict(v) for k, v in self._names.items()}
+            for code in new:
+                names.setdefault(kind, {})[code] = BUILTIN_NAMES.get(code, code)
+            self._names = names
+            self._index = self._build(names)
+        return True
+
+    def is_stale(self):
+        self._ensure_loaded()
+        return self.fetched_at is None or self.clock() - self.fetched_at >= self.ttl
+
+    def next_refresh_in(self):
+        """Секунд до устаревания каталога"""
+        self._ensure_loaded()
+        if self.fetched_at is None:
+            return 0
+        return max(0.0, self.fetched_at + self.ttl - self.clock())
+
+    def refresh(self, providers):
+        """Загрузка списков валют у поставщиков ``{kind: provider}``; возвращает число валют"""
+        self._ensure_loaded()
+        loaded = {}
+        errors = []
+        for kind, provider in providers.items():
+            try:
+                loaded[kind] = provider.currencies()
+            except Exception as e:
+                errors.append(f"{kind}: {e}")
+        if not loaded:
+            raise RuntimeError("Не удалось загрузить каталог валют: " + "; ".join(errors))
+
+        with self._lock:
+            names = {k: dict(v) for k, v in self._names.items()}
+            for kind, currencies in loaded.items():
+                # Загруженный список заменяет прежний: валюты, которых больше нет
+                # у поставщика, не остаются в поиске без курса
+                target = names[kind] = {
+                    code: BUILTIN_NAMES.get(code, code) for code in PRIORITY.get(kind, ())
+                }
+                for code, name in currencies.items():
+                    code = code.upper()
+                    # Название поставщика заменяет код, но не встроенное название
+                    if code not in BUILTIN_NAMES and name and name != code:
+                        target[code] = name
+                    else:
+                        target.setdefault(code, BUILTIN_NAMES.get(code, code))
+            self._names = names
+            self._index = self._build(names)
+            self.fetched_at = self.clock()
+        self.save()
+        if errors:
+            logger.warning("Каталог валют загружен не полностью: %s", "; ".join(errors))
+        return len(self._index.currencies)
+
+    def refresh_if_stale(self, providers):
+        """Обновление для планировщика: None, если каталог еще свежий"""
+        if not self.is_stale():
+            return None
+        return self.refresh(providers)
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            data = {"fetched_at": self.fetched_at}
+            for kind, names in self._names.items():
+                data[kind] = list(names.items())
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
@@ -0,0 +1,278 @@
+"""Ядро конвертации без графического интерфейса.
+
+Модуль можно импортировать на сервере без дисплея, а также запускать
+как утилиту пакетной конвертации файлов::
+
+    python -m converter settlements.csv -o converted.csv
+    python -m converter operations.jsonl --format jsonl --offline
+    python -m converter settlements.csv --exact
+    python -m converter big.csv -o converted.csv --jobs 0
+
+Входной файл читается и записывается частями фиксированного размера,
+поэтому потребление памяти не зависит от числа строк. С ``--jobs`` файл
+делится между процессами (см. ``jobs.JobPool``).
+
+Без ``--offline`` нужны ключи API обоих источников (``--fiat-key`` и
+``--crypto-key`` или переменные FIAT_API_KEY и CRYPTO_API_KEY): утилита
+не подставляет локальные котировки вместо настоящих молча.
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+from collections import namedtuple
+from itertools import islice
+
+from decimal import Decimal
+
+import numpy as np
+
+from money import convert_exact, convert_many_exact, format_amount, format_rates, parse_amounts
+from rates import RateCache, RateProviderError, make_providers
+
+# Число строк, конвертируемых за один векторный проход
+DEFAULT_CHUNK_SIZE = 65536
+
+# Итог конвертации файла: всего строк и строк без результата
+FileStats = namedtuple("FileStats", ["rows", "skipped"])
+
+
+class ConversionError(Exception):
+    """Курс для пары валют недоступен"""
+
+
+def convert_many(amounts, from_codes, to_codes, snapshot, exact=False):
+    """Векторная конвертация массивов сумм по таблице кросс-курсов.
+
+    Возвращает пару массивов ``(results, rates)``; для неизвестных
+    валют и сумм, которые не разбираются как число, в обоих массивах
+    стоит NaN. При ``exact`` суммы считаются
+    точно с округлением до минорных единиц валют, и вместо массива
+    результатов возвращается ``money.ExactAmounts``.
+    """
+    raw = amounts
+    amounts = parse_amounts(amounts)
+    from_idx = snapshot.indices(from_codes)
+    to_idx = snapshot.indices(to_codes)
+    known = (from_idx >= 0) & (to_idx >= 0) & np.isfinite(amounts)
+    rates = np.full(amounts.shape, np.nan)
+    rates[known] = snapshot.rates_for(from_idx[known], to_idx[known])
+    rates[known & (from_idx == to_idx)] = 1.0
+    if exact:
+        return convert_many_exact(raw, from_idx, to_idx, snapshot.codes, rates)
+    return amounts * rates, rates
+
+
+def convert(amount, from_curr, to_curr, snapshot, exact=False):
+    """Конвертация одной суммы; возвращает ``(result, rate)``.
+
+    При ``exact`` сумма может быть строкой, а результат и курс — ``Decimal``.
+    """
+    if from_curr == to_curr:
+        rate = 1.0
+    else:
+        rate = snapshot.rate(from_curr, to_curr)
+        if rate is None:
+            raise ConversionError(f"Нет курса для пары {from_curr}/{to_curr}")
+    return apply_rate(amount, from_curr, to_curr, rate, exact)
+
+
+def apply_rate(amount, from_curr, to_curr, rate, exact=False):
+    """Конвертация по уже известному курсу пары; возвращает ``(result, rate)``"""
+    if exact:
+        return convert_exact(amount, from_curr, to_curr, rate)
+    return amount * rate, rate
+
+
+def format_result(amount, from_curr, to_curr, result, rate):
+    """Строка результата в том виде, в каком ее показывает интерфейс"""
+    if isinstance(result, Decimal):
+        # Точный результат показывается с числом знаков, принятым для валюты
+        return (f"{format_amount(amount, from_curr)} {from_curr} = "
+                f"{format_amount(result, to_curr)} {to_curr} (Курс: {rate})")
+    return f"{amount:.2f} {from_curr} = {result:.6f} {to_curr} (Курс: {rate:.6f})"
+
+
+def load_snapshot(fiat_api_key=None, crypto_api_key=None):
+    """Синхронно получает котировки и возвращает таблицу кросс-курсов"""
+    cache = RateCache(make_providers(fiat_api_key, crypto_api_key))
+    cache.refresh_all()
+    return cache.snapshot()
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _codes(rows, column):
+    # Пропущенный столбец или нестроковое значение дают неизвестную валюту
+    return [code if isinstance(code, str) else "" for code in (row.get(column) for row in rows)]
+
+
+def _convert_rows(rows, snapshot, columns, exact=False):
+    """Результаты и курсы строк списками; для ошибочных строк — None/NaN.
+
+    В точном режиме и результат, и курс — строки с десятичной записью.
+    """
+    amount_col, from_col, to_col = columns
+    from_codes = _codes(rows, from_col)
+    to_codes = _codes(rows, to_col)
+    # В точном режиме суммы передаются как записаны в файле, чтобы не терять знаки во float
+    amounts = [row.get(amount_col) for row in rows]
+    if exact:
+        results, rates = convert_many(amounts, from_codes, to_codes, snapshot, exact=True)
+        return results.to_strings(), format_rates(rates)
+    results, rates = convert_many(amounts, from_codes, to_codes, snapshot)
+    return results.tolist(), rates.tolist()
+
+
+def convert_csv(src, dst, snapshot, columns=("amount", "from", "to"), chunk_size=DEFAULT_CHUNK_SIZE,
+                exact=False):
+    """Потоковая конвертация CSV; к каждой строке добавляются result и rate.
+
+    Строки с пустой или нечисловой суммой, без нужного столбца или
+    с неизвестной валютой получают пустые result и rate. Возвращает
+    ``FileStats``.
+    """
+    reader = csv.DictReader(src)
+    fieldnames = list(reader.fieldnames or []) + ["result", "rate"]
+    writer = csv.DictWriter(dst, fieldnames=fieldnames)
+    writer.writeheader()
+    count = skipped = 0
+    for rows in _chunks(reader, chunk_size):
+        results, rates = _convert_rows(rows, snapshot, columns, exact)
+        for row, result, rate in zip(rows, results, rates):
+            if result is None or result != result:
+                row["result"] = row["rate"] = ""
+                skipped += 1
+            else:
+                row["result"] = result
+                row["rate"] = rate
+        writer.writerows(rows)
+        count += len(rows)
+    return FileStats(count, skipped)
+
+
+def convert_jsonl(src, dst, snapshot, columns=("amount", "from", "to"), chunk_size=DEFAULT_CHUNK_SIZE,
+                  exact=False):
+    """Потоковая конвертация JSON Lines; неизвестный курс записывается как null.
+
+    В точном режиме результат и курс записываются строками, чтобы не терять знаки.
+    Строки, которые не являются объектом JSON, переносятся без изменений.
+    Возвращает ``FileStats``.
+    """
+    count = skipped = 0
+    lines = (line for line in src if line.strip())
+    for chunk in _chunks(lines, chunk_size):
+        parsed = []
+        for line in chunk:
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            parsed.append(row if isinstance(row, dict) else None)
+        rows = [row for row in parsed if row is not None]
+        results, rates = _convert_rows(rows, snapshot, columns, exact) if rows else ([], [])
+        converted = zip(rows, results, rates)
+        for line, row in zip(chunk, parsed):
+            count += 1
+            if row is None:
+                dst.write(line.rstrip("\r\n"))
+                dst.write("\n")
+                skipped += 1
+                continue
+            row, result, rate = next(converted)
+            if result is None or result != result:
+                row["result"] = row["rate"] = None
+                skipped += 1
+            else:
+                row["result"] = result
+                row["rate"] = rate
+            dst.write(json.dumps(row, ensure_ascii=False))
+            dst.write("\n")
+    return FileStats(count, skipped)
+
+
+def detect_format(path):
+    """Формат файла по расширению: ``"jsonl"`` для .jsonl/.ndjson, иначе ``"csv"``"""
+    if path and path.lower().endswith((".jsonl", ".ndjson")):
+        return "jsonl"
+    return "csv"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m converter",
+        description="Пакетная конвертация сумм из CSV или JSONL",
+    )
+    parser.add_argument("input", nargs="?", default="-", help="входной файл (по умолчанию stdin)")
+    parser.add_argument("-o", "--output", default="-", help="выходной файл (по умолчанию stdout)")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="формат файла (по расширению)")
+    parser.add_argument("--amount-column", default="amount")
+    parser.add_argument("--from-column", default="from")
+    parser.add_argument("--to-column", default="to")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--exact", action="store_true",
+                        help="точный расчет с округлением до минорных единиц валют")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="число процессов; 0 — по числу ядер (нужны входной и выходной файлы)")
+    parser.add_argument("--fiat-key", default=os.environ.get("FIAT_API_KEY"))
+    parser.add_argument("--crypto-key", default=os.environ.get("CRYPTO_API_KEY"))
+    parser.add_argument("--offline", action="store_true", help="использовать локальные котировки")
+    args = parser.parse_args(argv)
+    # Ошибка получения курсов выводится одной строкой ниже; предупреждения кэша дублировали бы ее
+    logging.basicConfig(level=logging.ERROR, format="%(message)s")
+
+    if not args.offline and not (args.fiat_key and args.crypto_key):
+        parser.error("нужны ключи --fiat-key и --crypto-key (или FIAT_API_KEY и CRYPTO_API_KEY); "
+                     "для локальных котировок укажите --offline")
+    try:
+        if args.offline:
+            snapshot = load_snapshot()
+        else:
+            snapshot = load_snapshot(args.fiat_key, args.crypto_key)
+    except (RateProviderError, ValueError) as e:
+        print(f"Не удалось получить курсы: {e}", file=sys.stderr)
+        return 1
+
+    fmt = args.format or detect_format(args.input)
+    columns = (args.amount_column, args.from_column, args.to_column)
+
+    if args.jobs != 1:
+        if args.input == "-" or args.output == "-":
+            parser.error("--jobs требует входной и выходной файлы")
+        from jobs import JobPool
+
+        pool = JobPool(args.jobs or None)
+        try:
+            stats = pool.convert_file(args.input, args.output, snapshot, fmt=fmt, columns=columns,
+                                      exact=args.exact).wait()
+        finally:
+            pool.shutdown()
+        print(f"Сконвертировано строк: {stats.rows}, без результата: {stats.skipped}", file=sys.stderr)
+        return 0
+    convert_file = convert_jsonl if fmt == "jsonl" else convert_csv
+
+    src = sys.stdin if args.input == "-" else open(args.input, newline="", encoding="utf-8")
+    dst = sys.stdout if args.output == "-" else open(args.output, "w", newline="", encoding="utf-8")
+    try:
+        stats = convert_file(src, dst, snapshot, columns=columns, chunk_size=args.chunk_size,
+                             exact=args.exact)
+    finally:
+        if src is not sys.stdin:
+            src.close()
+        if dst is not sys.stdout:
+            dst.close()
+    print(f"Сконвертировано строк: {stats.rows}, без результата: {stats.skipped}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,200 @@
+"""Потоковый экспорт истории операций.
+
+История читается из ``HistoryStore`` частями и сразу пишется в файл,
+поэтому в памяти одновременно находится только одна часть. Запись идет
+во временный файл рядом с целевым, который подменяет целевой только
+после успешного экспорта: отмена или ошибка не оставляют обрезанный файл.
+Форматы Parquet и Arrow IPC требуют установленного пакета ``pyarrow``.
+"""
+import csv
+import json
+import os
+import threading
+
+FIELDS = ["date", "amount", "from", "to", "result", "rate"]
+
+# Формат -> расширение файла по умолчанию
+FORMATS = {
+    "json": ".json",
+    "jsonl": ".jsonl",
+    "csv": ".csv",
+    "parquet": ".parquet",
+    "arrow": ".arrow",
+}
+
+DEFAULT_CHUNK_SIZE = 10000
+
+
+class ExportCancelled(Exception):
+    """Экспорт прерван пользователем"""
+
+
+class _CsvWriter:
+    def __init__(self, path):
+        self.file = open(path, "w", newline="", encoding="utf-8")
+        self.writer = csv.DictWriter(self.file, fieldnames=FIELDS)
+        self.writer.writeheader()
+
+    def write(self, chunk):
+        self.writer.writerows(op.to_dict() for op in chunk)
+
+    def close(self):
+        self.file.close()
+
+
+class _JsonLinesWriter:
+    def __init__(self, path):
+        self.file = open(path, "w", encoding="utf-8")
+
+    def write(self, chunk):
+        self.file.writelines(json.dumps(op.to_dict(), ensure_ascii=False) + "\n" for op in chunk)
+
+    def close(self):
+        self.file.close()
+
+
+class _JsonWriter:
+    """JSON-массив, записываемый по одному элементу"""
+
+    def __init__(self, path):
+        self.file = open(path, "w", encoding="utf-8")
+        self.file.write("[")
+        self.first = True
+
+    def write(self, chunk):
+        for op in chunk:
+            self.file.write("\n  " if self.first else ",\n  ")
+            self.file.write(json.dumps(op.to_dict(), ensure_ascii=False))
+            self.first = False
+
+    def close(self):
+        self.file.write("]\n" if self.first else "\n]\n")
+        self.file.close()
+
+
+class _ArrowWriter:
+    """Столбцовые форматы: каждая часть истории становится одним record batch"""
+
+    def __init__(self, path, fmt):
+        try:
+            import pyarrow as pa
+        except ImportError as e:
+            raise RuntimeError("Для экспорта в Parquet/Arrow установите пакет pyarrow") from e
+        self.pa = pa
+        self.schema = pa.schema([
+            ("date", pa.timestamp("us", tz="UTC")),
+            ("amount", pa.float64()),
+            ("from", pa.string()),
+            ("to", pa.string()),
+            ("result", pa.float64()),
+            ("rate", pa.float64()),
+        ])
+        if fmt == "parquet":
+            import pyarrow.parquet as pq
+            self.writer = pq.ParquetWriter(path, self.schema)
+        else:
+            import pyarrow.ipc as ipc
+            self.writer = ipc.new_file(path, self.schema)
+
+    def write(self, chunk):
+        pa = self.pa
+        batch = pa.RecordBatch.from_arrays([
+            pa.array([int(op.timestamp * 1_000_000) for op in chunk], pa.timestamp("us", tz="UTC")),
+            pa.array([op.amount for op in chunk], pa.float64()),
+            pa.array([op.from_curr for op in chunk], pa.string()),
+            pa.array([op.to_curr for op in chunk], pa.string()),
+            pa.array([op.result for op in chunk], pa.float64()),
+            pa.array([op.rate for op in chunk], pa.float64()),
+        ], schema=self.schema)
+        self.writer.write_batch(batch)
+
+    def close(self):
+        self.writer.close()
+
+
+def open_writer(path, fmt):
+    """Писатель указанного формата с методами write(chunk) и close()"""
+    if fmt == "csv":
+        return _CsvWriter(path)
+    if fmt == "jsonl":
+        return _JsonLinesWriter(path)
+    if fmt == "json":
+        return _JsonWriter(path)
+    if fmt in ("parquet", "arrow"):
+        return _ArrowWriter(path, fmt)
+    raise ValueError(f"Неизвестный формат экспорта: {fmt}")
+
+
+def export_history(store, path, fmt, start_time=None, end_time=None, currencies=None,
+                   chunk_size=DEFAULT_CHUNK_SIZE, progress=None, cancel=None):
+    """Экспорт истории в файл; возвращает число записанных операций.
+
+    ``progress(done, total)`` вызывается после каждой части,
+    установленное событие ``cancel`` прерывает экспорт с ``ExportCancelled``.
+    Файл ``path`` появляется (или заменяется) только при успешном завершении.
+    """
+    tmp = path + ".tmp"
+    try:
+        writer = open_writer(tmp, fmt)
+        count = 0
+        try:
+            for done, total, chunk in store.scan(chunk_size, start_time, end_time, currencies):
+                if cancel is not None and cancel.is_set():
+                    raise ExportCancelled()
+                if chunk:
+                    writer.write(chunk)
+                    count += len(chunk)
+                if progress is not None:
+                    progress(done, total)
+        finally:
+            writer.close()
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return count
+
+
+class ExportJob:
+    """Экспорт в фоновом потоке с отслеживанием прогресса.
+
+    Поля ``done``, ``total``, ``count`` и ``error`` читаются из потока
+    интерфейса периодическим опросом.
+    """
+
+    def __init__(self, store, path, fmt, **filters):
+        self.store = store
+        self.path = path
+        self.fmt = fmt
+        self.filters = filters
+        self.done = 0
+        self.total = len(store)
+        self.count = None
+        self.error = None
+        self.cancel_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    @property
+    def finished(self):
+        return not self.thread.is_alive()
+
+    def _progress(self, done, total):
+        self.done = done
+        self.total = total
+
+    def _run(self):
+        try:
+            self.count = export_history(
+                self.store, self.path, self.fmt,
+                progress=self._progress, cancel=self.cancel_event, **self.filters
+            )
+        except Exception as e:
+            self.error = e
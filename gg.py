@@ -1,58 +1,285 @@
+import time
+
+# Момент запуска для отчета о времени старта
+STARTUP_T0 = time.perf_counter()
+
 import tkinter as tk
-from tkinter import ttk, messagebox
-import requests
+from tkinter import ttk, messagebox, filedialog
 from datetime import datetime, timedelta
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import json
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import os
+import queue
+import sys
 import threading
-import schedule
-import time
+
+# matplotlib, NumPy, requests и smtplib загружаются при первом использовании
+from alerts import ABOVE, BELOW, CROSS, AlertEngine
+from catalog import CurrencyCatalog, code_from_text, display
+from export import FORMATS, ExportJob
+from history import HistoryStore
+from mailer import ALERT, MailDispatcher
+from metrics import DEFAULT_PORT, GAUGE, HISTOGRAM, METRICS, MetricsServer
+from quotestore import QuoteStore
+from scheduler import RefreshScheduler
+from rates import (
+    CRYPTO, DEFAULT_REFRESH_INTERVAL, FIAT, MEDIAN, PRIORITY, PROVIDERS,
+    AggregateProvider, RateCache, make_providers,
+)
+
+# Каталог для данных приложения (история, котировки, ключи API)
+DATA_DIR = os.path.join(os.path.expanduser("~"), ".currency_converter")
 
 class CurrencyConverterApp:
-    def __init__(self, root):
+    # Число операций на одной странице таблицы истории
+    HISTORY_PAGE_SIZE = 50
+    # Число последних операций, хранимых в памяти; остальные на диске
+    HISTORY_MEMORY_LIMIT = 10000
+    # Период записи новых операций истории на диск, мс
+    HISTORY_FLUSH_MS = 1000
+    # Период разбора результатов фоновых обновлений, мс
+    UPDATES_POLL_MS = 200
+    # Пауза после ввода, после которой результат пересчитывается, мс
+    LIVE_CONVERT_DELAY_MS = 150
+    # Период пробы задержки цикла событий Tk, мс
+    LAG_PROBE_MS = 250
+    # Период обновления таблицы метрик на вкладке диагностики, мс
+    DIAGNOSTICS_REFRESH_MS = 1000
+    # Типы валют в списках выбора: подпись -> тип (None — все валюты)
+    CURRENCY_TYPES = {
+        "Обычные валюты": FIAT,
+        "Криптовалюты": CRYPTO,
+        "Все валюты": None,
+    }
+    # Наибольшее число строк в выпадающем списке валют
+    CURRENCY_LIST_LIMIT = 200
+    # Клавиши перемещения по списку, после которых поиск не повторяется
+    NAVIGATION_KEYS = {"Up", "Down", "Left", "Right", "Return", "Escape", "Tab", "Home", "End"}
+    # Периоды отчета по истории: подпись -> период jobs.PERIODS
+    REPORT_PERIODS = {
+        "день": "day",
+        "неделя": "week",
+        "месяц": "month",
+    }
+    # Период опроса фоновых заданий (экспорт истории, пул процессов), мс
+    JOB_POLL_MS = 100
+    # Способы объединения котировок нескольких поставщиков: подпись -> режим
+    MERGE_MODES = {
+        "первый ответивший": PRIORITY,
+        "медиана": MEDIAN,
+    }
+    # Условия уведомлений о курсах: подпись -> направление порога (None — изменение в %)
+    ALERT_CONDITIONS = {
+        "выше": ABOVE,
+        "ниже": BELOW,
+        "пересекает": CROSS,
+        "изменение, %": None,
+    }
+    
+    def __init__(self, root, startup_report=False):
+        self.startup_report = startup_report
+        self.startup_marks = [("импорт модулей", time.perf_counter())]
         self.root = root
         self.root.title("Конвертер валют и криптовалют")
         self.root.geometry("900x700")
         
+        # В каталоге лежат ключи API и история: доступ только владельцу.
+        # makedirs учитывает umask и не трогает уже существующий каталог
+        os.makedirs(DATA_DIR, mode=0o700, exist_ok=True)
+        os.chmod(DATA_DIR, 0o700)
+        
+        # Последние котировки и ключи API сохраняются между запусками
+        self.quote_store = QuoteStore(os.path.join(DATA_DIR, "quotes.sqlite3"))
+        
         # API ключи (можно установить через настройки)
-        self.fiat_api_key = None
-        self.crypto_api_key = None
+        self.fiat_api_key = self.quote_store.get_setting("fiat_api_key")
+        self.crypto_api_key = self.quote_store.get_setting("crypto_api_key")
+        self.merge_mode = self.quote_store.get_setting("merge_mode", PRIORITY)
         self.email_settings = {}
         
-        # История операций
-        self.history = []
+        # Письма отправляются в фоне через одно постоянное SMTP-соединение
+        self.mailer = MailDispatcher()
+        
+        # Уведомления о курсах проверяются при каждом обновлении котировок
+        self.alerts = AlertEngine(self.send_alert)
+        self.alert_status_var = tk.StringVar()
+        
+        # Кэш котировок (без ключей API работают локальные заглушки) и история операций
+        self.init_state(
+            RateCache(self.make_providers()),
+            HistoryStore(
+                os.path.join(DATA_DIR, "history.sqlite3"),
+                memory_limit=self.HISTORY_MEMORY_LIMIT
+            )
+        )
+        self.restore_quotes()
+        self.rate_cache.add_listener(self.store_quotes)
+        self.rate_cache.add_listener(
+            lambda source, rates: self.timeseries.append_snapshot(time.time(), rates)
+        )
+        self.rate_cache.add_listener(self.check_alerts)
+        
+        # Каталог валют для поиска; коды из новых котировок добавляются сразу
+        self.catalog = CurrencyCatalog(os.path.join(DATA_DIR, "catalog.json"))
+        self.rate_cache.add_listener(self.catalog.add_codes)
+        
+        self.root.after(self.HISTORY_FLUSH_MS, self.flush_history)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        
+        # Метрики по умолчанию выключены и почти ничего не стоят
+        METRICS.enabled = self.quote_store.get_setting("metrics_enabled") == "1"
+        self.metrics_server = None
+        self.lag_probe_job = None
+        
+        # Пул процессов для конвертации файлов и отчетов создается при первом задании
+        self._job_pool = None
         
         # Создаем интерфейс
         self.create_widgets()
+        self.mark_startup("интерфейс")
         
         # Запускаем обновление курсов
         self.schedule_updates()
+        self.mark_startup("планировщик")
+        
+        if self.quote_store.get_setting("metrics_server") == "1":
+            self.start_metrics_server(int(self.quote_store.get_setting("metrics_port", DEFAULT_PORT)))
+        if METRICS.enabled:
+            self.start_lag_probe()
+        
+        # Окно показано, когда Tk впервые освободился
+        self.root.after_idle(self.finish_startup)
+    
+    def init_state(self, rate_cache, history, timeseries=None):
+        """Состояние окна, не связанное с виджетами.
+        
+        Вызывается из ``__init__``; замеры в benchmarks/bench.py собирают
+        через него приложение без окна.
+        """
+        self.rate_cache = rate_cache
+        
+        # История операций; страница 0 содержит самые новые записи
+        self.history = history
+        self.history_page = 0
+        self.history_tree = None
+        
+        # Ряды котировок для графиков пополняются при каждом обновлении курсов;
+        # хранилище создается при первой записи или открытии вкладки графиков
+        self._timeseries = timeseries
+        self._timeseries_lock = threading.Lock()
+        
+        # Пересчет при вводе и запомненные курсы последней конвертации
+        self.live_convert_job = None
+        self.rate_memo = {}
+        self.rate_memo_version = None
+        self.last_conversion_key = None
+        self.last_conversion = None
+        self.committed_conversion = None
+        
+        # Данные и фон графика для быстрой перерисовки линии
+        self.chart_background = None
+        self.chart_days = 7
+        self.chart_times = self.chart_values = None
+    
+    @property
+    def job_pool(self):
+        if self._job_pool is None:
+            from jobs import JobPool
+            self._job_pool = JobPool()
+        return self._job_pool
+    
+    def make_providers(self, fiat_api_key=None, crypto_api_key=None):
+        """Поставщики по сохраненным ключам; ошибочная строка ключей заменяется заглушкой"""
+        fiat_api_key = self.fiat_api_key if fiat_api_key is None else fiat_api_key
+        crypto_api_key = self.crypto_api_key if crypto_api_key is None else crypto_api_key
+        try:
+            return make_providers(fiat_api_key, crypto_api_key, merge=self.merge_mode)
+        except ValueError:
+            return make_providers(merge=self.merge_mode)
+    
+    def restore_quotes(self):
+        """Загрузка котировок, сохраненных в прошлых запусках"""
+        for stored in self.quote_store.load():
+            provider = self.rate_cache.providers.get(stored.source)
+            if provider is None:
+                continue
+            # Котировки другого поставщика показываем, но сразу обновляем
+            fresh = stored.provider == provider.name
+            self.rate_cache.restore(stored.source, stored.rates, stored.fetched_at, fresh=fresh)
+    
+    def store_quotes(self, source, rates):
+        """Сохранение свежих котировок на диск (вызывается из фонового потока)"""
+        self.quote_store.save(
+            source,
+            self.rate_cache.providers[source].name,
+            self.rate_cache.fetched_at(source),
+            rates
+        )
+    
+    @property
+    def timeseries(self):
+        """Хранилище рядов котировок (создается при первом обращении)"""
+        with self._timeseries_lock:
+            if self._timeseries is None:
+                from timeseries import TimeSeriesStore
+                self._timeseries = TimeSeriesStore(os.path.join(DATA_DIR, "rates"))
+            return self._timeseries
+    
+    def mark_startup(self, name):
+        """Отметка этапа запуска для отчета о времени старта"""
+        self.startup_marks.append((name, time.perf_counter()))
+    
+    def finish_startup(self):
+        """Вывод отчета о времени запуска"""
+        self.mark_startup("первая отрисовка окна")
+        if not self.startup_report:
+            return
+        print("Время запуска:")
+        previous = STARTUP_T0
+        for name, moment in self.startup_marks:
+            print(f"  {name:<24}{(moment - previous) * 1000:8.1f} мс")
+            previous = moment
+        print(f"  {'итого':<24}{(previous - STARTUP_T0) * 1000:8.1f} мс")
     
     def create_widgets(self):
         """Создание всех элементов интерфейса"""
         self.notebook = ttk.Notebook(self.root)
         self.notebook.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
         
-        # Вкладка конвертера
-        self.create_converter_tab()
-        
-        # Вкладка истории
-        self.create_history_tab()
+        # Вкладка конвертера строится сразу, остальные — при первом выборе
+        self.diagnostics_tree = None
+        self.pending_tabs = {}
+        for text, builder in (
+            ("Конвертер", self.create_converter_tab),
+            ("История", self.create_history_tab),
+            ("Графики", self.create_chart_tab),
+            ("Настройки", self.create_settings_tab),
+            ("Диагностика", self.create_diagnostics_tab),
+        ):
+            frame = ttk.Frame(self.notebook)
+            self.notebook.add(frame, text=text)
+            self.pending_tabs[str(frame)] = (text, builder, frame)
         
-        # Вкладка графиков
-        self.create_chart_tab()
-        
-        # Вкладка настроек
-        self.create_settings_tab()
+        self.build_tab(self.notebook.tabs()[0])
+        self.notebook.bind("<<NotebookTabChanged>>", self.on_tab_changed)
+    
+    def on_tab_changed(self, event):
+        """Построение вкладки при первом ее выборе"""
+        self.build_tab(self.notebook.select())
+        if self.diagnostics_tree is not None and self.diagnostics_job is None:
+            self.update_diagnostics()
     
-    def create_converter_tab(self):
+    def build_tab(self, tab_id):
+        """Построение содержимого отложенной вкладки"""
+        pending = self.pending_tabs.pop(tab_id, None)
+        if pending is None:
+            return
+        text, builder, frame = pending
+        started = time.perf_counter()
+        builder(frame)
+        if self.startup_report:
+            print(f"Вкладка «{text}» построена за {(time.perf_counter() - started) * 1000:.1f} мс")
+    
+    def create_converter_tab(self, converter_frame):
         """Вкладка конвертации валют"""
-        converter_frame = ttk.Frame(self.notebook)
-        self.notebook.add(converter_frame, text="Конвертер")
         
         # Выбор типа валюты
         currency_type_frame = ttk.Frame(converter_frame)
@@ -61,7 +288,7 @@ class CurrencyConverterApp:
         ttk.Label(currency_type_frame, text="Тип валюты:").pack(side=tk.LEFT, padx=5)
         self.currency_type = ttk.Combobox(
             currency_type_frame, 
-            values=["Обычные валюты", "Криптовалюты"],
+            values=list(self.CURRENCY_TYPES),
             state="readonly",
             width=15
         )
@@ -77,19 +304,45 @@ class CurrencyConverterApp:
         self.amount_entry = ttk.Entry(amount_frame, width=20)
         self.amount_entry.pack(side=tk.LEFT, padx=5)
         
+        # Точный режим: десятичная арифметика и округление до минорных единиц валюты
+        self.exact_var = tk.BooleanVar(value=self.quote_store.get_setting("exact_mode") == "1")
+        ttk.Checkbutton(
+            amount_frame, 
+            text="Точный расчет", 
+            variable=self.exact_var,
+            command=self.save_exact_mode
+        ).pack(side=tk.LEFT, padx=5)
+        
+        # Пересчет при вводе; в историю операция попадает только по кнопке или Enter
+        self.live_convert_var = tk.BooleanVar(value=self.quote_store.get_setting("live_convert", "1") == "1")
+        ttk.Checkbutton(
+            amount_frame, 
+            text="Считать при вводе", 
+            variable=self.live_convert_var,
+            command=self.save_live_convert
+        ).pack(side=tk.LEFT, padx=5)
+        self.amount_entry.bind("<KeyRelease>", self.schedule_live_convert)
+        self.amount_entry.bind("<Return>", lambda event: self.convert())
+        
         # Выбор валют
         currency_frame = ttk.Frame(converter_frame)
         currency_frame.pack(pady=10)
         
-        # Исходная валюта
+        # Исходная валюта; в поле можно ввести код или часть названия
         ttk.Label(currency_frame, text="Из:").grid(row=0, column=0, padx=5, sticky=tk.W)
-        self.from_currency = ttk.Combobox(currency_frame, state="readonly", width=10)
+        self.from_currency = ttk.Combobox(currency_frame, width=28)
         self.from_currency.grid(row=0, column=1, padx=5)
+        self.from_currency.bind("<<ComboboxSelected>>", self.schedule_live_convert)
+        self.bind_currency_search(self.from_currency, self.selected_currency_type)
+        self.from_currency.bind("<KeyRelease>", self.schedule_live_convert, add="+")
         
         # Целевая валюта
         ttk.Label(currency_frame, text="В:").grid(row=0, column=2, padx=5, sticky=tk.W)
-        self.to_currency = ttk.Combobox(currency_frame, state="readonly", width=10)
+        self.to_currency = ttk.Combobox(currency_frame, width=28)
         self.to_currency.grid(row=0, column=3, padx=5)
+        self.to_currency.bind("<<ComboboxSelected>>", self.schedule_live_convert)
+        self.bind_currency_search(self.to_currency, self.selected_currency_type)
+        self.to_currency.bind("<KeyRelease>", self.schedule_live_convert, add="+")
         
         # Кнопки
         button_frame = ttk.Frame(converter_frame)
@@ -107,6 +360,30 @@ class CurrencyConverterApp:
             command=self.swap_currencies
         ).pack(side=tk.LEFT, padx=5)
         
+        # Конвертация файлов CSV/JSONL в пуле процессов
+        file_frame = ttk.LabelFrame(converter_frame, text="Пакетная конвертация", padding=5)
+        file_frame.pack(side=tk.BOTTOM, fill=tk.X, padx=10, pady=5)
+        
+        ttk.Button(
+            file_frame, 
+            text="Конвертировать файл...", 
+            command=self.convert_file
+        ).pack(side=tk.LEFT, padx=5)
+        
+        self.file_job_progress = ttk.Progressbar(file_frame, mode="determinate", maximum=100, length=200)
+        self.file_job_progress.pack(side=tk.LEFT, padx=5)
+        
+        ttk.Button(
+            file_frame, 
+            text="Отмена", 
+            command=lambda: self.cancel_job(self.file_job)
+        ).pack(side=tk.LEFT, padx=5)
+        
+        self.file_job_status_var = tk.StringVar()
+        ttk.Label(file_frame, textvariable=self.file_job_status_var).pack(side=tk.LEFT, padx=5)
+        
+        self.file_job = None
+        
         # Результат
         result_frame = ttk.Frame(converter_frame)
         result_frame.pack(pady=10)
@@ -114,6 +391,14 @@ class CurrencyConverterApp:
         self.result_var = tk.StringVar()
         ttk.Label(result_frame, textvariable=self.result_var, font=("Arial", 12, "bold")).pack()
         
+        as_of = self.rate_cache.as_of()
+        if as_of is None:
+            status = "Загрузка курсов..."
+        else:
+            status = f"Курсы на {datetime.fromtimestamp(as_of):%d.%m.%Y %H:%M} (сохраненные)"
+        self.rates_status_var = tk.StringVar(value=status)
+        ttk.Label(result_frame, textvariable=self.rates_status_var).pack()
+        
         # Email
         email_frame = ttk.Frame(converter_frame)
         email_frame.pack(pady=10)
@@ -128,13 +413,14 @@ class CurrencyConverterApp:
             command=self.send_result_email
         ).pack(side=tk.LEFT, padx=5)
         
+        self.email_status_var = tk.StringVar()
+        ttk.Label(converter_frame, textvariable=self.email_status_var).pack()
+        
         # Инициализация списков валют
         self.update_currency_lists()
     
-    def create_history_tab(self):
+    def create_history_tab(self, history_frame):
         """Вкладка истории операций"""
-        history_frame = ttk.Frame(self.notebook)
-        self.notebook.add(history_frame, text="История")
         
         # Дерево для отображения истории
         columns = ("date", "amount", "from", "to", "result", "rate")
@@ -167,9 +453,9 @@ class CurrencyConverterApp:
         self.history_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=10, pady=10)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         
-        # Кнопки управления историей
+        # Кнопки управления историей (под таблицей на всю ширину)
         control_frame = ttk.Frame(history_frame)
-        control_frame.pack(fill=tk.X, padx=10, pady=5)
+        control_frame.pack(side=tk.BOTTOM, fill=tk.X, padx=10, pady=5, before=self.history_tree)
         
         ttk.Button(
             control_frame, 
@@ -188,11 +474,114 @@ class CurrencyConverterApp:
             text="Экспорт в CSV", 
             command=self.export_history_csv
         ).pack(side=tk.LEFT, padx=5)
+        
+        # Постраничный просмотр истории
+        ttk.Button(
+            control_frame, 
+            text="Старее ▶", 
+            command=lambda: self.show_history_page(self.history_page + 1)
+        ).pack(side=tk.RIGHT, padx=5)
+        
+        self.history_page_var = tk.StringVar()
+        ttk.Label(control_frame, textvariable=self.history_page_var).pack(side=tk.RIGHT, padx=5)
+        
+        ttk.Button(
+            control_frame, 
+            text="◀ Новее", 
+            command=lambda: self.show_history_page(self.history_page - 1)
+        ).pack(side=tk.RIGHT, padx=5)
+        
+        self.update_history_table()
+        
+        # Экспорт с фильтрами по дате и валютам
+        export_frame = ttk.LabelFrame(history_frame, text="Экспорт", padding=5)
+        export_frame.pack(side=tk.BOTTOM, fill=tk.X, padx=10, pady=5, before=control_frame)
+        
+        ttk.Label(export_frame, text="Формат:").grid(row=0, column=0, sticky=tk.W, padx=5)
+        self.export_format = ttk.Combobox(
+            export_frame, 
+            values=list(FORMATS),
+            state="readonly",
+            width=8
+        )
+        self.export_format.grid(row=0, column=1, padx=5)
+        self.export_format.current(0)
+        
+        ttk.Label(export_frame, text="С (ГГГГ-ММ-ДД):").grid(row=0, column=2, sticky=tk.W, padx=5)
+        self.export_from_entry = ttk.Entry(export_frame, width=12)
+        self.export_from_entry.grid(row=0, column=3, padx=5)
+        
+        ttk.Label(export_frame, text="По:").grid(row=0, column=4, sticky=tk.W, padx=5)
+        self.export_to_entry = ttk.Entry(export_frame, width=12)
+        self.export_to_entry.grid(row=0, column=5, padx=5)
+        
+        ttk.Label(export_frame, text="Валюты:").grid(row=0, column=6, sticky=tk.W, padx=5)
+        self.export_currencies_entry = ttk.Entry(export_frame, width=15)
+        self.export_currencies_entry.grid(row=0, column=7, padx=5)
+        
+        ttk.Button(
+            export_frame, 
+            text="Экспорт", 
+            command=lambda: self.export_history(self.export_format.get())
+        ).grid(row=1, column=0, columnspan=2, padx=5, pady=5)
+        
+        self.export_progress = ttk.Progressbar(export_frame, mode="determinate", maximum=100)
+        self.export_progress.grid(row=1, column=2, columnspan=4, sticky=tk.EW, padx=5, pady=5)
+        
+        ttk.Button(
+            export_frame, 
+            text="Отмена", 
+            command=self.cancel_export
+        ).grid(row=1, column=6, padx=5, pady=5)
+        
+        self.export_status_var = tk.StringVar()
+        ttk.Label(export_frame, textvariable=self.export_status_var).grid(row=1, column=7, sticky=tk.W, padx=5)
+        
+        self.export_job = None
+        
+        # Отчет по периодам с теми же фильтрами, что и экспорт; считается в пуле процессов
+        report_frame = ttk.LabelFrame(history_frame, text="Отчет", padding=5)
+        report_frame.pack(side=tk.BOTTOM, fill=tk.X, padx=10, pady=5, before=export_frame)
+        
+        ttk.Label(report_frame, text="Период:").grid(row=0, column=0, sticky=tk.W, padx=5)
+        self.report_period = ttk.Combobox(
+            report_frame, 
+            values=list(self.REPORT_PERIODS),
+            state="readonly",
+            width=8
+        )
+        self.report_period.grid(row=0, column=1, padx=5)
+        self.report_period.set("месяц")
+        
+        ttk.Label(report_frame, text="Валюта:").grid(row=0, column=2, sticky=tk.W, padx=5)
+        self.report_currency = ttk.Combobox(report_frame, values=self.currency_values(), width=20)
+        self.report_currency.grid(row=0, column=3, padx=5)
+        self.report_currency.current(0)
+        self.bind_currency_search(self.report_currency)
+        
+        ttk.Button(
+            report_frame, 
+            text="Построить", 
+            command=self.build_report
+        ).grid(row=0, column=4, padx=5)
+        
+        self.report_progress = ttk.Progressbar(report_frame, mode="determinate", maximum=100)
+        self.report_progress.grid(row=0, column=5, sticky=tk.EW, padx=5)
+        
+        ttk.Button(
+            report_frame, 
+            text="Отмена", 
+            command=lambda: self.cancel_job(self.report_job)
+        ).grid(row=0, column=6, padx=5)
+        
+        self.report_status_var = tk.StringVar()
+        ttk.Label(report_frame, textvariable=self.report_status_var).grid(row=0, column=7, sticky=tk.W, padx=5)
+        
+        self.report_job = None
     
-    def create_chart_tab(self):
+    def create_chart_tab(self, chart_frame):
         """Вкладка графиков курсов"""
-        chart_frame = ttk.Frame(self.notebook)
-        self.notebook.add(chart_frame, text="Графики")
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
         
         # Выбор валюты и периода
         control_frame = ttk.Frame(chart_frame)
@@ -201,12 +590,22 @@ class CurrencyConverterApp:
         ttk.Label(control_frame, text="Валюта:").pack(side=tk.LEFT, padx=5)
         self.chart_currency = ttk.Combobox(
             control_frame, 
-            values=["USD", "EUR", "BTC", "ETH"],
-            state="readonly",
-            width=10
+            values=self.currency_values(),
+            width=20
         )
         self.chart_currency.pack(side=tk.LEFT, padx=5)
         self.chart_currency.current(0)
+        self.bind_currency_search(self.chart_currency)
+        
+        ttk.Label(control_frame, text="в:").pack(side=tk.LEFT, padx=5)
+        self.chart_quote = ttk.Combobox(
+            control_frame, 
+            values=self.currency_values(kind=FIAT),
+            width=20
+        )
+        self.chart_quote.pack(side=tk.LEFT, padx=5)
+        self.chart_quote.set(self.currency_values("RUB", FIAT)[0])
+        self.bind_currency_search(self.chart_quote, lambda: FIAT)
         
         ttk.Button(
             control_frame, 
@@ -226,18 +625,31 @@ class CurrencyConverterApp:
             command=lambda: self.update_chart(365)
         ).pack(side=tk.LEFT, padx=5)
         
-        # График
-        self.fig, self.ax = plt.subplots(figsize=(8, 4))
+        self.chart_live = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            control_frame, 
+            text="Онлайн", 
+            variable=self.chart_live,
+            command=self.toggle_live_chart
+        ).pack(side=tk.LEFT, padx=5)
+        
+        self.create_chart_figure()
         self.canvas = FigureCanvasTkAgg(self.fig, master=chart_frame)
+        # Полная перерисовка — самая дорогая операция графика
+        self.canvas.draw = METRICS.timed("gg_chart_draw_seconds")(self.canvas.draw)
         self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        self.canvas.mpl_connect("draw_event", self.on_chart_draw)
+        
+        # Смена валюты (выбором в списке или вводом кода и Enter) перестраивает график за текущий период
+        for combo in (self.chart_currency, self.chart_quote):
+            combo.bind("<<ComboboxSelected>>", lambda event: self.update_chart(self.chart_days))
+            combo.bind("<Return>", lambda event: self.update_chart(self.chart_days))
         
         # Инициализация графика
         self.update_chart(7)
     
-    def create_settings_tab(self):
+    def create_settings_tab(self, settings_frame):
         """Вкладка настроек"""
-        settings_frame = ttk.Frame(self.notebook)
-        self.notebook.add(settings_frame, text="Настройки")
         
         # Настройки API
         api_frame = ttk.LabelFrame(settings_frame, text="API ключи", padding=10)
@@ -247,6 +659,7 @@ class CurrencyConverterApp:
         ttk.Label(api_frame, text="API для валют:").grid(row=0, column=0, sticky=tk.W, pady=5)
         self.fiat_api_entry = ttk.Entry(api_frame, width=40)
         self.fiat_api_entry.grid(row=0, column=1, padx=5, pady=5)
+        self.fiat_api_entry.insert(0, self.fiat_api_key or "")
         ttk.Button(
             api_frame, 
             text="Сохранить", 
@@ -257,12 +670,50 @@ class CurrencyConverterApp:
         ttk.Label(api_frame, text="API для криптовалют:").grid(row=1, column=0, sticky=tk.W, pady=5)
         self.crypto_api_entry = ttk.Entry(api_frame, width=40)
         self.crypto_api_entry.grid(row=1, column=1, padx=5, pady=5)
+        self.crypto_api_entry.insert(0, self.crypto_api_key or "")
         ttk.Button(
             api_frame, 
             text="Сохранить", 
             command=self.save_crypto_api_key
         ).grid(row=1, column=2, padx=5, pady=5)
         
+        # Несколько поставщиков опрашиваются параллельно
+        hint = "Несколько поставщиков: имя=ключ через запятую, по убыванию приоритета.\n"
+        hint += "Валюты: " + ", ".join(PROVIDERS[FIAT]) + "; криптовалюты: " + ", ".join(PROVIDERS[CRYPTO])
+        ttk.Label(api_frame, text=hint, foreground="gray").grid(row=2, column=0, columnspan=3, sticky=tk.W)
+        
+        ttk.Label(api_frame, text="Объединение:").grid(row=3, column=0, sticky=tk.W, pady=5)
+        self.merge_mode_combo = ttk.Combobox(
+            api_frame, 
+            values=list(self.MERGE_MODES),
+            state="readonly",
+            width=20
+        )
+        self.merge_mode_combo.grid(row=3, column=1, sticky=tk.W, padx=5, pady=5)
+        modes = list(self.MERGE_MODES.values())
+        self.merge_mode_combo.current(modes.index(self.merge_mode) if self.merge_mode in modes else 0)
+        self.merge_mode_combo.bind("<<ComboboxSelected>>", self.save_merge_mode)
+        
+        # Фоновое обновление котировок; при конвертации устаревшие курсы обновляются сразу
+        refresh_frame = ttk.LabelFrame(settings_frame, text="Фоновое обновление курсов", padding=10)
+        refresh_frame.pack(fill=tk.X, padx=10, pady=10)
+        
+        ttk.Label(refresh_frame, text="Валюты, мин:").grid(row=0, column=0, sticky=tk.W, pady=5)
+        self.fiat_interval_entry = ttk.Entry(refresh_frame, width=8)
+        self.fiat_interval_entry.grid(row=0, column=1, padx=5, pady=5)
+        self.fiat_interval_entry.insert(0, f"{self.refresh_interval(FIAT) / 60:g}")
+        
+        ttk.Label(refresh_frame, text="Криптовалюты, мин:").grid(row=0, column=2, sticky=tk.W, pady=5)
+        self.crypto_interval_entry = ttk.Entry(refresh_frame, width=8)
+        self.crypto_interval_entry.grid(row=0, column=3, padx=5, pady=5)
+        self.crypto_interval_entry.insert(0, f"{self.refresh_interval(CRYPTO) / 60:g}")
+        
+        ttk.Button(
+            refresh_frame, 
+            text="Сохранить", 
+            command=self.save_refresh_intervals
+        ).grid(row=0, column=4, padx=5, pady=5)
+        
         # Настройки email
         email_frame = ttk.LabelFrame(settings_frame, text="Настройки почты", padding=10)
         email_frame.pack(fill=tk.X, padx=10, pady=10)
@@ -283,85 +734,374 @@ class CurrencyConverterApp:
         self.password_entry = ttk.Entry(email_frame, width=20, show="*")
         self.password_entry.grid(row=1, column=3, padx=5, pady=5)
         
+        # Без STARTTLS можно работать с локальным отладочным сервером
+        self.starttls_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(
+            email_frame, 
+            text="STARTTLS", 
+            variable=self.starttls_var
+        ).grid(row=2, column=0, sticky=tk.W, pady=5)
+        
         ttk.Button(
             email_frame, 
             text="Сохранить настройки", 
             command=self.save_email_settings
-        ).grid(row=2, column=0, columnspan=4, pady=10)
+        ).grid(row=3, column=0, columnspan=4, pady=10)
+        
+        # Уведомления о курсах
+        alerts_frame = ttk.LabelFrame(settings_frame, text="Уведомления о курсах", padding=10)
+        alerts_frame.pack(fill=tk.X, padx=10, pady=10)
+        
+        ttk.Label(alerts_frame, text="Пара:").grid(row=0, column=0, sticky=tk.W, pady=5)
+        self.alert_from = ttk.Combobox(alerts_frame, values=self.currency_values(), width=16)
+        self.alert_from.grid(row=0, column=1, padx=5, pady=5)
+        self.alert_from.set(self.currency_values("BTC", CRYPTO)[0])
+        self.bind_currency_search(self.alert_from)
+        self.alert_to = ttk.Combobox(alerts_frame, values=self.currency_values(), width=16)
+        self.alert_to.grid(row=0, column=2, padx=5, pady=5)
+        self.alert_to.current(0)
+        self.bind_currency_search(self.alert_to)
+        
+        ttk.Label(alerts_frame, text="Условие:").grid(row=0, column=3, sticky=tk.W, pady=5)
+        self.alert_condition = ttk.Combobox(
+            alerts_frame, 
+            values=list(self.ALERT_CONDITIONS),
+            state="readonly",
+            width=14
+        )
+        self.alert_condition.grid(row=0, column=4, padx=5, pady=5)
+        self.alert_condition.current(0)
+        
+        ttk.Label(alerts_frame, text="Значение:").grid(row=1, column=0, sticky=tk.W, pady=5)
+        self.alert_value_entry = ttk.Entry(alerts_frame, width=12)
+        self.alert_value_entry.grid(row=1, column=1, padx=5, pady=5)
+        
+        ttk.Label(alerts_frame, text="Окно, мин:").grid(row=1, column=2, sticky=tk.W, pady=5)
+        self.alert_window_entry = ttk.Entry(alerts_frame, width=8)
+        self.alert_window_entry.grid(row=1, column=3, padx=5, pady=5)
+        self.alert_window_entry.insert(0, "60")
+        
+        ttk.Label(alerts_frame, text="Email:").grid(row=2, column=0, sticky=tk.W, pady=5)
+        self.alert_email_entry = ttk.Entry(alerts_frame, width=30)
+        self.alert_email_entry.grid(row=2, column=1, columnspan=3, sticky=tk.W, padx=5, pady=5)
+        
+        ttk.Button(
+            alerts_frame, 
+            text="Добавить", 
+            command=self.add_alert
+        ).grid(row=2, column=4, padx=5, pady=5)
+        
+        self.alerts_listbox = tk.Listbox(alerts_frame, height=5)
+        self.alerts_listbox.grid(row=3, column=0, columnspan=4, sticky=tk.EW, padx=5, pady=5)
+        
+        ttk.Button(
+            alerts_frame, 
+            text="Удалить", 
+            command=self.remove_alert
+        ).grid(row=3, column=4, padx=5, pady=5)
+        
+        # Итог отправки уведомлений: они приходят в фоне, поэтому без модальных окон
+        ttk.Label(alerts_frame, textvariable=self.alert_status_var, foreground="gray").grid(
+            row=4, column=0, columnspan=5, sticky=tk.W, padx=5
+        )
+        
+        self.update_alerts_list()
+    
+    def create_diagnostics_tab(self, diagnostics_frame):
+        """Вкладка диагностики: метрики горячих путей"""
+        self.diagnostics_frame = diagnostics_frame
+        
+        control_frame = ttk.Frame(diagnostics_frame)
+        control_frame.pack(fill=tk.X, padx=10, pady=10)
+        
+        self.metrics_enabled_var = tk.BooleanVar(value=METRICS.enabled)
+        ttk.Checkbutton(
+            control_frame, 
+            text="Сбор метрик", 
+            variable=self.metrics_enabled_var,
+            command=self.toggle_metrics
+        ).pack(side=tk.LEFT, padx=5)
+        
+        ttk.Label(control_frame, text="Порт:").pack(side=tk.LEFT, padx=5)
+        self.metrics_port_entry = ttk.Entry(control_frame, width=8)
+        self.metrics_port_entry.pack(side=tk.LEFT, padx=5)
+        self.metrics_port_entry.insert(0, self.quote_store.get_setting("metrics_port", str(DEFAULT_PORT)))
+        
+        # Сервер отдает метрики в формате Prometheus только на локальном адресе
+        self.metrics_server_var = tk.BooleanVar(value=self.metrics_server is not None)
+        ttk.Checkbutton(
+            control_frame, 
+            text="HTTP-сервер", 
+            variable=self.metrics_server_var,
+            command=self.toggle_metrics_server
+        ).pack(side=tk.LEFT, padx=5)
+        
+        ttk.Button(
+            control_frame, 
+            text="Сбросить", 
+            command=METRICS.reset
+        ).pack(side=tk.LEFT, padx=5)
+        
+        self.metrics_status_var = tk.StringVar()
+        ttk.Label(control_frame, textvariable=self.metrics_status_var).pack(side=tk.LEFT, padx=5)
+        if self.metrics_server is not None:
+            self.metrics_status_var.set(f"http://127.0.0.1:{self.metrics_server.port}/metrics")
+        
+        columns = ("metric", "labels", "count", "avg", "max")
+        self.diagnostics_tree = ttk.Treeview(diagnostics_frame, columns=columns, show="headings")
+        for column, text, width in (
+            ("metric", "Метрика", 260),
+            ("labels", "Метки", 200),
+            ("count", "Значение / число", 120),
+            ("avg", "Среднее, мс", 100),
+            ("max", "Макс., мс", 100),
+        ):
+            self.diagnostics_tree.heading(column, text=text)
+            self.diagnostics_tree.column(column, width=width)
+        self.diagnostics_tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        
+        self.diagnostics_job = None
+        self.update_diagnostics()
+    
+    def update_diagnostics(self):
+        """Обновление таблицы метрик, пока открыта вкладка диагностики"""
+        self.diagnostics_job = None
+        if self.notebook.select() != str(self.diagnostics_frame):
+            return
+        
+        self.diagnostics_tree.delete(*self.diagnostics_tree.get_children())
+        for name, labels, kind, value in METRICS.collect():
+            label_text = ", ".join(f"{key}={val}" for key, val in labels.items())
+            if kind == HISTOGRAM:
+                avg = value.total / value.count * 1000 if value.count else 0.0
+                row = (name, label_text, value.count, f"{avg:.2f}", f"{value.max * 1000:.2f}")
+            elif kind == GAUGE:
+                row = (name, label_text, f"{value:.4g}", "", "")
+            else:
+                row = (name, label_text, value, "", "")
+            self.diagnostics_tree.insert("", tk.END, values=row)
+        
+        self.diagnostics_job = self.root.after(self.DIAGNOSTICS_REFRESH_MS, self.update_diagnostics)
+    
+    def toggle_metrics(self):
+        """Включение и выключение сбора метрик"""
+        METRICS.enabled = self.metrics_enabled_var.get()
+        self.quote_store.set_setting("metrics_enabled", "1" if METRICS.enabled else "0")
+        if METRICS.enabled:
+            self.start_lag_probe()
+    
+    def toggle_metrics_server(self):
+        """Запуск и остановка HTTP-сервера метрик"""
+        if not self.metrics_server_var.get():
+            if self.metrics_server is not None:
+                self.metrics_server.stop()
+                self.metrics_server = None
+            self.metrics_status_var.set("")
+            self.quote_store.set_setting("metrics_server", "0")
+            return
+        
+        try:
+            port = int(self.metrics_port_entry.get())
+        except ValueError:
+            self.metrics_server_var.set(False)
+            messagebox.showerror("Ошибка", "Введите номер порта")
+            return
+        error = self.start_metrics_server(port)
+        if error is not None:
+            self.metrics_server_var.set(False)
+            messagebox.showerror("Ошибка", f"Не удалось запустить сервер метрик: {error}")
+            return
+        
+        self.quote_store.set_setting("metrics_server", "1")
+        self.quote_store.set_setting("metrics_port", str(port))
+        self.metrics_enabled_var.set(True)
+        self.toggle_metrics()
+        self.metrics_status_var.set(f"http://127.0.0.1:{self.metrics_server.port}/metrics")
+    
+    def start_metrics_server(self, port):
+        """Запуск сервера метрик; возвращает ошибку или None"""
+        try:
+            self.metrics_server = MetricsServer(port=port).start()
+        except OSError as e:
+            self.metrics_server = None
+            return e
+        METRICS.enabled = True
+        self.start_lag_probe()
+        return None
+    
+    def start_lag_probe(self):
+        """Планирование следующей пробы задержки цикла событий"""
+        if self.lag_probe_job is None:
+            self.lag_probe_due = time.perf_counter() + self.LAG_PROBE_MS / 1000
+            self.lag_probe_job = self.root.after(self.LAG_PROBE_MS, self.probe_lag)
+    
+    def probe_lag(self):
+        """Задержка цикла событий Tk: насколько позже срока сработал таймер"""
+        self.lag_probe_job = None
+        if not METRICS.enabled:
+            return
+        lag = max(0.0, time.perf_counter() - self.lag_probe_due)
+        METRICS.observe("gg_tk_event_loop_lag_seconds", lag)
+        METRICS.set_gauge("gg_tk_event_loop_lag_last_seconds", lag)
+        self.start_lag_probe()
+    
+    def currency_values(self, query="", kind=None):
+        """Строки выпадающего списка: валюты каталога, найденные по запросу"""
+        currencies = self.catalog.search(query, kind, limit=self.CURRENCY_LIST_LIMIT)
+        return [display(currency) for currency in currencies]
+    
+    def selected_currency_type(self):
+        return self.CURRENCY_TYPES.get(self.currency_type.get())
+    
+    def bind_currency_search(self, combo, kind=lambda: None):
+        """Поиск по каталогу при вводе в поле выбора валюты"""
+        def search(event):
+            if event.keysym in self.NAVIGATION_KEYS:
+                return
+            combo["values"] = self.currency_values(combo.get(), kind())
+        combo.bind("<KeyRelease>", search, add="+")
+    
+    def refresh_currency_values(self):
+        """Новые списки валют после обновления каталога; выбранные значения не меняются"""
+        kind = self.selected_currency_type()
+        self.from_currency["values"] = self.to_currency["values"] = self.currency_values(kind=kind)
+        if hasattr(self, "chart_currency"):
+            self.chart_currency["values"] = self.currency_values()
+            self.chart_quote["values"] = self.currency_values(kind=FIAT)
+        if hasattr(self, "alert_from"):
+            self.alert_from["values"] = self.alert_to["values"] = self.currency_values()
+        if hasattr(self, "report_currency"):
+            self.report_currency["values"] = self.currency_values()
     
     def update_currency_lists(self, event=None):
         """Обновление списков валют в зависимости от выбранного типа"""
-        currency_type = self.currency_type.get()
-        
-        if currency_type == "Обычные валюты":
-            currencies = ["USD", "EUR", "RUB", "GBP", "JPY", "CNY"]
-        else:
-            currencies = ["BTC", "ETH", "XRP", "LTC", "ADA", "DOGE"]
+        # Для «Все валюты» пары фиат-крипто считаются через граф котировок
+        currencies = self.currency_values(kind=self.selected_currency_type())
         
         self.from_currency["values"] = currencies
         self.to_currency["values"] = currencies
         
         if len(currencies) > 0:
-            self.from_currency.current(0)
-            if len(currencies) > 1:
-                self.to_currency.current(1)
-            else:
-                self.to_currency.current(0)
+            self.from_currency.set(currencies[0])
+            self.to_currency.set(currencies[1] if len(currencies) > 1 else currencies[0])
+        self.schedule_live_convert()
+    
+    def pair_rate(self, from_curr, to_curr):
+        """Курс пары; запомненные курсы сбрасываются при смене котировок"""
+        snapshot = self.rate_cache.snapshot()
+        if snapshot.version != self.rate_memo_version:
+            self.rate_memo = {}
+            self.rate_memo_version = snapshot.version
+        key = (from_curr, to_curr)
+        if key not in self.rate_memo:
+            self.rate_memo[key] = 1.0 if from_curr == to_curr else snapshot.rate(from_curr, to_curr)
+        return self.rate_memo[key]
     
+    def compute_conversion(self):
+        """Конвертация введенной суммы без записи в историю.
+        
+        Возвращает кортеж ``(amount, from, to, result, rate, text)``; при тех же
+        данных и котировках возвращается прежний кортеж. ``ValueError`` — при
+        некорректной сумме, ``ConversionError`` — если курса нет.
+        """
+        from converter import ConversionError, apply_rate, format_result
+        
+        exact = self.exact_var.get()
+        text = self.amount_entry.get()
+        from_curr = code_from_text(self.from_currency.get())
+        to_curr = code_from_text(self.to_currency.get())
+        # Курс берется из таблицы кросс-курсов без ожидания сети
+        rate = self.pair_rate(from_curr, to_curr)
+        key = (text, from_curr, to_curr, exact, self.rate_memo_version)
+        if key == self.last_conversion_key:
+            return self.last_conversion
+        
+        # В точном режиме сумма передается строкой, без потерь во float
+        amount = text.strip() if exact else float(text)
+        if rate is None:
+            raise ConversionError(f"Нет курса для пары {from_curr}/{to_curr}")
+        result, rate = apply_rate(amount, from_curr, to_curr, rate, exact)
+        
+        # Форматируем результат; для устаревших котировок указываем их время
+        result_str = format_result(amount, from_curr, to_curr, result, rate)
+        if any(self.rate_cache.is_stale(source) for source in self.rate_cache.providers):
+            as_of = self.rate_cache.as_of()
+            if as_of is not None:
+                result_str += f"\nКурсы на {datetime.fromtimestamp(as_of):%d.%m.%Y %H:%M}"
+        
+        self.last_conversion_key = key
+        self.last_conversion = (amount, from_curr, to_curr, result, rate, result_str)
+        return self.last_conversion
+    
+    @METRICS.timed("gg_convert_seconds")
     def convert(self):
         """Выполнение конвертации валют"""
+        from converter import ConversionError
+        
+        if self.live_convert_job is not None:
+            self.root.after_cancel(self.live_convert_job)
+            self.live_convert_job = None
         try:
-            amount = float(self.amount_entry.get())
-            from_curr = self.from_currency.get()
-            to_curr = self.to_currency.get()
-            
-            if from_curr == to_curr:
-                result = amount
-                rate = 1.0
-            else:
-                # Здесь должна быть логика получения реального курса
-                # Для примера используем фиктивные значения
-                rates = {
-                    "USD": 1.0,
-                    "EUR": 0.85,
-                    "RUB": 75.0,
-                    "BTC": 0.000025,
-                    "ETH": 0.0005
-                }
-                
-                if from_curr in rates and to_curr in rates:
-                    rate = rates[to_curr] / rates[from_curr]
-                    result = amount * rate
-                else:
-                    messagebox.showerror("Ошибка", "Не удалось получить курс для выбранных валют")
-                    return
-            
-            # Форматируем результат
-            result_str = f"{amount:.2f} {from_curr} = {result:.6f} {to_curr} (Курс: {rate:.6f})"
-            self.result_var.set(result_str)
-            
-            # Сохраняем в историю
-            operation = {
-                "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "amount": f"{amount:.2f} {from_curr}",
-                "from": from_curr,
-                "to": to_curr,
-                "result": f"{result:.6f} {to_curr}",
-                "rate": f"{rate:.6f}"
-            }
-            self.history.append(operation)
-            self.update_history_table()
-            
+            conversion = self.compute_conversion()
+        except ConversionError:
+            messagebox.showerror("Ошибка", "Не удалось получить курс для выбранных валют")
+            return
         except ValueError:
             messagebox.showerror("Ошибка", "Введите корректную сумму")
+            return
+        
+        amount, from_curr, to_curr, result, rate, result_str = conversion
+        self.result_var.set(result_str)
+        
+        # Сохраняем в историю; повторное нажатие без изменений запись не дублирует
+        if conversion is self.committed_conversion:
+            return
+        self.committed_conversion = conversion
+        operation = self.history.append(
+            time.time(), float(amount), from_curr, to_curr, float(result), float(rate)
+        )
+        self.add_history_row(operation)
+    
+    def schedule_live_convert(self, event=None):
+        """Отложенный пересчет: серия нажатий клавиш дает один расчет"""
+        if not self.live_convert_var.get():
+            return
+        if self.live_convert_job is not None:
+            self.root.after_cancel(self.live_convert_job)
+        self.live_convert_job = self.root.after(self.LIVE_CONVERT_DELAY_MS, self.live_convert)
+    
+    @METRICS.timed("gg_live_convert_seconds")
+    def live_convert(self):
+        """Пересчет результата по мере ввода, без записи в историю"""
+        from converter import ConversionError
+        
+        self.live_convert_job = None
+        try:
+            conversion = self.compute_conversion()
+        except (ValueError, ConversionError):
+            # Пока сумма набирается, ошибки не показываются
+            self.result_var.set("")
+            return
+        self.result_var.set(conversion[-1])
+    
+    def save_live_convert(self):
+        """Сохранение режима пересчета при вводе"""
+        self.quote_store.set_setting("live_convert", "1" if self.live_convert_var.get() else "0")
+        self.schedule_live_convert()
+    
+    def save_exact_mode(self):
+        """Сохранение режима расчета между запусками"""
+        self.quote_store.set_setting("exact_mode", "1" if self.exact_var.get() else "0")
+        self.schedule_live_convert()
     
     def swap_currencies(self):
         """Обмен выбранных валют местами"""
-        from_idx = self.from_currency.current()
-        to_idx = self.to_currency.current()
-        self.from_currency.current(to_idx)
-        self.to_currency.current(from_idx)
+        from_text = self.from_currency.get()
+        self.from_currency.set(self.to_currency.get())
+        self.to_currency.set(from_text)
+        self.schedule_live_convert()
     
+    @METRICS.timed("gg_send_result_email_seconds")
     def send_result_email(self):
         """Отправка результата на email"""
         email = self.email_entry.get()
@@ -371,136 +1111,588 @@ class CurrencyConverterApp:
             messagebox.showerror("Ошибка", "Введите email и получите результат конвертации")
             return
         
-        try:
-            if not self.email_settings:
-                messagebox.showerror("Ошибка", "Настройте почту в разделе Настройки")
-                return
-            
-            msg = MIMEMultipart()
-            msg['From'] = self.email_settings['email']
-            msg['To'] = email
-            msg['Subject'] = 'Результат конвертации валют'
-            
-            body = f"Результат конвертации:\n{result}"
-            msg.attach(MIMEText(body, 'plain'))
-            
-            server = smtplib.SMTP(self.email_settings['smtp'], self.email_settings['port'])
-            server.starttls()
-            server.login(self.email_settings['email'], self.email_settings['password'])
-            server.send_message(msg)
-            server.quit()
-            
-            messagebox.showinfo("Успех", "Результат отправлен на указанный email")
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Не удалось отправить email: {str(e)}")
+        if not self.email_settings:
+            messagebox.showerror("Ошибка", "Настройте почту в разделе Настройки")
+            return
+        
+        # Отправка идет в фоне, итог придет через process_updates
+        self.mailer.send(email, 'Результат конвертации валют', f"Результат конвертации:\n{result}")
+        self.email_status_var.set(f"Письмо для {email} поставлено в очередь")
+    
+    def history_page_count(self):
+        """Число страниц истории"""
+        return max(1, -(-len(self.history) // self.HISTORY_PAGE_SIZE))
+    
+    def update_history_page_label(self):
+        """Обновление подписи с номером страницы"""
+        self.history_page_var.set(f"Стр. {self.history_page + 1} из {self.history_page_count()}")
+    
+    def history_row(self, op):
+        """Значения строки таблицы для операции"""
+        from money import format_amount, format_rate
+        
+        # Знаки после запятой зависят от валюты, как в окне конвертации
+        return (
+            op.date.strftime("%Y-%m-%d %H:%M:%S"),
+            f"{format_amount(op.amount, op.from_curr)} {op.from_curr}",
+            op.from_curr,
+            op.to_curr,
+            f"{format_amount(op.result, op.to_curr)} {op.to_curr}",
+            format_rate(op.rate)
+        )
+    
+    def add_history_row(self, op):
+        """Добавление новой операции без перестройки таблицы"""
+        if self.history_tree is None:
+            # Вкладка истории еще не открывалась и построится сразу с новой записью
+            return
+        if self.history_page == 0:
+            self.history_tree.insert("", 0, values=self.history_row(op))
+            children = self.history_tree.get_children()
+            if len(children) > self.HISTORY_PAGE_SIZE:
+                self.history_tree.delete(children[-1])
+        self.update_history_page_label()
     
+    def show_history_page(self, page):
+        """Показ страницы истории (0 — самые новые операции)"""
+        page = min(max(page, 0), self.history_page_count() - 1)
+        self.history_page = page
+        self.update_history_table()
+    
+    @METRICS.timed("gg_history_table_seconds")
     def update_history_table(self):
-        """Обновление таблицы истории"""
-        for item in self.history_tree.get_children():
-            self.history_tree.delete(item)
-        
-        for op in reversed(self.history[-50:]):  # Показываем последние 50 операций
-            self.history_tree.insert("", tk.END, values=(
-                op["date"],
-                op["amount"],
-                op["from"],
-                op["to"],
-                op["result"],
-                op["rate"]
-            ))
+        """Полная перерисовка текущей страницы истории"""
+        self.history_tree.delete(*self.history_tree.get_children())
+        
+        end = len(self.history) - self.history_page * self.HISTORY_PAGE_SIZE
+        start = max(0, end - self.HISTORY_PAGE_SIZE)
+        for op in reversed(self.history.slice(start, end)):
+            self.history_tree.insert("", tk.END, values=self.history_row(op))
+        self.update_history_page_label()
+    
+    def flush_history(self):
+        """Периодическая запись новых операций на диск: при сбое теряется не больше секунды"""
+        if self.history.pending:
+            self.history.flush()
+        self.root.after(self.HISTORY_FLUSH_MS, self.flush_history)
     
     def clear_history(self):
         """Очистка истории"""
         if messagebox.askyesno("Подтверждение", "Очистить историю операций?"):
-            self.history = []
+            self.history.clear()
+            self.history_page = 0
             self.update_history_table()
     
     def export_history_json(self):
         """Экспорт истории в JSON"""
-        try:
-            with open("conversion_history.json", "w") as f:
-                json.dump(self.history, f, indent=2)
-            messagebox.showinfo("Успех", "История экспортирована в conversion_history.json")
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Не удалось экспортировать историю: {str(e)}")
+        self.export_history("json")
     
     def export_history_csv(self):
         """Экспорт истории в CSV"""
+        self.export_history("csv")
+    
+    def export_filters(self):
+        """Фильтры экспорта из полей вкладки истории"""
+        filters = {}
+        date_from = self.export_from_entry.get().strip()
+        date_to = self.export_to_entry.get().strip()
+        if date_from:
+            filters["start_time"] = datetime.strptime(date_from, "%Y-%m-%d").timestamp()
+        if date_to:
+            # Конечная дата включается целиком
+            filters["end_time"] = (datetime.strptime(date_to, "%Y-%m-%d") + timedelta(days=1)).timestamp()
+        currencies = self.export_currencies_entry.get().replace(",", " ").upper().split()
+        if currencies:
+            filters["currencies"] = currencies
+        return filters
+    
+    def export_history(self, fmt):
+        """Экспорт истории в фоновом потоке"""
+        if self.export_job is not None and not self.export_job.finished:
+            messagebox.showerror("Ошибка", "Экспорт уже выполняется")
+            return
+        
         try:
-            import csv
-            with open("conversion_history.csv", "w", newline="") as f:
-                writer = csv.DictWriter(f, fieldnames=["date", "amount", "from", "to", "result", "rate"])
-                writer.writeheader()
-                writer.writerows(self.history)
-            messagebox.showinfo("Успех", "История экспортирована в conversion_history.csv")
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Не удалось экспортировать историю: {str(e)}")
+            filters = self.export_filters()
+        except ValueError:
+            messagebox.showerror("Ошибка", "Введите даты в формате ГГГГ-ММ-ДД")
+            return
+        
+        path = filedialog.asksaveasfilename(
+            defaultextension=FORMATS[fmt],
+            initialfile=f"conversion_history{FORMATS[fmt]}",
+            filetypes=[(fmt.upper(), f"*{FORMATS[fmt]}")]
+        )
+        if not path:
+            return
+        
+        self.export_job = ExportJob(self.history, path, fmt, **filters).start()
+        self.start_job(self.export_job, self.export_progress, self.export_status_var,
+                       lambda job: f"Записано операций: {job.count}",
+                       failure="Не удалось экспортировать историю")
+    
+    def cancel_export(self):
+        """Отмена фонового экспорта"""
+        self.cancel_job(self.export_job)
+    
+    def convert_file(self):
+        """Конвертация файла CSV или JSONL в пуле процессов"""
+        if self.file_job is not None and not self.file_job.finished:
+            messagebox.showerror("Ошибка", "Конвертация файла уже выполняется")
+            return
+        
+        src = filedialog.askopenfilename(
+            filetypes=[("CSV, JSON Lines", "*.csv *.jsonl *.ndjson"), ("Все файлы", "*.*")]
+        )
+        if not src:
+            return
+        # Модуль converter все равно загрузится вместе с пулом процессов
+        from converter import detect_format
+        
+        fmt = detect_format(src)
+        dst = filedialog.asksaveasfilename(
+            defaultextension=f".{fmt}",
+            initialfile=f"{os.path.splitext(os.path.basename(src))[0]}_converted.{fmt}",
+            filetypes=[(fmt.upper(), f"*.{fmt}")]
+        )
+        if not dst:
+            return
+        
+        try:
+            self.file_job = self.job_pool.convert_file(
+                src, dst, self.rate_cache.snapshot(), fmt=fmt, exact=self.exact_var.get()
+            )
+        except (OSError, UnicodeDecodeError) as e:
+            messagebox.showerror("Ошибка", f"Не удалось прочитать файл: {str(e)}")
+            return
+        self.start_job(self.file_job, self.file_job_progress, self.file_job_status_var,
+                       lambda job: f"Сконвертировано строк: {job.count}, без результата: {job.skipped}")
     
+    def build_report(self):
+        """Отчет по истории за периоды в выбранной валюте"""
+        if self.report_job is not None and not self.report_job.finished:
+            messagebox.showerror("Ошибка", "Отчет уже строится")
+            return
+        
+        try:
+            filters = self.export_filters()
+        except ValueError:
+            messagebox.showerror("Ошибка", "Введите даты в формате ГГГГ-ММ-ДД")
+            return
+        currency = code_from_text(self.report_currency.get())
+        if not currency:
+            messagebox.showerror("Ошибка", "Выберите валюту отчета")
+            return
+        
+        path = filedialog.asksaveasfilename(
+            defaultextension=".csv",
+            initialfile=f"report_{currency}.csv",
+            filetypes=[("CSV", "*.csv")]
+        )
+        if not path:
+            return
+        
+        period = self.REPORT_PERIODS[self.report_period.get()]
+        self.report_job = self.job_pool.history_report(
+            self.history, path, self.rate_cache.snapshot(), currency, period, **filters
+        )
+        self.start_job(self.report_job, self.report_progress, self.report_status_var,
+                       lambda job: f"Операций в отчете: {job.count}")
+    
+    def start_job(self, job, progress, status_var, summary, failure="Задание завершилось с ошибкой"):
+        """Отслеживание фонового задания индикатором и строкой состояния.
+        
+        Подходит для экспорта истории и для заданий пула процессов: у обоих
+        есть ``done``, ``total``, ``finished``, ``error``, ``path`` и ``cancel_event``.
+        """
+        progress["value"] = 0
+        status_var.set("Выполняется...")
+        self.root.after(self.JOB_POLL_MS, self.poll_job, job, progress, status_var, summary, failure)
+    
+    def poll_job(self, job, progress, status_var, summary, failure):
+        """Опрос задания до завершения и вывод итога"""
+        if job.total:
+            progress["value"] = 100 * job.done / job.total
+        if not job.finished:
+            self.root.after(self.JOB_POLL_MS, self.poll_job, job, progress, status_var, summary, failure)
+            return
+        
+        # Отмененное задание завершается своей ошибкой отмены
+        if job.error is not None and job.cancel_event.is_set():
+            status_var.set("Отменено")
+        elif job.error is not None:
+            status_var.set("")
+            messagebox.showerror("Ошибка", f"{failure}: {str(job.error)}")
+        else:
+            progress["value"] = 100
+            status_var.set(summary(job))
+            messagebox.showinfo("Успех", f"Результат записан в {job.path}")
+    
+    def cancel_job(self, job):
+        """Отмена задания пула процессов"""
+        if job is not None and not job.finished:
+            job.cancel()
+    
+    def create_chart_figure(self):
+        """График: одна линия, данные которой обновляются на месте"""
+        import matplotlib.pyplot as plt
+        
+        self.fig, self.ax = plt.subplots(figsize=(8, 4))
+        self.ax.set_xlabel("Дата")
+        self.ax.set_ylabel("Курс")
+        self.ax.grid(True)
+        self.ax.xaxis_date()
+        self.chart_line, = self.ax.plot([], [], 'b-', animated=True)
+        self.chart_empty_text = self.ax.text(
+            0.5, 0.5, "Нет данных за период", ha="center", va="center",
+            transform=self.ax.transAxes, visible=False
+        )
+        self.fig.autofmt_xdate()
+    
+    @METRICS.timed("gg_chart_update_seconds")
     def update_chart(self, days):
         """Обновление графика курса"""
-        currency = self.chart_currency.get()
+        import numpy as np
+        from timeseries import downsample
+        
+        currency = code_from_text(self.chart_currency.get())
         if not currency:
             return
+        quote = code_from_text(self.chart_quote.get())
         
         try:
-            # Здесь должна быть логика получения реальных данных
-            # Для примера используем фиктивные данные
-            dates = [datetime.now() - timedelta(days=x) for x in range(days, 0, -1)]
-            values = [100 + x**0.5 + x*0.1 for x in range(days)]
-            
-            self.ax.clear()
-            self.ax.plot(dates, values, 'b-')
-            self.ax.set_title(f"Курс {currency} за последние {days} дней")
-            self.ax.set_xlabel("Дата")
-            self.ax.set_ylabel("Курс")
-            self.ax.grid(True)
+            # Котировки из локального хранилища, прореженные до ширины графика
+            start = time.time() - days * 24 * 60 * 60
+            timestamps, values = self.timeseries.query_pair(currency, quote, start)
+            timestamps, values = downsample(timestamps, values, self.chart_width())
+            self.chart_days = days
+            self.chart_times = np.asarray(timestamps)
+            self.chart_values = np.asarray(values)
             
-            # Форматирование дат
-            self.fig.autofmt_xdate()
+            self.ax.set_title(f"Курс {currency} в {quote} за последние {days} дней")
+            self.chart_empty_text.set_visible(not len(values))
+            self.set_chart_data()
+            self.rescale_chart(force=True)
             
-            self.canvas.draw()
+            # Полная перерисовка без блокировки: Tk выполнит ее в свободный момент
+            self.canvas.draw_idle()
         except Exception as e:
             messagebox.showerror("Ошибка", f"Не удалось обновить график: {str(e)}")
     
+    def chart_width(self):
+        """Ширина графика в пикселях"""
+        return int(self.fig.get_figwidth() * self.fig.dpi)
+    
+    def set_chart_data(self):
+        """Передача текущего ряда в линию графика"""
+        dates = (self.chart_times * 1000).astype("datetime64[ms]")
+        self.chart_line.set_data(dates, self.chart_values)
+    
+    def rescale_chart(self, force=False):
+        """Подгонка осей под данные; True, если границы изменились.
+        
+        Без ``force`` оси меняются, только когда данные вышли за их пределы,
+        причем справа оставляется запас под следующие котировки.
+        """
+        import matplotlib.dates as mdates
+        
+        if len(self.chart_values) < 2:
+            return False
+        xmin, xmax = mdates.date2num((self.chart_times[[0, -1]] * 1000).astype("datetime64[ms]"))
+        ymin, ymax = float(self.chart_values.min()), float(self.chart_values.max())
+        (left, right), (bottom, top) = self.ax.get_xlim(), self.ax.get_ylim()
+        if not force and left <= xmin and xmax <= right and bottom <= ymin and ymax <= top:
+            return False
+        xpad = (xmax - xmin) * 0.05 or 1 / 24
+        ypad = (ymax - ymin) * 0.1 or abs(ymax) * 0.01 or 1
+        self.ax.set_xlim(xmin, xmax + xpad)
+        self.ax.set_ylim(ymin - ypad, ymax + ypad)
+        return True
+    
+    def on_chart_draw(self, event):
+        """Запоминание фона после полной перерисовки и вывод линии поверх"""
+        self.chart_background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self.ax.draw_artist(self.chart_line)
+        self.canvas.blit(self.fig.bbox)
+    
+    @METRICS.timed("gg_chart_blit_seconds")
+    def blit_chart(self):
+        """Перерисовка только линии поверх сохраненного фона"""
+        if self.chart_background is None:
+            self.canvas.draw_idle()
+            return
+        self.canvas.restore_region(self.chart_background)
+        self.ax.draw_artist(self.chart_line)
+        self.canvas.blit(self.ax.bbox)
+    
+    def toggle_live_chart(self):
+        """Включение онлайн-режима: сначала дорисовываются котировки, пришедшие без него"""
+        import numpy as np
+        
+        # Ряда нет, пока update_chart не выполнился успешно
+        if not self.chart_live.get() or self.chart_times is None:
+            return
+        currency = code_from_text(self.chart_currency.get())
+        quote = code_from_text(self.chart_quote.get())
+        last = self.chart_times[-1] if len(self.chart_times) else time.time() - self.chart_days * 24 * 60 * 60
+        self.extend_chart(*self.timeseries.query_pair(currency, quote, np.nextafter(last, np.inf)))
+    
+    def push_live_chart(self, timestamp):
+        """Новая точка онлайн-графика по только что полученным котировкам, без чтения с диска"""
+        import numpy as np
+        
+        if not hasattr(self, "chart_live") or not self.chart_live.get() or self.chart_times is None:
+            return
+        currency = code_from_text(self.chart_currency.get())
+        quote = code_from_text(self.chart_quote.get())
+        rate = 1.0 if currency == quote else self.rate_cache.snapshot().rate(currency, quote)
+        if rate is None or (len(self.chart_times) and timestamp <= self.chart_times[-1]):
+            return
+        self.extend_chart(np.array([timestamp]), np.array([rate]))
+    
+    def extend_chart(self, timestamps, values):
+        """Дорисовка новых котировок без перестройки графика"""
+        import numpy as np
+        from timeseries import downsample
+        
+        if not len(timestamps):
+            return
+        start = time.time() - self.chart_days * 24 * 60 * 60
+        times = np.concatenate([self.chart_times, timestamps])
+        values = np.concatenate([self.chart_values, values])
+        keep = times >= start
+        times, values = times[keep], values[keep]
+        width = self.chart_width()
+        if len(times) > 4 * width:
+            times, values = downsample(times, values, width)
+        self.chart_times, self.chart_values = times, values
+        
+        self.chart_empty_text.set_visible(False)
+        self.set_chart_data()
+        if self.rescale_chart() or self.chart_background is None:
+            # Изменились оси — нужен полный кадр, фон обновится в on_chart_draw
+            self.canvas.draw_idle()
+        else:
+            self.blit_chart()
+    
     def save_fiat_api_key(self):
         """Сохранение API ключа для валют"""
-        self.fiat_api_key = self.fiat_api_entry.get()
+        fiat_api_key = self.fiat_api_entry.get()
+        try:
+            provider = make_providers(fiat_api_key=fiat_api_key, merge=self.merge_mode)[FIAT]
+        except ValueError as e:
+            messagebox.showerror("Ошибка", str(e))
+            return
+        self.fiat_api_key = fiat_api_key
+        self.quote_store.set_setting("fiat_api_key", self.fiat_api_key or None)
+        self.rate_cache.set_provider(FIAT, provider)
+        self.rate_cache.refresh_async(FIAT)
         messagebox.showinfo("Успех", "API ключ для валют сохранен")
     
     def save_crypto_api_key(self):
         """Сохранение API ключа для криптовалют"""
-        self.crypto_api_key = self.crypto_api_entry.get()
+        crypto_api_key = self.crypto_api_entry.get()
+        try:
+            provider = make_providers(crypto_api_key=crypto_api_key, merge=self.merge_mode)[CRYPTO]
+        except ValueError as e:
+            messagebox.showerror("Ошибка", str(e))
+            return
+        self.crypto_api_key = crypto_api_key
+        self.quote_store.set_setting("crypto_api_key", self.crypto_api_key or None)
+        self.rate_cache.set_provider(CRYPTO, provider)
+        self.rate_cache.refresh_async(CRYPTO)
         messagebox.showinfo("Успех", "API ключ для криптовалют сохранен")
     
+    def save_merge_mode(self, event=None):
+        """Смена способа объединения котировок нескольких поставщиков"""
+        self.merge_mode = self.MERGE_MODES[self.merge_mode_combo.get()]
+        self.quote_store.set_setting("merge_mode", self.merge_mode)
+        # Поставщики не пересоздаются, чтобы сохранить накопленные задержки
+        for provider in self.rate_cache.providers.values():
+            if isinstance(provider, AggregateProvider):
+                provider.merge = self.merge_mode
+    
+    def refresh_interval(self, source):
+        """Период фонового обновления источника в секундах из настроек"""
+        try:
+            return float(self.quote_store.get_setting(f"refresh_interval_{source}")) * 60
+        except (TypeError, ValueError):
+            return DEFAULT_REFRESH_INTERVAL[source]
+    
+    def save_refresh_intervals(self):
+        """Сохранение периодов фонового обновления котировок"""
+        entries = {FIAT: self.fiat_interval_entry, CRYPTO: self.crypto_interval_entry}
+        try:
+            minutes = {source: float(entry.get().replace(",", ".")) for source, entry in entries.items()}
+        except ValueError:
+            minutes = None
+        if minutes is None or min(minutes.values()) <= 0:
+            messagebox.showerror("Ошибка", "Введите период обновления в минутах больше нуля")
+            return
+        for source, value in minutes.items():
+            self.quote_store.set_setting(f"refresh_interval_{source}", f"{value:g}")
+            self.scheduler.set_interval(source, value * 60)
+        messagebox.showinfo("Успех", "Периоды обновления сохранены")
+    
     def save_email_settings(self):
         """Сохранение настроек почты"""
         self.email_settings = {
             "smtp": self.smtp_entry.get(),
             "port": int(self.port_entry.get()),
             "email": self.email_setting_entry.get(),
-            "password": self.password_entry.get()
+            "password": self.password_entry.get(),
+            "starttls": self.starttls_var.get()
         }
+        self.mailer.update_settings(self.email_settings)
         messagebox.showinfo("Успех", "Настройки почты сохранены")
     
+    def add_alert(self):
+        """Добавление правила уведомления о курсе"""
+        pair = (code_from_text(self.alert_from.get()), code_from_text(self.alert_to.get()))
+        email = self.alert_email_entry.get().strip()
+        if pair[0] == pair[1]:
+            messagebox.showerror("Ошибка", "Выберите разные валюты")
+            return
+        if not email:
+            messagebox.showerror("Ошибка", "Введите email для уведомлений")
+            return
+        if not self.email_settings:
+            # Без почты правило срабатывало бы впустую
+            messagebox.showerror("Ошибка", "Сначала настройте почту в разделе «Настройки почты»")
+            return
+        
+        try:
+            value = float(self.alert_value_entry.get())
+            direction = self.ALERT_CONDITIONS[self.alert_condition.get()]
+            if direction is None:
+                window = float(self.alert_window_entry.get()) * 60
+                self.alerts.add_move(pair, value, window, email)
+            else:
+                self.alerts.add_threshold(pair, value, direction, email)
+        except ValueError:
+            messagebox.showerror("Ошибка", "Введите корректные значение и окно")
+            return
+        
+        self.update_alerts_list()
+    
+    def remove_alert(self):
+        """Удаление выбранного правила уведомления"""
+        selection = self.alerts_listbox.curselection()
+        if not selection:
+            return
+        rule = self.alert_rules[selection[0]]
+        self.alerts.remove(rule.id)
+        self.update_alerts_list()
+    
+    def update_alerts_list(self):
+        """Обновление списка правил уведомлений"""
+        self.alert_rules = self.alerts.rules()
+        self.alerts_listbox.delete(0, tk.END)
+        labels = {direction: text for text, direction in self.ALERT_CONDITIONS.items()}
+        for rule in self.alert_rules:
+            pair = f"{rule.pair[0]}/{rule.pair[1]}"
+            if hasattr(rule, "threshold"):
+                text = f"{pair} {labels[rule.direction]} {rule.threshold:g}"
+            else:
+                text = f"{pair} изменение на {rule.percent:g}% за {rule.window / 60:g} мин"
+            self.alerts_listbox.insert(tk.END, f"{text} → {rule.recipient}")
+    
+    def check_alerts(self, source, rates):
+        """Проверка правил уведомлений (вызывается из фонового потока)"""
+        if len(self.alerts):
+            self.alerts.evaluate(self.rate_cache.snapshot().rate)
+    
+    def send_alert(self, alert):
+        """Отправка уведомления; частые уведомления адресату объединяются в сводку"""
+        self.mailer.send(alert.rule.recipient, "Уведомление о курсе", alert.message, digest=True, kind=ALERT)
+    
+    def on_close(self):
+        """Сохранение истории на диск и закрытие окна"""
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+        self.scheduler.stop()
+        self.mailer.stop()
+        if self._job_pool is not None:
+            self._job_pool.shutdown()
+        self.history.close()
+        self.quote_store.close()
+        self.root.destroy()
+    
     def schedule_updates(self):
         """Планирование автоматического обновления курсов"""
-        def update_task():
-            # Здесь должна быть логика обновления курсов
-            print("Обновление курсов...")
+        self.scheduler = RefreshScheduler()
         
-        # Обновляем каждые 10 минут
-        schedule.every(10).minutes.do(update_task)
+        # Каждый источник обновляется в фоне с настраиваемым периодом, не связанным с TTL;
+        # между запусками устаревшие котировки обновляются только по запросу при чтении
+        for source in (FIAT, CRYPTO):
+            interval = self.refresh_interval(source)
+            self.scheduler.add_job(
+                source,
+                lambda source=source: self.rate_cache.refresh_if_stale(source),
+                interval=interval,
+                first_delay=self.rate_cache.next_refresh_in(source, interval)
+            )
         
-        # Запускаем планировщик в отдельном потоке
-        def run_scheduler():
-            while True:
-                schedule.run_pending()
-                time.sleep(1)
+        # Список валют поставщиков загружается в фоне раз в сутки
+        self.scheduler.add_job(
+            "catalog",
+            lambda: self.catalog.refresh_if_stale(self.rate_cache.providers),
+            interval=self.catalog.ttl,
+            first_delay=self.catalog.next_refresh_in()
+        )
+        
+        # Устаревшие котировки, запрошенные при конвертации, обновляет тот же планировщик
+        self.rate_cache.refresher = self.scheduler.trigger
+        self.scheduler.start()
+        
+        self.root.after(self.UPDATES_POLL_MS, self.process_updates)
+    
+    def process_updates(self):
+        """Разбор результатов фоновых обновлений в потоке интерфейса"""
+        while True:
+            try:
+                result = self.scheduler.results.get_nowait()
+            except queue.Empty:
+                break
+            
+            # Пустой результат — котировки еще свежие и запрос не выполнялся
+            if result.name in (FIAT, CRYPTO) and (result.value is not None or result.error is not None):
+                when = datetime.fromtimestamp(result.finished_at).strftime("%H:%M:%S")
+                if result.error is None:
+                    self.rates_status_var.set(f"Курсы обновлены в {when}")
+                    # Показанный результат и онлайн-график обновляются по новым котировкам
+                    self.schedule_live_convert()
+                    self.push_live_chart(result.finished_at)
+                else:
+                    self.rates_status_var.set(f"Ошибка обновления курсов ({when}): {result.error}")
+            elif result.name == "catalog" and result.value is not None:
+                # Ошибка загрузки каталога не мешает работе: остаются прежние списки
+                self.refresh_currency_values()
+        
+        while True:
+            try:
+                mail = self.mailer.results.get_nowait()
+            except queue.Empty:
+                break
+            
+            if mail.kind == ALERT:
+                # Уведомления уходят в фоне: итог пишется в строку состояния на вкладке настроек
+                when = datetime.now().strftime("%H:%M:%S")
+                if mail.error is None:
+                    self.alert_status_var.set(f"Уведомление отправлено на {mail.to} в {when}")
+                else:
+                    self.alert_status_var.set(f"Уведомление для {mail.to} не отправлено ({when}): {mail.error}")
+            elif mail.error is None:
+                self.email_status_var.set(f"Результат отправлен на {mail.to}")
+            else:
+                self.email_status_var.set("")
+                messagebox.showerror("Ошибка", f"Не удалось отправить email на {mail.to}: {str(mail.error)}")
         
-        thread = threading.Thread(target=run_scheduler, daemon=True)
-        thread.start()
+        self.root.after(self.UPDATES_POLL_MS, self.process_updates)
 
 if __name__ == "__main__":
+    # Отчет о времени запуска: python gg.py --startup-report
+    startup_report = "--startup-report" in sys.argv or bool(os.environ.get("GG_STARTUP_REPORT"))
     root = tk.Tk()
-    app = CurrencyConverterApp(root)
+    app = CurrencyConverterApp(root, startup_report=startup_report)
     root.mainloop()
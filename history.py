@@ -0,0 +1,289 @@
+"""Компактное хранилище истории операций.
+
+Операции хранятся по столбцам в ``array``: время в секундах эпохи,
+суммы и курсы как float, коды валют как индексы в таблице интернированных
+строк. Каждая операция дописывается в конец файла SQLite пачками
+по ``batch_size`` записей (и при ``flush``), так что при аварийном
+завершении теряется не больше одной пачки. В памяти держатся последние
+``memory_limit`` записей как кэш для чтения, более старые читаются
+из файла по требованию, поэтому объем памяти не растет со временем.
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+from array import array
+from datetime import datetime
+
+# Записей в кэше памяти по умолчанию
+DEFAULT_MEMORY_LIMIT = 10000
+# Новых записей, после которых они пишутся на диск без ожидания flush
+DEFAULT_BATCH_SIZE = 64
+
+
+class Operation:
+    """Одна операция конвертации"""
+
+    __slots__ = ("timestamp", "amount", "from_curr", "to_curr", "result", "rate")
+
+    def __init__(self, timestamp, amount, from_curr, to_curr, result, rate):
+        self.timestamp = timestamp
+        self.amount = amount
+        self.from_curr = from_curr
+        self.to_curr = to_curr
+        self.result = result
+        self.rate = rate
+
+    @property
+    def date(self):
+        return datetime.fromtimestamp(self.timestamp)
+
+    def to_dict(self):
+        """Представление для экспорта: числа без округления, дата в ISO 8601"""
+        return {
+            "date": self.date.isoformat(timespec="seconds"),
+            "amount": self.amount,
+            "from": self.from_curr,
+            "to": self.to_curr,
+            "result": self.result,
+            "rate": self.rate,
+        }
+
+    def __repr__(self):
+        return (
+            f"Operation({self.timestamp!r}, {self.amount!r}, {self.from_curr!r}, "
+            f"{self.to_curr!r}, {self.result!r}, {self.rate!r})"
+        )
+
+
+class HistoryStore:
+    """Столбцовое хранилище истории с ограничением памяти и сбросом в SQLite.
+
+    Индексы записей сквозные: 0 — самая старая операция. Записи с индексом
+    меньше ``disk_count`` уже записаны в файл, записи начиная с
+    ``cache_start`` есть в памяти; ``pending`` записей ждут записи на диск.
+    """
+
+    def __init__(self, path=None, memory_limit=DEFAULT_MEMORY_LIMIT, batch_size=DEFAULT_BATCH_SIZE):
+        self.memory_limit = max(1, memory_limit)
+        self.batch_size = max(1, batch_size)
+        self._temporary = path is None
+        if path is None:
+            fd, path = tempfile.mkstemp(prefix="history-", suffix=".sqlite3")
+            os.close(fd)
+        self.path = path
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS history ("
+            "id INTEGER PRIMARY KEY, timestamp REAL, amount REAL, "
+            "from_curr TEXT, to_curr TEXT, result REAL, rate REAL)"
+        )
+        self._db.commit()
+        (self.disk_count,) = self._db.execute(
+            "SELECT COALESCE(MAX(id) + 1, 0) FROM history"
+        ).fetchone()
+        self.cache_start = self.disk_count
+
+        self._codes = []
+        self._code_index = {}
+        self._timestamps = array("d")
+        self._amounts = array("d")
+        self._from = array("H")
+        self._to = array("H")
+        self._results = array("d")
+        self._rates = array("d")
+
+    def _code_id(self, code):
+        index = self._code_index.get(code)
+        if index is None:
+            index = len(self._codes)
+            self._codes.append(sys.intern(code))
+            self._code_index[code] = index
+        return index
+
+    def _intern(self, code):
+        return self._codes[self._code_id(code)]
+
+    def __len__(self):
+        return self.cache_start + len(self._timestamps)
+
+    @property
+    def pending(self):
+        """Число операций, еще не записанных на диск"""
+        return len(self) - self.disk_count
+
+    def append(self, timestamp, amount, from_curr, to_curr, result, rate):
+        """Добавление операции в конец истории"""
+        with self._lock:
+            self._timestamps.append(timestamp)
+            self._amounts.append(amount)
+            self._from.append(self._code_id(from_curr))
+            self._to.append(self._code_id(to_curr))
+            self._results.append(result)
+            self._rates.append(rate)
+            record = self._memory_record(len(self._timestamps) - 1)
+            if self.pending >= self.batch_size:
+                self._write()
+            if len(self._timestamps) > self.memory_limit:
+                # Из кэша убирается старшая половина, чтобы не сдвигать массивы на каждом добавлении
+                self._write()
+                self._evict(len(self._timestamps) - self.memory_limit // 2)
+            return record
+
+    def _memory_record(self, i):
+        return Operation(
+            self._timestamps[i],
+            self._amounts[i],
+            self._codes[self._from[i]],
+            self._codes[self._to[i]],
+            self._results[i],
+            self._rates[i],
+        )
+
+    def _write(self):
+        """Запись на диск операций, добавленных после последней записи"""
+        if not self.pending:
+            return
+        rows = [
+            (index,) + self._row(index - self.cache_start)
+            for index in range(self.disk_count, len(self))
+        ]
+        self._db.executemany("INSERT INTO history VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        self._db.commit()
+        self.disk_count = len(self)
+
+    def _evict(self, count):
+        # Убираются только уже записанные операции
+        count = min(count, self.disk_count - self.cache_start)
+        self.cache_start += count
+        for column in (self._timestamps, self._amounts, self._from, self._to, self._results, self._rates):
+            del column[:count]
+
+    def _row(self, i):
+        return (
+            self._timestamps[i],
+            self._amounts[i],
+            self._codes[self._from[i]],
+            self._codes[self._to[i]],
+            self._results[i],
+            self._rates[i],
+        )
+
+    def flush(self):
+        """Запись на диск всех ожидающих операций"""
+        with self._lock:
+            self._write()
+
+    def slice(self, start, stop):
+        """Операции с индексами [start, stop) в порядке от старых к новым"""
+        with self._lock:
+            start = max(0, start)
+            stop = min(len(self), stop)
+            records = []
+            if start < min(stop, self.cache_start):
+                cursor = self._db.execute(
+                    "SELECT timestamp, amount, from_curr, to_curr, result, rate "
+                    "FROM history WHERE id >= ? AND id < ? ORDER BY id",
+                    (start, min(stop, self.cache_start)),
+                )
+                for timestamp, amount, from_curr, to_curr, result, rate in cursor:
+                    records.append(Operation(
+                        timestamp, amount, self._intern(from_curr), self._intern(to_curr), result, rate
+                    ))
+            for i in range(max(start, self.cache_start), stop):
+                records.append(self._memory_record(i - self.cache_start))
+            return records
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("history index out of range")
+        return self.slice(index, index + 1)[0]
+
+    def iter_chunks(self, chunk_size=10000, start_time=None, end_time=None, currencies=None):
+        """Последовательный обход истории частями с необязательным фильтром.
+
+        ``start_time``/``end_time`` ограничивают время операции в секундах
+        эпохи (конец не включается), ``currencies`` оставляет операции,
+        у которых исходная или целевая валюта входит в набор.
+        """
+        for _, _, chunk in self.scan(chunk_size, start_time, end_time, currencies):
+            if chunk:
+                yield chunk
+
+    def scan(self, chunk_size=10000, start_time=None, end_time=None, currencies=None):
+        """То же, что ``iter_chunks``, но с позицией: ``(просмотрено, всего, часть)``.
+
+        Часть может быть пустой, если фильтр отбросил весь диапазон.
+        """
+        filtered = start_time is not None or end_time is not None or currencies
+        # Операции, добавленные во время обхода, в него не попадают
+        total = len(self)
+        start = 0
+        while start < total:
+            stop = min(start + chunk_size, total)
+            if filtered:
+                chunk = self._select(start, stop, start_time, end_time, currencies)
+            else:
+                chunk = self.slice(start, stop)
+            start = stop
+            yield stop, total, chunk
+
+    def _select(self, start, stop, start_time, end_time, currencies):
+        """Отфильтрованные операции из диапазона индексов [start, stop)"""
+        lo = float("-inf") if start_time is None else start_time
+        hi = float("inf") if end_time is None else end_time
+        currencies = set(currencies) if currencies else None
+        with self._lock:
+            records = []
+            disk_stop = min(stop, self.cache_start)
+            if start < disk_stop:
+                query = (
+                    "SELECT timestamp, amount, from_curr, to_curr, result, rate "
+                    "FROM history WHERE id >= ? AND id < ? AND timestamp >= ? AND timestamp < ?"
+                )
+                params = [start, disk_stop, lo, hi]
+                if currencies:
+                    marks = ", ".join("?" * len(currencies))
+                    query += f" AND (from_curr IN ({marks}) OR to_curr IN ({marks}))"
+                    params += list(currencies) * 2
+                for timestamp, amount, from_curr, to_curr, result, rate in self._db.execute(query + " ORDER BY id", params):
+                    records.append(Operation(
+                        timestamp, amount, self._intern(from_curr), self._intern(to_curr), result, rate
+                    ))
+            codes = None
+            if currencies:
+                codes = {self._code_index[c] for c in currencies if c in self._code_index}
+            for i in range(max(start, self.cache_start) - self.cache_start, min(stop, len(self)) - self.cache_start):
+                if not lo <= self._timestamps[i] < hi:
+                    continue
+                if codes is not None and self._from[i] not in codes and self._to[i] not in codes:
+                    continue
+                records.append(self._memory_record(i))
+            return records
+
+    def __iter__(self):
+        for chunk in self.iter_chunks():
+            yield from chunk
+
+    def clear(self):
+        """Удаление всей истории, в том числе с диска"""
+        with self._lock:
+            self._db.execute("DELETE FROM history")
+            self._db.commit()
+            self.disk_count = self.cache_start = 0
+            for column in (self._timestamps, self._amounts, self._from, self._to, self._results, self._rates):
+                del column[:]
+
+    def close(self):
+        """Сброс операций на диск и закрытие файла"""
+        with self._lock:
+            if self._temporary:
+                self._db.close()
+                os.remove(self.path)
+            else:
+                self.flush()
+                self._db.close()
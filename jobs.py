@@ -0,0 +1,441 @@
+"""Тяжелые задания в пуле процессов.
+
+Конвертация больших файлов и отчеты по истории делятся на части и
+выполняются в ``ProcessPoolExecutor``, поэтому окно не замирает,
+а работа распределяется по всем ядрам.
+
+Таблица кросс-курсов передается исполнителям через
+``multiprocessing.shared_memory``: вектор курсов и плотная матрица
+копируются в общий сегмент один раз на задание, а процессы строят
+``RateMatrix`` прямо поверх него, без копирования и пересчета. Там же
+лежат счетчики прогресса частей и флаг отмены: исполнители обновляют
+свои счетчики и проверяют флаг после каждых ``CHECK_EVERY`` строк.
+
+Каждое задание ведет поток-координатор, как ``export.ExportJob``: поля
+``done``, ``total``, ``count`` и ``error`` читаются из потока интерфейса
+периодическим опросом.
+
+Файл делится на части по байтам с выравниванием на начало строки,
+поэтому в CSV не поддерживаются значения с переводом строки внутри
+кавычек; для таких файлов подходит обычная ``converter.convert_csv``.
+"""
+import csv
+import math
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import threading
+from collections import namedtuple
+from concurrent.futures import FIRST_EXCEPTION, ProcessPoolExecutor, wait
+from datetime import datetime
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from converter import FileStats, convert_csv, convert_jsonl, convert_many, detect_format
+from money import format_amount
+from ratematrix import RateMatrix
+
+# Наименьшая часть файла для одного исполнителя, байт
+MIN_TASK_BYTES = 4 * 1024 * 1024
+# Наименьшая часть истории для одного исполнителя, операций
+MIN_TASK_ROWS = 100000
+# Частей на процесс: мелкие части выравнивают нагрузку и сглаживают прогресс
+TASKS_PER_WORKER = 4
+# Строк между обновлениями прогресса и проверками отмены
+CHECK_EVERY = 4096
+# Период опроса частей потоком-координатором, с
+POLL_INTERVAL = 0.1
+
+# Периоды отчета: подпись -> формат метки периода
+PERIODS = {
+    "day": "%Y-%m-%d",
+    "week": "%G-W%V",
+    "month": "%Y-%m",
+}
+REPORT_FIELDS = ["period", "operations", "total", "currency", "unconverted"]
+
+SnapshotHandle = namedtuple("SnapshotHandle", ["name", "codes", "base", "version", "dense"])
+CountersHandle = namedtuple("CountersHandle", ["name", "size"])
+
+
+class JobCancelled(Exception):
+    """Задание прервано пользователем"""
+
+
+class SharedSnapshot:
+    """Таблица кросс-курсов в разделяемой памяти: вектор, затем матрица"""
+
+    def __init__(self, snapshot):
+        n = len(snapshot.codes)
+        dense = snapshot.matrix is not None
+        size = n + (n * n if dense else 0)
+        self.shm = SharedMemory(create=True, size=max(1, size) * 8)
+        data = np.ndarray(size, dtype=np.float64, buffer=self.shm.buf)
+        data[:n] = snapshot.vector
+        if dense:
+            data[n:] = snapshot.matrix.ravel()
+        del data
+        self.handle = SnapshotHandle(self.shm.name, list(snapshot.codes), snapshot.base, snapshot.version, dense)
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+class SharedCounters:
+    """Счетчики int64 в разделяемой памяти; ячейка 0 — флаг отмены"""
+
+    def __init__(self, size):
+        self.shm = SharedMemory(create=True, size=(size + 1) * 8)
+        self.values = np.ndarray(size + 1, dtype=np.int64, buffer=self.shm.buf)
+        self.values[:] = 0
+        self.handle = CountersHandle(self.shm.name, size)
+
+    def cancel(self):
+        self.values[0] = 1
+
+    def done(self):
+        return int(self.values[1:].sum())
+
+    def close(self):
+        del self.values
+        self.shm.close()
+        self.shm.unlink()
+
+
+# В процессе-исполнителе: имя сегмента -> (SharedMemory, RateMatrix).
+# Хранится только последний снимок, прежний отключается при смене
+_attached = {}
+
+
+def attach_snapshot(handle):
+    """``RateMatrix`` поверх разделяемой памяти; повторные части берут ее из кэша"""
+    cached = _attached.get(handle.name)
+    if cached is None:
+        while _attached:
+            shm = _attached.popitem()[1][0]
+            try:
+                shm.close()
+            except BufferError:
+                # На память еще ссылаются массивы; сегмент закроется при выходе процесса
+                pass
+        shm = SharedMemory(name=handle.name)
+        n = len(handle.codes)
+        data = np.ndarray(n + (n * n if handle.dense else 0), dtype=np.float64, buffer=shm.buf)
+        matrix = data[n:].reshape(n, n) if handle.dense else None
+        snapshot = RateMatrix(handle.codes, data[:n], base=handle.base, version=handle.version, matrix=matrix)
+        cached = _attached[handle.name] = (shm, snapshot)
+    return cached[1]
+
+
+class _Counters:
+    """Счетчики задания в процессе-исполнителе"""
+
+    def __init__(self, handle, slot):
+        self.shm = SharedMemory(name=handle.name)
+        self.values = np.ndarray(handle.size + 1, dtype=np.int64, buffer=self.shm.buf)
+        self.slot = slot
+
+    def update(self, done):
+        self.values[self.slot] = done
+        if self.values[0]:
+            raise JobCancelled()
+
+    def close(self):
+        del self.values
+        self.shm.close()
+
+
+def _read_lines(f, start, end, counters):
+    """Строки, начинающиеся в диапазоне байтов [start, end)"""
+    if start > 0:
+        # Строку, начатую до start, дочитывает предыдущая часть
+        f.seek(start - 1)
+        f.readline()
+    else:
+        f.seek(0)
+    position = f.tell()
+    read = 0
+    while position < end:
+        line = f.readline()
+        if not line:
+            break
+        position += len(line)
+        read += 1
+        if read % CHECK_EVERY == 0:
+            counters.update(position - start)
+        yield line.decode("utf-8")
+    counters.update(end - start)
+
+
+def _convert_part(path, start, end, header, part_path, fmt, columns, exact, snapshot_handle, counters_handle, slot):
+    snapshot = attach_snapshot(snapshot_handle)
+    counters = _Counters(counters_handle, slot)
+    try:
+        with open(path, "rb") as src, open(part_path, "w", newline="", encoding="utf-8") as dst:
+            lines = _read_lines(src, start, end, counters)
+            if fmt == "jsonl":
+                return convert_jsonl(lines, dst, snapshot, columns=columns, exact=exact)
+            # Каждая часть получает заголовок; при склейке лишние заголовки отбрасываются
+            return convert_csv(_prepend(header, lines), dst, snapshot, columns=columns, exact=exact)
+    finally:
+        counters.close()
+
+
+def _prepend(first, lines):
+    if first:
+        yield first
+    yield from lines
+
+
+def period_labels(timestamps, period):
+    """Метки периодов (по местному времени) для массива времен операций"""
+    fmt = PERIODS[period]
+    # Местное время считается один раз на 15-минутный интервал: этого хватает
+    # для любых часовых поясов, а интервалов намного меньше, чем операций
+    slots = np.floor_divide(np.asarray(timestamps, dtype=np.float64), 900).astype(np.int64)
+    unique, inverse = np.unique(slots, return_inverse=True)
+    labels = np.array([datetime.fromtimestamp(slot * 900).strftime(fmt) for slot in unique.tolist()])
+    return labels[inverse]
+
+
+def _report_part(db_path, start, stop, filters, currency, period, snapshot_handle, counters_handle, slot):
+    snapshot = attach_snapshot(snapshot_handle)
+    counters = _Counters(counters_handle, slot)
+    query = "SELECT id, timestamp, amount, from_curr FROM history WHERE id >= ? AND id < ?"
+    params = [start, stop]
+    if filters.get("start_time") is not None:
+        query += " AND timestamp >= ?"
+        params.append(filters["start_time"])
+    if filters.get("end_time") is not None:
+        query += " AND timestamp < ?"
+        params.append(filters["end_time"])
+    currencies = filters.get("currencies")
+    if currencies:
+        marks = ", ".join("?" * len(currencies))
+        query += f" AND (from_curr IN ({marks}) OR to_curr IN ({marks}))"
+        params += list(currencies) * 2
+
+    totals = {}
+    db = sqlite3.connect(db_path)
+    try:
+        cursor = db.execute(query + " ORDER BY id", params)
+        while True:
+            rows = cursor.fetchmany(CHECK_EVERY * 16)
+            if not rows:
+                break
+            ids, timestamps, amounts, from_codes = zip(*rows)
+            values, _ = convert_many(np.array(amounts, dtype=np.float64), from_codes,
+                                     [currency] * len(rows), snapshot)
+            missing = np.isnan(values)
+            labels, inverse = np.unique(period_labels(timestamps, period), return_inverse=True)
+            counts = np.bincount(inverse, minlength=len(labels))
+            sums = np.bincount(inverse, weights=np.where(missing, 0.0, values), minlength=len(labels))
+            unconverted = np.bincount(inverse, weights=missing, minlength=len(labels))
+            for label, count, total, lost in zip(labels.tolist(), counts.tolist(), sums.tolist(), unconverted.tolist()):
+                entry = totals.setdefault(label, [0, 0.0, 0])
+                entry[0] += count
+                entry[1] += total
+                entry[2] += int(lost)
+            # Прогресс считается по просмотренным id, а не по прошедшим фильтр
+            counters.update(ids[-1] + 1 - start)
+        counters.update(stop - start)
+    finally:
+        db.close()
+        counters.close()
+    return totals
+
+
+class Job:
+    """Задание из частей, выполняемых в пуле процессов.
+
+    ``tasks`` — список ``(функция, аргументы)``; аргументы дополняются
+    описателями снимка и счетчиков и номером ячейки прогресса.
+    ``finish(results)`` вызывается в потоке-координаторе со списком
+    результатов частей в исходном порядке, ``cleanup()`` — всегда.
+    """
+
+    def __init__(self, pool, snapshot, tasks, total, finish, cleanup=None):
+        self.pool = pool
+        self.snapshot = snapshot
+        self.tasks = tasks
+        self.done = 0
+        self.total = total
+        self.count = None
+        self.result = None
+        self.error = None
+        self._finish = finish
+        self._cleanup = cleanup
+        self.cancel_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def wait(self, timeout=None):
+        """Ожидание завершения; ошибка задания пробрасывается"""
+        self.thread.join(timeout)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    @property
+    def finished(self):
+        return not self.thread.is_alive()
+
+    def _run(self):
+        shared = counters = None
+        futures = []
+        try:
+            shared = SharedSnapshot(self.snapshot)
+            counters = SharedCounters(len(self.tasks))
+            executor = self.pool.executor
+            for slot, (func, args) in enumerate(self.tasks, start=1):
+                futures.append(executor.submit(func, *args, shared.handle, counters.handle, slot))
+            pending = set(futures)
+            while pending:
+                finished, pending = wait(pending, timeout=POLL_INTERVAL, return_when=FIRST_EXCEPTION)
+                self.done = min(counters.done(), self.total)
+                failed = [future for future in finished if future.exception() is not None]
+                if failed or self.cancel_event.is_set():
+                    counters.cancel()
+                    for future in pending:
+                        future.cancel()
+                    # Запущенные части увидят флаг отмены в пределах CHECK_EVERY строк
+                    wait(pending)
+                    if failed:
+                        raise failed[0].exception()
+                    raise JobCancelled()
+            self.result = self._finish([future.result() for future in futures])
+            self.done = self.total
+        except Exception as e:
+            self.error = e
+        finally:
+            if counters is not None:
+                counters.close()
+            if shared is not None:
+                shared.close()
+            if self._cleanup is not None:
+                self._cleanup()
+
+
+class JobPool:
+    """Пул процессов для тяжелых заданий; процессы создаются при первом задании"""
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                # Не fork: копия процесса с Tk и потоками может зависнуть
+                self._executor = ProcessPoolExecutor(
+                    self.max_workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def _split(self, total, minimum):
+        """Границы частей для ``total`` единиц работы"""
+        size = max(minimum, math.ceil(total / (self.max_workers * TASKS_PER_WORKER)))
+        bounds = list(range(0, total, size)) + [total]
+        if len(bounds) == 1:
+            bounds = [0, 0]
+        return list(zip(bounds, bounds[1:]))
+
+    def convert_file(self, src, dst, snapshot, fmt=None, columns=("amount", "from", "to"), exact=False):
+        """Параллельная конвертация CSV или JSON Lines.
+
+        ``count`` — число строк, ``skipped`` — строк без результата
+        (ошибочная сумма, нет столбца, неизвестная валюта). Результат совпадает с ``converter.convert_csv``/``convert_jsonl``.
+        """
+        if fmt is None:
+            fmt = detect_format(src)
+        header = ""
+        offset = 0
+        if fmt == "csv":
+            with open(src, "rb") as f:
+                first = f.readline()
+            header = first.decode("utf-8")
+            offset = len(first)
+        size = os.path.getsize(src) - offset
+        parts = []
+        tasks = []
+        for i, (start, end) in enumerate(self._split(size, MIN_TASK_BYTES)):
+            part_path = f"{dst}.part{i}"
+            parts.append(part_path)
+            tasks.append((_convert_part, (src, offset + start, offset + end, header, part_path, fmt, columns, exact)))
+
+        def finish(stats):
+            with open(dst, "wb") as out:
+                for i, part_path in enumerate(parts):
+                    with open(part_path, "rb") as part:
+                        if i and fmt == "csv":
+                            part.readline()
+                        shutil.copyfileobj(part, out, 1024 * 1024)
+            job.count = sum(part.rows for part in stats)
+            job.skipped = sum(part.skipped for part in stats)
+            return FileStats(job.count, job.skipped)
+
+        def cleanup():
+            for part_path in parts:
+                try:
+                    os.remove(part_path)
+                except FileNotFoundError:
+                    pass
+
+        job = Job(self, snapshot, tasks, size, finish, cleanup)
+        job.path = dst
+        job.skipped = None
+        return job.start()
+
+    def history_report(self, history, path, snapshot, currency, period="month", **filters):
+        """Отчет по периодам: число операций и их сумма в ``currency`` по текущим курсам.
+
+        ``filters`` — как у ``export.export_history``. Операции без курса
+        до ``currency`` учитываются в столбце ``unconverted``.
+        """
+        if period not in PERIODS:
+            raise ValueError(f"Неизвестный период отчета: {period}")
+        # Исполнители читают историю из файла, поэтому операции из памяти сбрасываются на диск
+        history.flush()
+        total = len(history)
+        tasks = [
+            (_report_part, (history.path, start, stop, filters, currency, period))
+            for start, stop in self._split(total, MIN_TASK_ROWS)
+        ]
+
+        def finish(parts):
+            totals = {}
+            for part in parts:
+                for label, (count, amount, lost) in part.items():
+                    entry = totals.setdefault(label, [0, 0.0, 0])
+                    entry[0] += count
+                    entry[1] += amount
+                    entry[2] += lost
+            with open(path, "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(REPORT_FIELDS)
+                for label in sorted(totals):
+                    count, amount, lost = totals[label]
+                    writer.writerow([label, count, format_amount(amount, currency), currency, lost])
+            job.count = sum(entry[0] for entry in totals.values())
+            return totals
+
+        job = Job(self, snapshot, tasks, total, finish)
+        job.path = path
+        return job.start()
@@ -0,0 +1,216 @@
+"""Фоновая отправка почты через одно постоянное SMTP-соединение.
+
+Письма ставятся в очередь и отправляются рабочим потоком, поэтому окно
+не ждет TLS-рукопожатия. Соединение открывается один раз, проверяется
+командой NOOP перед повторным использованием и переоткрывается при
+разрыве; после простоя оно закрывается. Неудачные отправки повторяются
+с экспоненциальной задержкой. Письма с ``digest=True`` копятся в течение
+``digest_window`` секунд и уходят одному адресату одним письмом.
+
+Для проверки без настоящего сервера подойдет локальный отладочный::
+
+    python -m aiosmtpd -n -l localhost:8025
+
+с настройками ``{"smtp": "localhost", "port": 8025, "starttls": False}``.
+"""
+import heapq
+import itertools
+import logging
+import queue
+import threading
+import time
+from collections import namedtuple
+
+from metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# Назначение письма: по нему интерфейс решает, где показать итог отправки
+RESULT = "result"
+ALERT = "alert"
+
+MailResult = namedtuple("MailResult", ["to", "subject", "error", "attempts", "kind"])
+
+
+class _Message:
+    __slots__ = ("to", "subject", "body", "attempts", "kind")
+
+    def __init__(self, to, subject, body, kind=RESULT):
+        self.to = to
+        self.subject = subject
+        self.body = body
+        self.attempts = 0
+        self.kind = kind
+
+
+class MailDispatcher:
+    """Очередь исходящих писем с рабочим потоком и повторными попытками"""
+
+    def __init__(self, settings=None, idle_timeout=300, digest_window=60,
+                 max_attempts=5, retry_delay=2.0, timeout=30):
+        self.settings = dict(settings or {})
+        self.idle_timeout = idle_timeout
+        self.digest_window = digest_window
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.timeout = timeout
+        self.results = queue.Queue()
+        self._incoming = queue.Queue()
+        self._delayed = []
+        self._digests = {}
+        self._seq = itertools.count()
+        self._server = None
+        self._last_used = 0.0
+        self._thread = None
+        self._stopping = False
+
+    def update_settings(self, settings):
+        """Новые настройки применяются к следующему соединению"""
+        self._incoming.put(("settings", dict(settings)))
+
+    def send(self, to, subject, body, digest=False, kind=RESULT):
+        """Ставит письмо в очередь и сразу возвращается; ``kind`` попадает в ``MailResult``"""
+        self.start()
+        self._incoming.put(("digest" if digest else "send", _Message(to, subject, body, kind)))
+
+    def start(self):
+        if self._thread is None:
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="mail-dispatcher", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=10):
+        """Отправка накопленных сводок и остановка потока"""
+        if self._thread is None:
+            return
+        self._incoming.put(("stop", None))
+        self._thread.join(timeout=timeout)
+        self._thread = None
+
+    def _run(self):
+        while True:
+            try:
+                kind, payload = self._incoming.get(timeout=self._wait_time())
+            except queue.Empty:
+                kind, payload = None, None
+
+            if kind == "stop":
+                self._stopping = True
+                for to in list(self._digests):
+                    self._deliver(self._flush_digest(to))
+                self._close()
+                return
+            if kind == "settings":
+                self.settings = payload
+                self._close()
+            elif kind == "send":
+                self._deliver(payload)
+            elif kind == "digest":
+                self._add_to_digest(payload)
+
+            self._process_due()
+            if self._server is not None and time.monotonic() - self._last_used >= self.idle_timeout:
+                self._close()
+
+    def _wait_time(self):
+        now = time.monotonic()
+        deadlines = [self._last_used + self.idle_timeout] if self._server is not None else []
+        if self._delayed:
+            deadlines.append(self._delayed[0][0])
+        if not deadlines:
+            return None
+        return max(0.0, min(deadlines) - now)
+
+    def _schedule(self, due, item):
+        heapq.heappush(self._delayed, (due, next(self._seq), item))
+
+    def _process_due(self):
+        now = time.monotonic()
+        while self._delayed and self._delayed[0][0] <= now:
+            _, _, item = heapq.heappop(self._delayed)
+            if isinstance(item, str):
+                # Истекло окно сводки для адресата
+                self._deliver(self._flush_digest(item))
+            else:
+                self._deliver(item)
+
+    def _add_to_digest(self, message):
+        messages = self._digests.get(message.to)
+        if messages is None:
+            messages = self._digests[message.to] = []
+            self._schedule(time.monotonic() + self.digest_window, message.to)
+        messages.append(message)
+
+    def _flush_digest(self, to):
+        messages = self._digests.pop(to)
+        if len(messages) == 1:
+            return messages[0]
+        body = "\n\n".join(f"{m.subject}\n{m.body}" for m in messages)
+        return _Message(to, f"Сводка: {len(messages)} уведомлений", body, messages[0].kind)
+
+    def _connect(self):
+        import smtplib
+
+        settings = self.settings
+        if not settings:
+            raise RuntimeError("Почта не настроена")
+        server = smtplib.SMTP(settings["smtp"], settings["port"], timeout=self.timeout)
+        try:
+            if settings.get("starttls", True):
+                server.starttls()
+            if settings.get("password"):
+                server.login(settings["email"], settings["password"])
+        except Exception:
+            server.close()
+            raise
+        return server
+
+    def _connection(self):
+        if self._server is not None:
+            try:
+                # Сервер мог закрыть простаивающее соединение
+                if self._server.noop()[0] == 250:
+                    return self._server
+            except OSError:
+                pass
+            self._close()
+        METRICS.count("gg_mail_connections_total")
+        self._server = self._connect()
+        return self._server
+
+    def _close(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except Exception:
+                self._server.close()
+            self._server = None
+
+    def _build(self, message):
+        from email.mime.multipart import MIMEMultipart
+        from email.mime.text import MIMEText
+
+        msg = MIMEMultipart()
+        msg['From'] = self.settings.get('email', '')
+        msg['To'] = message.to
+        msg['Subject'] = message.subject
+        msg.attach(MIMEText(message.body, 'plain'))
+        return msg
+
+    def _deliver(self, message):
+        message.attempts += 1
+        try:
+            with METRICS.timer("gg_mail_send_seconds"):
+                self._connection().send_message(self._build(message))
+            self._last_used = time.monotonic()
+        except Exception as e:
+            METRICS.count("gg_mail_send_errors_total")
+            self._close()
+            if self.settings and message.attempts < self.max_attempts and not self._stopping:
+                delay = self.retry_delay * 2 ** (message.attempts - 1)
+                logger.warning("Письмо для %s не отправлено, повтор через %.0f с: %s", message.to, delay, e)
+                self._schedule(time.monotonic() + delay, message)
+            else:
+                self.results.put(MailResult(message.to, message.subject, e, message.attempts, message.kind))
+            return
+        self.results.put(MailResult(message.to, message.subject, None, message.attempts, message.kind))
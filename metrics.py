@@ -0,0 +1,238 @@
+"""Счетчики и таймеры горячих путей приложения.
+
+Сбор по умолчанию выключен: обертка ``timed`` и вызов ``count`` тогда
+сводятся к проверке одного флага. Включенный реестр копит счетчики,
+гистограммы длительностей и текущие значения; их показывает вкладка
+диагностики и, по желанию, локальный HTTP-сервер в текстовом формате
+Prometheus::
+
+    curl http://127.0.0.1:9464/metrics
+"""
+import functools
+import threading
+import time
+
+# Границы корзин гистограмм длительностей, с
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+DEFAULT_PORT = 9464
+
+COUNTER = "counter"
+GAUGE = "gauge"
+HISTOGRAM = "histogram"
+
+
+class _Histogram:
+    __slots__ = ("count", "total", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * len(BUCKETS)
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.buckets[i] += 1
+                break
+
+
+class _Timer:
+    __slots__ = ("registry", "name", "labels", "started")
+
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.observe(self.name, time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Registry:
+    """Метрики, сгруппированные по имени и набору меток"""
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _get(self, kind, name, labels, factory):
+        key = (name, tuple(sorted(labels.items())))
+        metric = self._metrics.get(key)
+        if metric is None:
+            metric = self._metrics[key] = (kind, factory())
+        return metric[1]
+
+    def count(self, name, value=1, **labels):
+        """Увеличение счетчика"""
+        if not self.enabled:
+            return
+        with self._lock:
+            cell = self._get(COUNTER, name, labels, lambda: [0])
+            cell[0] += value
+
+    def set_gauge(self, name, value, **labels):
+        """Текущее значение величины"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._get(GAUGE, name, labels, lambda: [0.0])[0] = value
+
+    def observe(self, name, value, **labels):
+        """Наблюдение в гистограмму (обычно длительность в секундах)"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._get(HISTOGRAM, name, labels, _Histogram).observe(value)
+
+    def timer(self, name, **labels):
+        """Контекстный менеджер, замеряющий время блока"""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name, labels)
+
+    def timed(self, name, **labels):
+        """Декоратор, замеряющий время вызовов функции"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                started = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(name, time.perf_counter() - started, **labels)
+            return wrapper
+        return decorator
+
+    def reset(self):
+        with self._lock:
+            self._metrics.clear()
+
+    def collect(self):
+        """Список ``(name, labels, kind, value)``; для гистограмм value — копия ``_Histogram``"""
+        rows = []
+        with self._lock:
+            for (name, labels), (kind, value) in sorted(self._metrics.items()):
+                if kind == HISTOGRAM:
+                    copy = _Histogram()
+                    copy.count, copy.total, copy.max = value.count, value.total, value.max
+                    copy.buckets = list(value.buckets)
+                    value = copy
+                else:
+                    value = value[0]
+                rows.append((name, dict(labels), kind, value))
+        return rows
+
+    def render(self):
+        """Текстовый формат Prometheus"""
+        lines = []
+        declared = set()
+        for name, labels, kind, value in self.collect():
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+            if kind != HISTOGRAM:
+                lines.append(f"{name}{_labels(labels)} {value}")
+                continue
+            cumulative = 0
+            for bound, bucket in zip(BUCKETS, value.buckets):
+                cumulative += bucket
+                lines.append(f"{name}_bucket{_labels(labels, le=repr(bound))} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(labels, le='+Inf')} {value.count}")
+            lines.append(f"{name}_sum{_labels(labels)} {value.total}")
+            lines.append(f"{name}_count{_labels(labels)} {value.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels, **extra):
+    labels = {**labels, **extra}
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+# Общий реестр приложения
+METRICS = Registry()
+
+
+class MetricsServer:
+    """HTTP-сервер с метриками на локальном адресе в фоновом потоке"""
+
+    def __init__(self, registry=METRICS, host="127.0.0.1", port=DEFAULT_PORT):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._server = None
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._server is not None
+
+    def start(self):
+        """Запуск сервера; ``OSError``, если порт занят"""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        if self._server is not None:
+            return self
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        # При порте 0 система выбирает свободный
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join(timeout=5)
+        self._server = None
+        self._thread = None
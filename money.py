@@ -0,0 +1,308 @@
+"""Точная десятичная арифметика для денежных сумм.
+
+Для каждой валюты заранее посчитаны число знаков после запятой и правило
+округления (JPY — без копеек, BTC — 8 знаков). Одиночные суммы считаются
+в ``decimal.Decimal``. Для пакетной конвертации суммы переводятся в целые
+минорные единицы (центы, сатоши) в массивах int64, и курс умножается
+в целых числах; через ``Decimal`` проходят только строки, где значение
+попадает точно на середину между минорными единицами или результат не
+помещается в int64. Обе ветки дают одинаковый результат.
+
+Курс перед умножением округляется до ``RATE_DIGITS`` значащих цифр,
+чтобы его мантисса помещалась в int64 вместе с суммой.
+"""
+from decimal import ROUND_HALF_EVEN, ROUND_HALF_UP, Context, Decimal, InvalidOperation
+from functools import lru_cache
+
+import numpy as np
+
+# Значащих цифр курса в точном режиме
+RATE_DIGITS = 9
+
+DEFAULT_PLACES = 2
+DEFAULT_ROUNDING = ROUND_HALF_UP
+
+# Знаки после запятой и правило округления по валютам; остальные — DEFAULT_*
+CURRENCY_RULES = {
+    "USD": (2, ROUND_HALF_UP),
+    "EUR": (2, ROUND_HALF_UP),
+    "RUB": (2, ROUND_HALF_UP),
+    "GBP": (2, ROUND_HALF_UP),
+    "JPY": (0, ROUND_HALF_UP),
+    "CNY": (2, ROUND_HALF_UP),
+    "KRW": (0, ROUND_HALF_UP),
+    "BTC": (8, ROUND_HALF_EVEN),
+    "ETH": (8, ROUND_HALF_EVEN),
+    "XRP": (6, ROUND_HALF_EVEN),
+    "LTC": (8, ROUND_HALF_EVEN),
+    "ADA": (6, ROUND_HALF_EVEN),
+    "DOGE": (8, ROUND_HALF_EVEN),
+}
+
+_QUANTS = {code: Decimal(1).scaleb(-places) for code, (places, _) in CURRENCY_RULES.items()}
+_DEFAULT_QUANT = Decimal(1).scaleb(-DEFAULT_PLACES)
+_POW10 = np.array([10 ** i for i in range(19)], dtype=np.int64)
+_LIMB = 10 ** 9
+# Точности хватает на произведение любой суммы на курс без промежуточного округления
+_CONTEXT = Context(prec=80)
+# Округление курса до значащих цифр при выводе одного значения
+_RATE_CONTEXT = Context(prec=RATE_DIGITS)
+# Запас до 2**63 на погрешность оценки произведения в float64
+_INT64_SAFE = float(2 ** 62)
+
+
+def places(code):
+    """Число знаков после запятой для валюты"""
+    return CURRENCY_RULES.get(code, (DEFAULT_PLACES, None))[0]
+
+
+def rounding(code):
+    return CURRENCY_RULES.get(code, (None, DEFAULT_ROUNDING))[1]
+
+
+def quantize(value, code):
+    """Округление ``Decimal`` до минорной единицы валюты по ее правилу"""
+    value = value.quantize(_QUANTS.get(code, _DEFAULT_QUANT), rounding=rounding(code), context=_CONTEXT)
+    # Отрицательная сумма, округленная до нуля, дает -0.00; в int64-ветке нуль без знака
+    return value.copy_abs() if value.is_zero() else value
+
+
+def _multiply(amount, rate, from_curr, to_curr):
+    return quantize(_CONTEXT.multiply(quantize(amount, from_curr), rate), to_curr)
+
+
+def to_decimal(value):
+    """``Decimal`` из строки или числа; float берется в кратчайшей записи"""
+    if isinstance(value, Decimal):
+        return value
+    if isinstance(value, float):
+        value = repr(value)
+    try:
+        result = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise ValueError(f"Некорректная сумма: {value!r}") from None
+    if not result.is_finite():
+        raise ValueError(f"Некорректная сумма: {value!r}")
+    return result
+
+
+def parse_amounts(values):
+    """Массив float64 из сумм; пустые и нечисловые значения становятся NaN"""
+    if isinstance(values, np.ndarray) and values.dtype.kind in "fiu":
+        return values.astype(np.float64, copy=False)
+    try:
+        return np.asarray(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        pass
+    # Хотя бы одна сумма не разбирается: разбор по строкам с маской ошибок
+    result = np.empty(len(values), dtype=np.float64)
+    for i, value in enumerate(values):
+        try:
+            result[i] = float(value)
+        except (TypeError, ValueError):
+            result[i] = np.nan
+    return result
+
+
+def rate_parts(rates):
+    """Курсы как целая мантисса и десятичный порядок: ``rate ≈ m * 10**e``"""
+    rates = np.asarray(rates, dtype=np.float64)
+    finite = np.isfinite(rates) & (rates > 0)
+    safe = np.where(finite, rates, 1.0)
+    exponents = np.floor(np.log10(safe)).astype(np.int64) - (RATE_DIGITS - 1)
+    mantissas = np.rint(safe / np.power(10.0, exponents))
+    # Округление могло дать лишнюю цифру (9.9999999995 -> 10.00000000)
+    carry = mantissas >= 10 ** RATE_DIGITS
+    mantissas[carry] = np.rint(mantissas[carry] / 10)
+    exponents[carry] += 1
+    return mantissas.astype(np.int64), exponents, finite
+
+
+def exact_rate(rate):
+    """Курс, округленный так же, как в пакетной конвертации"""
+    m, e, ok = rate_parts([rate])
+    if not ok[0]:
+        raise ValueError(f"Некорректный курс: {rate!r}")
+    return Decimal(int(m[0])).scaleb(int(e[0]))
+
+
+def convert_exact(amount, from_curr, to_curr, rate):
+    """Точная конвертация одной суммы; возвращает ``(result, rate)`` в ``Decimal``"""
+    amount = to_decimal(amount)
+    if from_curr == to_curr:
+        return quantize(amount, from_curr), Decimal(1)
+    rate = exact_rate(rate)
+    return _multiply(amount, rate, from_curr, to_curr), rate
+
+
+@lru_cache(maxsize=1024)
+def format_rate(rate):
+    """Курс с ``RATE_DIGITS`` значащими цифрами, без экспоненты и лишних нулей"""
+    # Одно значение дешевле округлить в Decimal, чем через массивы rate_parts;
+    # в таблице истории один и тот же курс повторяется во многих строках
+    return format(_RATE_CONTEXT.plus(to_decimal(rate)).normalize(_RATE_CONTEXT), "f")
+
+
+def format_rates(rates):
+    """Векторный ``format_rate``; для некорректных курсов — None"""
+    mantissas, exponents, valid = rate_parts(rates)
+    return [
+        format(Decimal(m).scaleb(e).normalize(), "f") if ok else None
+        for m, e, ok in zip(mantissas.tolist(), exponents.tolist(), valid.tolist())
+    ]
+
+
+def format_amount(value, code):
+    """Сумма с числом знаков, принятым для валюты"""
+    if isinstance(value, (Decimal, str)):
+        return format(quantize(to_decimal(value), code), "f")
+    return f"{value:.{places(code)}f}"
+
+
+def _format_minor(value, digits):
+    if digits == 0:
+        return str(value)
+    sign = "-" if value < 0 else ""
+    whole, frac = divmod(abs(value), 10 ** digits)
+    return f"{sign}{whole}.{frac:0{digits}d}"
+
+
+class ExactAmounts:
+    """Результаты точной пакетной конвертации.
+
+    Суммы хранятся в минорных единицах целевой валюты (``minor``, int64)
+    с числом знаков ``places``; строки, посчитанные через ``Decimal``,
+    лежат в словаре ``decimals``. Для неизвестных курсов ``valid`` ложно.
+    """
+
+    __slots__ = ("minor", "places", "valid", "decimals")
+
+    def __init__(self, minor, places, valid, decimals):
+        self.minor = minor
+        self.places = places
+        self.valid = valid
+        self.decimals = decimals
+
+    def __len__(self):
+        return len(self.minor)
+
+    def __getitem__(self, i):
+        if not self.valid[i]:
+            return None
+        if i in self.decimals:
+            return self.decimals[i]
+        return Decimal(int(self.minor[i])).scaleb(-int(self.places[i]))
+
+    def tolist(self):
+        return [self[i] for i in range(len(self))]
+
+    def to_strings(self):
+        """Строковое представление без создания ``Decimal`` для каждой строки"""
+        decimals = self.decimals
+        result = []
+        for i, (value, digits, ok) in enumerate(zip(self.minor.tolist(), self.places.tolist(), self.valid.tolist())):
+            if not ok:
+                result.append(None)
+            elif i in decimals:
+                result.append(format(decimals[i], "f"))
+            else:
+                result.append(_format_minor(value, digits))
+        return result
+
+    def to_float(self):
+        values = self.minor / np.power(10.0, self.places)
+        for i, value in self.decimals.items():
+            values[i] = float(value)
+        values[~self.valid] = np.nan
+        return values
+
+
+def _mul_div_round(value, mantissa, digits, half_up):
+    """``value * mantissa / 10**digits`` с округлением до ближайшего целого.
+
+    Произведение может не поместиться в int64, поэтому сумма делится на
+    две части по 9 цифр: ``value = high * 10**9 + low``. Все аргументы
+    неотрицательны, ``value < 2**53``, ``mantissa < 10**9``.
+    """
+    high, low = np.divmod(value, _LIMB)
+    x = high * mantissa
+    y = low * mantissa
+    small = digits <= 9
+    # 10**digits делит 10**9: value / d = x * 10**(9 - digits) + y / d
+    d = _POW10[np.where(small, digits, 0)]
+    q_small = x * _POW10[np.where(small, 9 - digits, 0)] + y // d
+    r_small = y % d
+    # 10**9 делит 10**digits: value / d = (x + y / 10**9) / 10**(digits - 9)
+    d2 = _POW10[np.where(small, 0, digits - 9)]
+    carry = x + y // _LIMB
+    q_large = carry // d2
+    r_large = (carry % d2) * _LIMB + y % _LIMB
+    q = np.where(small, q_small, q_large)
+    r2 = np.where(small, r_small, r_large) * 2
+    divisor = _POW10[digits]
+    up = (r2 > divisor) | ((r2 == divisor) & (half_up | (q % 2 == 1)))
+    return q + up
+
+
+def convert_many_exact(amounts, from_idx, to_idx, codes, rates):
+    """Точная векторная конвертация.
+
+    ``from_idx`` и ``to_idx`` — индексы валют в списке ``codes`` (как
+    у таблицы кросс-курсов), ``rates`` — курсы пар. Возвращает
+    ``(ExactAmounts, rates)``, где курсы уже округлены до ``RATE_DIGITS``
+    значащих цифр.
+    """
+    raw = amounts
+    amounts = parse_amounts(amounts)
+    # Правила валют выбираются по индексам, без сравнения строк в каждой строке
+    places_table = np.array([places(code) for code in codes], dtype=np.int64)
+    half_up_table = np.array([rounding(code) == ROUND_HALF_UP for code in codes])
+    from_places = places_table[from_idx]
+    to_places = places_table[to_idx]
+    to_half_up = half_up_table[to_idx]
+    mantissas, exponents, valid = rate_parts(rates)
+    valid &= (from_idx >= 0) & (to_idx >= 0) & np.isfinite(amounts)
+    same = valid & (from_idx == to_idx)
+    mantissas[same] = 1
+    exponents[same] = 0
+
+    # Сумма в минорных единицах исходной валюты. Значение на середине между
+    # единицами (или рядом с ней в пределах погрешности float) уходит
+    # в Decimal: там важно правило округления валюты и точная запись суммы
+    scaled = amounts * np.power(10.0, from_places)
+    frac = np.abs(scaled - np.trunc(scaled))
+    tie = np.abs(frac - 0.5) <= np.abs(scaled) * 4e-16 + 1e-12
+    fast = valid & ~tie & (np.abs(scaled) < 2 ** 53)
+    minor_in = np.where(fast, np.rint(np.where(fast, scaled, 0)), 0).astype(np.int64)
+
+    # result = minor_in * m * 10**k в минорных единицах целевой валюты
+    k = exponents - from_places + to_places
+    fast &= np.abs(k) <= 18
+    estimate = np.abs(minor_in).astype(np.float64) * mantissas * np.power(10.0, k.astype(np.float64))
+    fast &= estimate < _INT64_SAFE
+
+    sign = np.sign(minor_in)
+    value = np.abs(minor_in)
+    minor = np.zeros(len(amounts), dtype=np.int64)
+    up = fast & (k >= 0)
+    minor[up] = value[up] * mantissas[up] * _POW10[k[up]]
+    down = fast & (k < 0)
+    minor[down] = _mul_div_round(value[down], mantissas[down], -k[down], to_half_up[down])
+    minor *= sign
+
+    decimals = {}
+    slow = np.flatnonzero(valid & ~fast)
+    if len(slow):
+        # Исходная запись суммы (строка из файла) точнее, чем float
+        numeric = isinstance(raw, np.ndarray) and raw.dtype.kind in "fiu"
+        source = amounts if numeric else raw
+        for i in slow.tolist():
+            amount = source[i]
+            if isinstance(amount, (np.floating, np.integer)):
+                amount = amount.item()
+            rate = Decimal(int(mantissas[i])).scaleb(int(exponents[i]))
+            decimals[i] = _multiply(to_decimal(amount), rate, codes[from_idx[i]], codes[to_idx[i]])
+
+    rounded = mantissas * np.power(10.0, exponents)
+    rounded[~valid] = np.nan
+    return ExactAmounts(minor, to_places, valid, decimals), rounded
@@ -0,0 +1,88 @@
+"""Постоянный кэш последних котировок и настроек на диске.
+
+Файл SQLite открывается в режиме WAL: запись после каждого обновления
+курсов не блокирует чтение и не переписывает файл целиком. При запуске
+котировки загружаются в ``RateCache`` вместе со временем получения,
+так что конвертация работает сразу и без сети, а источники, чьи
+котировки еще не устарели, не запрашиваются повторно.
+
+В настройках хранятся ключи API, поэтому файл базы и его журналы WAL
+доступны только владельцу (права 0o600).
+"""
+import os
+import sqlite3
+import threading
+from collections import namedtuple
+
+StoredQuotes = namedtuple("StoredQuotes", ["source", "provider", "fetched_at", "rates"])
+
+PRIVATE_MODE = 0o600
+
+
+def _restrict(path):
+    """Создает файл базы с правами только для владельца и исправляет права старых файлов"""
+    os.close(os.open(path, os.O_RDWR | os.O_CREAT, PRIVATE_MODE))
+    for name in (path, path + "-wal", path + "-shm"):
+        if os.path.exists(name):
+            os.chmod(name, PRIVATE_MODE)
+
+
+class QuoteStore:
+    """Котировки по источникам и простые настройки ключ-значение"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        # SQLite создает журналы WAL с правами самого файла базы
+        _restrict(path)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS sources ("
+            "source TEXT PRIMARY KEY, provider TEXT, fetched_at REAL);"
+            "CREATE TABLE IF NOT EXISTS quotes ("
+            "source TEXT, code TEXT, rate REAL, PRIMARY KEY (source, code));"
+            "CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT);"
+        )
+        self._db.commit()
+
+    def load(self):
+        """Все сохраненные котировки"""
+        with self._lock:
+            sources = self._db.execute("SELECT source, provider, fetched_at FROM sources").fetchall()
+            result = []
+            for source, provider, fetched_at in sources:
+                rates = dict(self._db.execute(
+                    "SELECT code, rate FROM quotes WHERE source = ?", (source,)
+                ))
+                result.append(StoredQuotes(source, provider, fetched_at, rates))
+            return result
+
+    def save(self, source, provider, fetched_at, rates):
+        """Замена котировок источника одной транзакцией"""
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO sources VALUES (?, ?, ?)", (source, provider, fetched_at)
+            )
+            self._db.execute("DELETE FROM quotes WHERE source = ?", (source,))
+            self._db.executemany(
+                "INSERT INTO quotes VALUES (?, ?, ?)",
+                ((source, code, rate) for code, rate in rates.items()),
+            )
+
+    def get_setting(self, key, default=None):
+        with self._lock:
+            row = self._db.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+        return default if row is None else row[0]
+
+    def set_setting(self, key, value):
+        with self._lock, self._db:
+            if value is None:
+                self._db.execute("DELETE FROM settings WHERE key = ?", (key,))
+            else:
+                self._db.execute("INSERT OR REPLACE INTO settings VALUES (?, ?)", (key, value))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
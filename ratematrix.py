@@ -0,0 +1,118 @@
+"""Таблица кросс-курсов, построенная по одному снимку котировок.
+
+Котировки источников образуют граф: ребро ``base -> code`` с курсом
+«единиц code за единицу base». От выбранной базы обходом в ширину
+находится кратчайший путь до каждой валюты (при равной длине выбирается
+путь с наибольшей ликвидностью), после чего любая пара считается
+одним обращением к массиву.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+# Начиная с этого размера полная матрица n*n не строится:
+# курс пары считается делением двух элементов вектора, что тоже O(1)
+MAX_DENSE = 2048
+
+Quotes = namedtuple("Quotes", ["base", "rates", "liquidity"])
+
+
+class RateMatrix:
+    """Кросс-курсы всех валют снимка относительно друг друга"""
+
+    def __init__(self, codes, vector, base="USD", version=0, routes=None, matrix=None):
+        self.codes = list(codes)
+        self.index = {code: i for i, code in enumerate(self.codes)}
+        # vector[i] — единиц валюты codes[i] за одну единицу базы
+        self.vector = np.asarray(vector, dtype=np.float64)
+        self.base = base
+        self.version = version
+        self.routes = routes or {}
+        if matrix is not None:
+            # Готовая матрица, например из разделяемой памяти, не пересчитывается
+            self.matrix = matrix
+        elif len(self.codes) <= MAX_DENSE:
+            # matrix[i, j] — единиц codes[j] за одну единицу codes[i]
+            self.matrix = np.outer(1.0 / self.vector, self.vector)
+        else:
+            self.matrix = None
+
+    @classmethod
+    def from_quotes(cls, quotes, base="USD", version=0):
+        """Строит таблицу из набора котировок ``Quotes(base, rates, liquidity)``"""
+        graph = {}
+        for quote_base, rates, liquidity in quotes:
+            for code, rate in rates.items():
+                if code == quote_base or not rate or rate <= 0:
+                    continue
+                graph.setdefault(quote_base, []).append((code, float(rate), liquidity))
+                graph.setdefault(code, []).append((quote_base, 1.0 / float(rate), liquidity))
+
+        if base not in graph:
+            return cls([base], [1.0], base=base, version=version, routes={base: (base,)})
+
+        # Обход по слоям: кратчайший путь, при равенстве — максимум
+        # ликвидности самого слабого ребра пути
+        values = {base: 1.0}
+        strength = {base: float("inf")}
+        routes = {base: (base,)}
+        layer = [base]
+        while layer:
+            candidates = {}
+            for node in layer:
+                for code, rate, liquidity in graph[node]:
+                    if code in values:
+                        continue
+                    weight = min(strength[node], liquidity)
+                    best = candidates.get(code)
+                    if best is None or weight > best[0]:
+                        candidates[code] = (weight, values[node] * rate, routes[node] + (code,))
+            for code, (weight, value, route) in candidates.items():
+                values[code] = value
+                strength[code] = weight
+                routes[code] = route
+            layer = list(candidates)
+
+        codes = list(values)
+        vector = [values[code] for code in codes]
+        return cls(codes, vector, base=base, version=version, routes=routes)
+
+    def __contains__(self, code):
+        return code in self.index
+
+    def __len__(self):
+        return len(self.codes)
+
+    def rate(self, from_curr, to_curr):
+        """Курс пары или None, если одной из валют нет в снимке"""
+        i = self.index.get(from_curr)
+        j = self.index.get(to_curr)
+        if i is None or j is None:
+            return None
+        if self.matrix is not None:
+            return float(self.matrix[i, j])
+        return float(self.vector[j] / self.vector[i])
+
+    def indices(self, codes):
+        """Индексы кодов в таблице; неизвестные коды дают -1"""
+        codes = np.asarray(codes)
+        unique, inverse = np.unique(codes, return_inverse=True)
+        lookup = np.array([self.index.get(code, -1) for code in unique.tolist()], dtype=np.intp)
+        return lookup[inverse].reshape(codes.shape)
+
+    def rates_for(self, from_idx, to_idx):
+        """Курсы для массивов индексов (векторная выборка)"""
+        if self.matrix is not None:
+            return self.matrix[from_idx, to_idx]
+        return self.vector[to_idx] / self.vector[from_idx]
+
+    def route(self, from_curr, to_curr):
+        """Путь пересчета пары через граф котировок"""
+        if from_curr not in self.routes or to_curr not in self.routes:
+            return None
+        # Пути хранятся от базы: пара идет через их последний общий узел
+        src, dst = self.routes[from_curr], self.routes[to_curr]
+        common = 0
+        while common < min(len(src), len(dst)) and src[common] == dst[common]:
+            common += 1
+        return tuple(reversed(src[common - 1:])) + dst[common:]
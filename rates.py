@@ -0,0 +1,693 @@
+"""Поставщики курсов валют и кэш котировок.
+
+Котировки хранятся как «единиц валюты за одну единицу базы» (по умолчанию
+USD), поэтому курс пары считается как ``rates[to] / rates[from]``.
+
+У источника может быть несколько поставщиков: ``AggregateProvider``
+опрашивает их параллельно в общем пуле потоков и не ждет медленных
+дольше их таймаута.
+"""
+import logging
+import statistics
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+FIAT = "fiat"
+CRYPTO = "crypto"
+
+# Время жизни котировок каждого источника, в секундах
+DEFAULT_TTL = {
+    FIAT: 60 * 60,
+    CRYPTO: 60,
+}
+
+# Период фонового обновления котировок, в секундах. Он не зависит от TTL:
+# пока курсы никто не читает, платные API опрашиваются редко, а устаревшие
+# котировки при чтении обновляются по требованию
+DEFAULT_REFRESH_INTERVAL = {
+    FIAT: 60 * 60,
+    CRYPTO: 10 * 60,
+}
+
+# Способы объединения котировок нескольких поставщиков
+PRIORITY = "priority"
+MEDIAN = "median"
+
+FIAT_CODES = ["USD", "EUR", "RUB", "GBP", "JPY", "CNY"]
+CRYPTO_CODES = ["BTC", "ETH", "XRP", "LTC", "ADA", "DOGE"]
+
+
+class RateProviderError(Exception):
+    """Ошибка получения котировок от поставщика"""
+
+
+class RateProvider:
+    """Базовый поставщик котировок одного источника"""
+
+    name = None
+    source = None
+    base = "USD"
+    # Относительная ликвидность котировок для выбора пути в графе курсов
+    liquidity = 1.0
+
+    def fetch(self):
+        """Возвращает словарь {код: единиц валюты за одну единицу базы}"""
+        raise NotImplementedError
+
+    def currencies(self):
+        """Словарь {код: название} всех валют поставщика; по умолчанию — коды котировок"""
+        return {code: code for code in self.fetch()}
+
+
+class StubRateProvider(RateProvider):
+    """Локальный поставщик с фиксированными котировками для работы без сети"""
+
+    name = "stub"
+
+    FIAT_RATES = {
+        "USD": 1.0,
+        "EUR": 0.85,
+        "RUB": 75.0,
+        "GBP": 0.73,
+        "JPY": 110.0,
+        "CNY": 6.45,
+    }
+    CRYPTO_RATES = {
+        "BTC": 0.000025,
+        "ETH": 0.0005,
+        "XRP": 1.6,
+        "LTC": 0.0055,
+        "ADA": 0.7,
+        "DOGE": 4.0,
+    }
+
+    def __init__(self, source, rates=None, delay=0.0, base="USD"):
+        self.source = source
+        self.base = base
+        if rates is None:
+            rates = self.FIAT_RATES if source == FIAT else self.CRYPTO_RATES
+        self.rates = dict(rates)
+        self.delay = delay
+        self.calls = 0
+
+    def fetch(self):
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        return dict(self.rates)
+
+
+class HttpRateProvider(RateProvider):
+    """Поставщик, получающий котировки по HTTP через общую сессию"""
+
+    timeout = 10
+
+    def __init__(self, api_key, session=None):
+        self.api_key = api_key
+        self._session = session
+
+    @property
+    def session(self):
+        if self._session is None:
+            self._session = shared_session()
+        return self._session
+
+    def get_json(self, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        try:
+            response = self.session.get(url, **kwargs)
+            response.raise_for_status()
+            return response.json()
+        except Exception as e:
+            raise RateProviderError(f"{self.source}: {e}") from e
+
+
+class ExchangeRateApiProvider(HttpRateProvider):
+    """Курсы обычных валют с exchangerate-api.com"""
+
+    name = "exchangerate-api"
+    source = FIAT
+    url = "https://v6.exchangerate-api.com/v6/{key}/latest/{base}"
+
+    codes_url = "https://v6.exchangerate-api.com/v6/{key}/codes"
+
+    def fetch(self):
+        data = self.get_json(self.url.format(key=self.api_key, base=self.base))
+        if data.get("result") != "success":
+            raise RateProviderError(f"{self.source}: {data.get('error-type', 'unknown error')}")
+        return {code: float(rate) for code, rate in data["conversion_rates"].items()}
+
+    def currencies(self):
+        data = self.get_json(self.codes_url.format(key=self.api_key))
+        if data.get("result") != "success":
+            raise RateProviderError(f"{self.source}: {data.get('error-type', 'unknown error')}")
+        return dict(data["supported_codes"])
+
+
+class CoinMarketCapProvider(HttpRateProvider):
+    """Курсы криптовалют с coinmarketcap.com"""
+
+    name = "coinmarketcap"
+    source = CRYPTO
+    liquidity = 0.5
+    url = "https://pro-api.coinmarketcap.com/v1/cryptocurrency/quotes/latest"
+    map_url = "https://pro-api.coinmarketcap.com/v1/cryptocurrency/map"
+
+    def __init__(self, api_key, symbols=None, session=None):
+        super().__init__(api_key, session=session)
+        self.symbols = list(symbols or CRYPTO_CODES)
+
+    def fetch(self):
+        data = self.get_json(
+            self.url,
+            params={"symbol": ",".join(self.symbols), "convert": self.base},
+            headers={"X-CMC_PRO_API_KEY": self.api_key},
+        )
+        rates = {}
+        for symbol, info in data.get("data", {}).items():
+            price = info["quote"][self.base]["price"]
+            if price:
+                # Цена монеты в базе -> монет за одну единицу базы
+                rates[symbol] = 1.0 / float(price)
+        return rates
+
+    def currencies(self):
+        """Только монеты, по которым запрашиваются котировки: остальные нечем конвертировать"""
+        data = self.get_json(
+            self.map_url,
+            params={"symbol": ",".join(self.symbols)},
+            headers={"X-CMC_PRO_API_KEY": self.api_key},
+        )
+        # Символы не уникальны: название берется у монеты с наибольшей капитализацией
+        # (наименьшим rank); монеты без места в рейтинге идут последними
+        coins = sorted(data.get("data", []), key=lambda coin: coin.get("rank") or float("inf"))
+        names = {}
+        for coin in coins:
+            names.setdefault(coin["symbol"], coin["name"])
+        return {symbol: names.get(symbol, symbol) for symbol in self.symbols}
+
+
+class OpenExchangeRatesProvider(HttpRateProvider):
+    """Курсы обычных валют с openexchangerates.org"""
+
+    name = "openexchangerates"
+    source = FIAT
+    url = "https://openexchangerates.org/api/latest.json"
+    currencies_url = "https://openexchangerates.org/api/currencies.json"
+
+    def fetch(self):
+        params = {"app_id": self.api_key}
+        if self.base != "USD":
+            params["base"] = self.base
+        data = self.get_json(self.url, params=params)
+        if "rates" not in data:
+            raise RateProviderError(f"{self.source}: {data.get('description', 'unknown error')}")
+        return {code: float(rate) for code, rate in data["rates"].items()}
+
+    def currencies(self):
+        return self.get_json(self.currencies_url, params={"app_id": self.api_key})
+
+
+class CoinGeckoProvider(HttpRateProvider):
+    """Курсы криптовалют с coingecko.com"""
+
+    name = "coingecko"
+    source = CRYPTO
+    liquidity = 0.5
+    url = "https://api.coingecko.com/api/v3/simple/price"
+    list_url = "https://api.coingecko.com/api/v3/coins/list"
+    # Идентификаторы монет в API CoinGecko
+    ids = {
+        "BTC": "bitcoin",
+        "ETH": "ethereum",
+        "XRP": "ripple",
+        "LTC": "litecoin",
+        "ADA": "cardano",
+        "DOGE": "dogecoin",
+    }
+
+    def __init__(self, api_key, symbols=None, session=None):
+        super().__init__(api_key, session=session)
+        self.symbols = [symbol for symbol in (symbols or CRYPTO_CODES) if symbol in self.ids]
+
+    def fetch(self):
+        currency = self.base.lower()
+        data = self.get_json(
+            self.url,
+            params={"ids": ",".join(self.ids[s] for s in self.symbols), "vs_currencies": currency},
+            headers={"x-cg-demo-api-key": self.api_key},
+        )
+        rates = {}
+        for symbol in self.symbols:
+            price = data.get(self.ids[symbol], {}).get(currency)
+            if price:
+                rates[symbol] = 1.0 / float(price)
+        return rates
+
+    def currencies(self):
+        """Только монеты из ``ids``; название ищется по идентификатору, а не по неуникальному символу"""
+        coins = self.get_json(self.list_url, headers={"x-cg-demo-api-key": self.api_key})
+        names = {coin["id"]: coin["name"] for coin in coins}
+        return {symbol: names.get(self.ids[symbol], symbol) for symbol in self.symbols}
+
+
+class _ProviderStats:
+    """Последние задержки и число ошибок подряд одного поставщика"""
+
+    __slots__ = ("latencies", "failures")
+
+    def __init__(self, size):
+        self.latencies = deque(maxlen=size)
+        self.failures = 0
+
+    def p95(self, min_samples):
+        """95-й процентиль задержки или None, если замеров меньше ``min_samples``"""
+        if len(self.latencies) < min_samples:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+
+class AggregateProvider(RateProvider):
+    """Несколько поставщиков одного источника, опрашиваемых параллельно.
+
+    При ``merge=PRIORITY`` сначала опрашивается первый поставщик; если он
+    не ответил за свое 95-е процентильное время, параллельно запускается
+    следующий (hedged request), а при ошибке следующий запускается сразу.
+    Побеждает первый успешный ответ. При ``merge=MEDIAN`` опрашиваются
+    все, и по каждой валюте берется медиана ответивших вовремя.
+
+    Поставщики с ошибками в последних запросах опрашиваются последними.
+    """
+
+    # Таймаут поставщика, если у него нет своего атрибута timeout, с
+    timeout = 10
+    # Задержка перед дублирующим запросом, пока задержек мало для p95, с
+    hedge_after = 1.0
+    min_samples = 5
+    history_size = 50
+
+    def __init__(self, providers, merge=PRIORITY):
+        if not providers:
+            raise ValueError("Нужен хотя бы один поставщик")
+        if merge not in (PRIORITY, MEDIAN):
+            raise ValueError(f"Неизвестный способ объединения: {merge}")
+        self.providers = list(providers)
+        self.merge = merge
+        primary = self.providers[0]
+        self.source = primary.source
+        self.base = primary.base
+        self.liquidity = primary.liquidity
+        self.name = "+".join(provider.name for provider in self.providers)
+        self._stats = {id(provider): _ProviderStats(self.history_size) for provider in self.providers}
+        self._lock = threading.Lock()
+
+    def hedge_delay(self, provider):
+        """Через сколько секунд дублировать запрос к поставщику"""
+        with self._lock:
+            p95 = self._stats[id(provider)].p95(self.min_samples)
+        return self.hedge_after if p95 is None else p95
+
+    def _ordered(self):
+        with self._lock:
+            return sorted(self.providers, key=lambda p: self._stats[id(p)].failures > 0)
+
+    def _fetch_one(self, provider):
+        started = time.perf_counter()
+        try:
+            rates = provider.fetch()
+        except Exception:
+            with self._lock:
+                self._stats[id(provider)].failures += 1
+            raise
+        elapsed = time.perf_counter() - started
+        METRICS.observe("gg_provider_fetch_seconds", elapsed, provider=provider.name)
+        # Опоздавшие ответы тоже учитываются: они сдвигают p95 поставщика
+        with self._lock:
+            stats = self._stats[id(provider)]
+            stats.latencies.append(elapsed)
+            stats.failures = 0
+        return rates
+
+    def fetch(self):
+        waiting = self._ordered()
+        pending = {}
+        errors = []
+        results = []
+        hedge_at = None
+
+        def launch():
+            nonlocal hedge_at
+            provider = waiting.pop(0)
+            future = _fetch_pool().submit(self._fetch_one, provider)
+            started = time.monotonic()
+            timeout = getattr(provider, "timeout", self.timeout)
+            pending[future] = (provider, started + timeout, timeout)
+            hedge_at = started + self.hedge_delay(provider) if self.merge == PRIORITY else None
+
+        if self.merge == MEDIAN:
+            while waiting:
+                launch()
+        else:
+            launch()
+
+        while pending:
+            deadlines = [deadline for _, deadline, _ in pending.values()]
+            if waiting and hedge_at is not None:
+                deadlines.append(hedge_at)
+            done, _ = wait(pending, timeout=max(0.0, min(deadlines) - time.monotonic()),
+                           return_when=FIRST_COMPLETED)
+            for future in done:
+                provider, _, _ = pending.pop(future)
+                try:
+                    rates = future.result()
+                except Exception as e:
+                    errors.append(f"{provider.name}: {e}")
+                    if waiting:
+                        launch()
+                    continue
+                if self.merge == PRIORITY:
+                    return rates
+                results.append(rates)
+
+            now = time.monotonic()
+            for future, (provider, deadline, timeout) in list(pending.items()):
+                if now >= deadline:
+                    # Поток доработает сам; его ответ уже не нужен
+                    del pending[future]
+                    with self._lock:
+                        self._stats[id(provider)].failures += 1
+                    errors.append(f"{provider.name}: нет ответа за {timeout:g} с")
+                    if waiting:
+                        launch()
+            if waiting and hedge_at is not None and now >= hedge_at:
+                METRICS.count("gg_rate_hedged_requests_total", source=self.source)
+                launch()
+
+        if results:
+            return merge_median(results)
+        raise RateProviderError(f"{self.source}: " + "; ".join(errors))
+
+    def currencies(self):
+        """Объединенный каталог всех поставщиков, ответивших без ошибок"""
+        futures = [(provider, _fetch_pool().submit(provider.currencies)) for provider in self.providers]
+        merged = {}
+        errors = []
+        for provider, future in futures:
+            try:
+                for code, name in future.result(timeout=getattr(provider, "timeout", self.timeout)).items():
+                    merged.setdefault(code, name)
+            except Exception as e:
+                errors.append(f"{provider.name}: {e}")
+        if not merged and errors:
+            raise RateProviderError(f"{self.source}: " + "; ".join(errors))
+        return merged
+
+
+def merge_median(results):
+    """Медиана котировок по каждой валюте среди ответов поставщиков"""
+    codes = {}
+    for rates in results:
+        for code, rate in rates.items():
+            codes.setdefault(code, []).append(rate)
+    return {code: statistics.median(values) for code, values in codes.items()}
+
+
+_pool = None
+_session = None
+_session_lock = threading.Lock()
+
+
+def _fetch_pool():
+    """Общий пул потоков для параллельных запросов к поставщикам"""
+    global _pool
+    with _session_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="rate-fetch")
+        return _pool
+
+
+def shared_session():
+    """Общий пул HTTP-соединений для всех поставщиков"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+
+# Поставщики по имени для настроек вида "имя=ключ"; первый — по умолчанию
+PROVIDERS = {
+    FIAT: {
+        ExchangeRateApiProvider.name: ExchangeRateApiProvider,
+        OpenExchangeRatesProvider.name: OpenExchangeRatesProvider,
+    },
+    CRYPTO: {
+        CoinMarketCapProvider.name: CoinMarketCapProvider,
+        CoinGeckoProvider.name: CoinGeckoProvider,
+    },
+}
+
+
+def parse_provider_spec(spec, source):
+    """Разбор строки "имя=ключ, имя=ключ" в список ``(класс, ключ)`` по приоритету.
+
+    Ключ без имени относится к поставщику источника по умолчанию.
+    """
+    known = PROVIDERS[source]
+    result = []
+    for item in (spec or "").replace(";", ",").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, sep, key = item.partition("=")
+        if not sep:
+            name, key = next(iter(known)), item
+        name, key = name.strip().lower(), key.strip()
+        if name not in known:
+            raise ValueError(f"Неизвестный поставщик {name}; доступны: {', '.join(known)}")
+        result.append((known[name], key))
+    return result
+
+
+def _make_provider(source, spec, merge):
+    configured = [cls(key) for cls, key in parse_provider_spec(spec, source)]
+    if not configured:
+        return StubRateProvider(source)
+    if len(configured) == 1:
+        return configured[0]
+    return AggregateProvider(configured, merge=merge)
+
+
+def make_providers(fiat_api_key=None, crypto_api_key=None, merge=PRIORITY):
+    """Собирает поставщиков по ключам API; без ключа используется заглушка.
+
+    Ключ может быть списком "имя=ключ, имя=ключ": тогда источник опрашивает
+    несколько поставщиков (см. ``AggregateProvider``).
+    """
+    return {
+        FIAT: _make_provider(FIAT, fiat_api_key, merge),
+        CRYPTO: _make_provider(CRYPTO, crypto_api_key, merge),
+    }
+
+
+class _Entry:
+    __slots__ = ("rates", "fetched_at", "as_of", "attempted_at", "error")
+
+    def __init__(self):
+        self.rates = {}
+        self.fetched_at = None
+        # Момент получения текущих котировок; сохраняется, даже если
+        # котировки признаны устаревшими
+        self.as_of = None
+        self.attempted_at = None
+        self.error = None
+
+
+class RateCache:
+    """Кэш котировок с TTL на источник и отдачей устаревших значений.
+
+    Чтение никогда не ждёт сети: если котировки источника устарели,
+    возвращаются прежние значения, а обновление запускается в фоне.
+    Одновременно выполняется не больше одного обновления на источник.
+    """
+
+    # Пауза перед повторной попыткой после ошибки, в секундах
+    retry_interval = 30
+
+    def __init__(self, providers, ttl=None, clock=time.time):
+        self.providers = dict(providers)
+        self.ttl = dict(DEFAULT_TTL)
+        if ttl:
+            self.ttl.update(ttl)
+        self.clock = clock
+        self.version = 0
+        self.base = "USD"
+        self._snapshot = None
+        self._entries = {source: _Entry() for source in self.providers}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._listeners = []
+        # Внешний запуск фоновых обновлений, например через планировщик:
+        # refresher(source) должен вернуться сразу
+        self.refresher = None
+
+    def set_provider(self, source, provider):
+        """Заменяет поставщика источника; старые котировки считаются устаревшими"""
+        with self._lock:
+            self.providers[source] = provider
+            entry = self._entries.setdefault(source, _Entry())
+            entry.fetched_at = None
+            entry.error = None
+
+    def restore(self, source, rates, fetched_at, fresh=True):
+        """Загрузка сохраненных котировок, например из кэша на диске.
+
+        При ``fresh=False`` котировки используются до первого обновления,
+        но считаются устаревшими независимо от TTL.
+        """
+        with self._lock:
+            entry = self._entries.setdefault(source, _Entry())
+            entry.rates = dict(rates)
+            entry.as_of = fetched_at
+            entry.fetched_at = fetched_at if fresh else None
+            self.version += 1
+
+    def add_listener(self, callback):
+        """Подписка на обновления: callback(source, rates) из фонового потока"""
+        self._listeners.append(callback)
+
+    def is_stale(self, source):
+        entry = self._entries[source]
+        if entry.fetched_at is None:
+            return True
+        return self.clock() - entry.fetched_at >= self.ttl.get(source, 0)
+
+    def get(self, source):
+        """Котировки источника без ожидания сети"""
+        if self.is_stale(source):
+            METRICS.count("gg_rate_cache_requests_total", source=source, result="miss")
+            entry = self._entries[source]
+            if entry.error is None or self.clock() - entry.attempted_at >= self.retry_interval:
+                self.refresh_async(source)
+        else:
+            METRICS.count("gg_rate_cache_requests_total", source=source, result="hit")
+        return self._entries[source].rates
+
+    def rates(self):
+        """Объединённые котировки всех источников"""
+        merged = {}
+        for source in self.providers:
+            merged.update(self.get(source))
+        return merged
+
+    def snapshot(self):
+        """Таблица кросс-курсов по текущим котировкам; пересобирается при их смене"""
+        # NumPy загружается при первом обращении к таблице, а не при старте
+        from ratematrix import Quotes, RateMatrix
+
+        version = self.version
+        quotes = []
+        for source, provider in list(self.providers.items()):
+            quotes.append(Quotes(provider.base, self.get(source), provider.liquidity))
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.version != version:
+            with METRICS.timer("gg_rate_matrix_build_seconds"):
+                snapshot = RateMatrix.from_quotes(quotes, base=self.base, version=version)
+            self._snapshot = snapshot
+        return snapshot
+
+    def rate(self, from_curr, to_curr):
+        """Курс пары или None, если котировок ещё нет"""
+        if from_curr == to_curr:
+            return 1.0
+        return self.snapshot().rate(from_curr, to_curr)
+
+    def fetched_at(self, source):
+        return self._entries[source].fetched_at
+
+    def as_of(self, source=None):
+        """Время получения котировок источника; без источника — самое раннее по всем"""
+        if source is not None:
+            return self._entries[source].as_of
+        moments = [entry.as_of for entry in self._entries.values() if entry.as_of is not None]
+        return min(moments) if moments else None
+
+    def refresh_if_stale(self, source):
+        """Обновление источника, только если его котировки устарели"""
+        if self.is_stale(source):
+            return self.refresh(source)
+        return None
+
+    def next_refresh_in(self, source, interval=None):
+        """Секунд до истечения TTL котировок источника (или ``interval`` с их получения)"""
+        fetched_at = self._entries[source].fetched_at
+        if fetched_at is None:
+            return 0
+        if interval is None:
+            interval = self.ttl.get(source, 0)
+        return max(0, fetched_at + interval - self.clock())
+
+    def last_error(self, source):
+        return self._entries[source].error
+
+    def refresh_async(self, source):
+        """Запускает фоновое обновление, если оно ещё не идёт"""
+        if self.refresher is not None:
+            self.refresher(source)
+            return None
+        with self._lock:
+            if source in self._refreshing:
+                return None
+            self._refreshing.add(source)
+        thread = threading.Thread(target=self._refresh, args=(source,), daemon=True)
+        thread.start()
+        return thread
+
+    def refresh(self, source):
+        """Синхронное обновление источника; ошибка поставщика пробрасывается"""
+        with self._lock:
+            self._refreshing.add(source)
+        error = self._refresh(source)
+        if error is not None:
+            raise error
+        return self._entries[source].rates
+
+    def refresh_all(self):
+        for source in list(self.providers):
+            self.refresh(source)
+
+    def _refresh(self, source):
+        entry = self._entries[source]
+        entry.attempted_at = self.clock()
+        try:
+            with METRICS.timer("gg_rate_fetch_seconds", source=source):
+                rates = self.providers[source].fetch()
+        except Exception as e:
+            METRICS.count("gg_rate_fetch_errors_total", source=source)
+            logger.warning("Не удалось обновить курсы %s: %s", source, e)
+            with self._lock:
+                entry.error = e
+                self._refreshing.discard(source)
+            return e
+        with self._lock:
+            entry.rates = rates
+            entry.fetched_at = entry.as_of = self.clock()
+            entry.error = None
+            self.version += 1
+            self._refreshing.discard(source)
+        for callback in list(self._listeners):
+            callback(source, rates)
+        return None
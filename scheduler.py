@@ -0,0 +1,164 @@
+"""Планировщик фоновых обновлений на asyncio.
+
+Цикл событий работает в отдельном потоке и просыпается только к сроку
+очередной задачи. У каждой задачи свой интервал; после ошибки интервал
+растет экспоненциально (с разбросом, чтобы клиенты не синхронизировались),
+а повторные запросы на запуск во время выполнения схлопываются в один.
+Пока задача ждет повтора после ошибки, внеочередные запуски
+игнорируются: частые чтения устаревших данных не сокращают отсрочку.
+Результаты кладутся в потокобезопасную очередь, которую поток интерфейса
+разбирает через ``root.after``.
+"""
+import asyncio
+import logging
+import queue
+import random
+import threading
+import time
+from collections import namedtuple
+
+from metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+JobResult = namedtuple("JobResult", ["name", "value", "error", "finished_at"])
+
+
+class _Job:
+    def __init__(self, name, func, interval, max_backoff, jitter, first_delay):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.first_delay = first_delay
+        self.failures = 0
+        self.running = False
+        self.wakeup = None
+        self.task = None
+        # Время цикла событий, к которому задача проснется сама
+        self.due = None
+
+    def next_delay(self):
+        if self.failures:
+            delay = min(self.interval * 2 ** self.failures, self.max_backoff)
+        else:
+            delay = self.interval
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+
+class RefreshScheduler:
+    """Периодические задачи с отдельными интервалами в фоновом цикле asyncio"""
+
+    def __init__(self, results=None):
+        self.results = results if results is not None else queue.Queue()
+        self._jobs = {}
+        self._loop = None
+        self._thread = None
+        self._started = threading.Event()
+
+    def add_job(self, name, func, interval, max_backoff=None, jitter=0.1, run_at_start=False, first_delay=None):
+        """Регистрирует блокирующую функцию ``func`` с периодом ``interval`` секунд.
+
+        Первый запуск происходит через ``first_delay`` секунд, сразу при
+        ``run_at_start`` или через обычный интервал.
+        """
+        if first_delay is None:
+            first_delay = 0 if run_at_start else None
+        job = _Job(name, func, interval, max_backoff or interval * 16, jitter, first_delay)
+        self._jobs[name] = job
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._start_job, job)
+        return job
+
+    def start(self):
+        """Запуск цикла событий в фоновом потоке"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="refresh-scheduler", daemon=True)
+        self._thread.start()
+        self._started.wait()
+
+    def stop(self):
+        """Остановка цикла; выполняющиеся функции доработают в своих потоках"""
+        if self._loop is None:
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._loop = None
+        self._thread = None
+        self._started.clear()
+
+    def set_interval(self, name, interval, max_backoff=None):
+        """Новый период задачи; действует с ее следующего запуска"""
+        job = self._jobs[name]
+        job.interval = interval
+        job.max_backoff = max_backoff or interval * 16
+
+    def trigger(self, name):
+        """Внеочередной запуск задачи.
+
+        Вызов игнорируется, если задача уже выполняется или ждет повтора
+        после ошибки.
+        """
+        if self._loop is None:
+            return
+        self._loop.call_soon_threadsafe(self._wake, name)
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        for job in self._jobs.values():
+            self._start_job(job)
+        self._started.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            tasks = [job.task for job in self._jobs.values() if job.task is not None]
+            for task in tasks:
+                task.cancel()
+            self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self._loop.close()
+
+    def _start_job(self, job):
+        job.wakeup = asyncio.Event()
+        job.task = self._loop.create_task(self._job_loop(job))
+
+    def _wake(self, name):
+        job = self._jobs.get(name)
+        if job is None or job.wakeup is None or job.running:
+            return
+        if job.failures and job.due is not None and self._loop.time() < job.due:
+            return
+        job.wakeup.set()
+
+    async def _job_loop(self, job):
+        if job.first_delay is None:
+            await self._sleep(job, job.next_delay())
+        elif job.first_delay > 0:
+            await self._sleep(job, job.first_delay)
+        while True:
+            job.running = True
+            value = error = None
+            started = time.perf_counter()
+            try:
+                value = await self._loop.run_in_executor(None, job.func)
+                job.failures = 0
+            except Exception as e:
+                job.failures += 1
+                error = e
+                METRICS.count("gg_scheduler_job_errors_total", job=job.name)
+                logger.warning("Задача %s завершилась ошибкой (%d подряд): %s", job.name, job.failures, e)
+            finally:
+                job.running = False
+                METRICS.observe("gg_scheduler_job_seconds", time.perf_counter() - started, job=job.name)
+            self.results.put(JobResult(job.name, value, error, time.time()))
+            await self._sleep(job, job.next_delay())
+
+    async def _sleep(self, job, delay):
+        job.due = self._loop.time() + delay
+        job.wakeup.clear()
+        try:
+            await asyncio.wait_for(job.wakeup.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pytest
+
+# Модули приложения лежат в корне репозитория рядом с gg.py
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+class Clock:
+    """Управляемые часы для кода, принимающего параметр ``clock``"""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
@@ -0,0 +1,99 @@
+import time
+
+import pytest
+
+from rates import FIAT, MEDIAN, PRIORITY, AggregateProvider, RateProviderError, StubRateProvider
+
+SLOW = 0.5
+
+
+class FailingProvider(StubRateProvider):
+    name = "failing"
+
+    def fetch(self):
+        self.calls += 1
+        raise RateProviderError("сервис недоступен")
+
+
+def stub(name, eur, delay=0.0, **extra):
+    provider = StubRateProvider(FIAT, {"USD": 1.0, "EUR": eur, **extra}, delay=delay)
+    provider.name = name
+    return provider
+
+
+def timed(func):
+    started = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - started
+
+
+def test_fast_primary_is_not_hedged():
+    primary, backup = stub("primary", 0.8), stub("backup", 0.9)
+    aggregate = AggregateProvider([primary, backup])
+    assert aggregate.fetch()["EUR"] == 0.8
+    assert backup.calls == 0
+
+
+def test_hedge_fires_after_p95_of_primary():
+    primary, backup = stub("primary", 0.8, delay=0.01), stub("backup", 0.9)
+    aggregate = AggregateProvider([primary, backup], merge=PRIORITY)
+    # Замеров хватает для p95 благодаря порогу экземпляра, а не класса
+    aggregate.min_samples = 3
+    aggregate.hedge_after = 10
+    for _ in range(3):
+        aggregate.fetch()
+    assert 0.01 <= aggregate.hedge_delay(primary) < SLOW
+    primary.delay = SLOW
+    rates, elapsed = timed(aggregate.fetch)
+    assert rates["EUR"] == 0.9
+    assert backup.calls == 1
+    assert elapsed < SLOW
+
+
+def test_hedge_after_is_used_until_enough_samples():
+    primary, backup = stub("primary", 0.8, delay=SLOW), stub("backup", 0.9)
+    aggregate = AggregateProvider([primary, backup])
+    aggregate.hedge_after = 0.05
+    rates, elapsed = timed(aggregate.fetch)
+    assert rates["EUR"] == 0.9
+    assert elapsed < SLOW
+
+
+def test_error_fails_over_immediately_and_demotes_provider():
+    broken, backup = FailingProvider(FIAT), stub("backup", 0.9)
+    aggregate = AggregateProvider([broken, backup])
+    aggregate.hedge_after = 10
+    rates, elapsed = timed(aggregate.fetch)
+    assert rates["EUR"] == 0.9 and elapsed < 1
+    # Поставщик с ошибкой в прошлом запросе опрашивается последним
+    aggregate.fetch()
+    assert broken.calls == 1
+
+
+def test_median_of_providers():
+    providers = [stub("a", 0.8), stub("b", 1.0, GBP=0.7), stub("c", 0.9)]
+    rates = AggregateProvider(providers, merge=MEDIAN).fetch()
+    assert rates["EUR"] == 0.9
+    assert rates["GBP"] == 0.7
+
+
+def test_timed_out_provider_is_skipped():
+    slow = stub("slow", 5.0, delay=SLOW)
+    slow.timeout = 0.05
+    aggregate = AggregateProvider([stub("a", 0.8), slow, stub("b", 1.0)], merge=MEDIAN)
+    rates, elapsed = timed(aggregate.fetch)
+    assert rates["EUR"] == pytest.approx(0.9)
+    assert elapsed < SLOW
+    assert aggregate._stats[id(slow)].failures == 1
+
+
+@pytest.mark.parametrize("merge", [PRIORITY, MEDIAN])
+def test_all_failed_raises(merge):
+    slow = stub("slow", 0.8, delay=SLOW)
+    slow.timeout = 0.05
+    aggregate = AggregateProvider([FailingProvider(FIAT), slow], merge=merge)
+    with pytest.raises(RateProviderError) as error:
+        aggregate.fetch()
+    message = str(error.value)
+    assert "failing: сервис недоступен" in message
+    assert "slow: нет ответа за 0.05 с" in message
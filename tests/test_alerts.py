@@ -0,0 +1,84 @@
+import pytest
+
+from alerts import ABOVE, BELOW, CROSS, AlertEngine
+
+
+@pytest.fixture
+def engine(clock):
+    clock.now = 0.0
+    engine = AlertEngine(lambda alert: None, cooldown=0, rate_limit=1000, clock=clock)
+    engine.sent = []
+    engine.notify = engine.sent.append
+    return engine
+
+
+def feed(engine, rate, pair=("USD", "EUR")):
+    """Один шаг проверки; возвращает id сработавших правил"""
+    return sorted(alert.rule.id for alert in engine.evaluate(lambda *p: rate if p == pair else None))
+
+
+def test_thresholds_between_previous_and_new_rate(engine):
+    low = engine.add_threshold(("USD", "EUR"), 0.8, ABOVE, "a@example.com")
+    high = engine.add_threshold(("USD", "EUR"), 0.9, ABOVE, "a@example.com")
+    down = engine.add_threshold(("USD", "EUR"), 0.85, BELOW, "a@example.com")
+    # Первый курс только запоминается
+    assert feed(engine, 0.7) == []
+    assert feed(engine, 0.8) == [low.id]
+    assert feed(engine, 0.95) == [high.id]
+    assert feed(engine, 0.95) == []
+    assert feed(engine, 0.84) == [down.id]
+
+
+def test_cross_fires_in_both_directions(engine):
+    rule = engine.add_threshold(("USD", "EUR"), 1.0, CROSS, "a@example.com")
+    feed(engine, 0.9)
+    assert feed(engine, 1.1) == [rule.id]
+    assert feed(engine, 0.9) == [rule.id]
+
+
+def test_removed_rule_is_not_checked(engine):
+    rule = engine.add_threshold(("USD", "EUR"), 1.0, ABOVE, "a@example.com")
+    engine.remove(rule.id)
+    feed(engine, 0.9)
+    assert feed(engine, 1.1) == []
+    assert len(engine) == 0
+
+
+def test_move_rules_fire_by_percent_prefix(engine, clock):
+    rules = [engine.add_move(("USD", "EUR"), percent, 60, "a@example.com") for percent in (10, 1, 5)]
+    feed(engine, 100.0)
+    clock.now = 30
+    assert feed(engine, 104.0) == [rules[1].id]
+    clock.now = 50
+    assert feed(engine, 106.0) == [rules[1].id, rules[2].id]
+
+
+def test_move_window_forgets_old_points(engine, clock):
+    rule = engine.add_move(("USD", "EUR"), 5, 60, "a@example.com")
+    feed(engine, 100.0)
+    clock.now = 61
+    # Курс 100 вышел из окна, сравнивать 106 не с чем
+    assert feed(engine, 106.0) == []
+    clock.now = 100
+    assert feed(engine, 100.0) == [rule.id]
+
+
+def test_windows_are_shared_by_length(engine):
+    engine.add_move(("USD", "EUR"), 1, 60, "a@example.com")
+    engine.add_move(("USD", "EUR"), 2, 60, "a@example.com")
+    engine.add_move(("USD", "EUR"), 3, 120, "a@example.com")
+    assert sorted(engine._pairs[("USD", "EUR")].windows) == [60, 120]
+
+
+def test_cooldown_and_rate_limit(clock):
+    sent = []
+    engine = AlertEngine(sent.append, cooldown=100, rate_limit=2, rate_period=1000, clock=clock)
+    rules = [engine.add_threshold(("USD", "EUR"), value, CROSS, "a@example.com") for value in (1.0, 2.0, 3.0)]
+    feed(engine, 0.5)
+    # Три порога пересечены сразу, но адресату уходит не больше двух писем
+    assert len(feed(engine, 3.5)) == 2
+    clock.now += 50
+    assert feed(engine, 0.5) == []
+    clock.now += 1050
+    assert feed(engine, 3.5) == [rule.id for rule in rules[:2]]
+    assert len(sent) == 4
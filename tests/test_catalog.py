@@ -0,0 +1,83 @@
+from catalog import CurrencyCatalog
+from rates import CRYPTO, FIAT, CoinGeckoProvider, CoinMarketCapProvider, RateProvider
+
+
+class FakeResponse:
+    def __init__(self, payload):
+        self.payload = payload
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.payload
+
+
+class FakeSession:
+    def __init__(self, payload):
+        self.payload = payload
+        self.requests = []
+
+    def get(self, url, **kwargs):
+        self.requests.append((url, kwargs))
+        return FakeResponse(self.payload)
+
+
+class ListProvider(RateProvider):
+    def __init__(self, source, names):
+        self.source = source
+        self.names = names
+
+    def currencies(self):
+        return dict(self.names)
+
+
+def test_coinmarketcap_names_duplicate_symbols_by_rank():
+    session = FakeSession({"data": [
+        {"symbol": "BTC", "name": "Bitcoin Fake", "rank": None},
+        {"symbol": "BTC", "name": "Bitcoin", "rank": 1},
+        {"symbol": "BTC", "name": "Bitcoin Cash Lite", "rank": 900},
+        {"symbol": "ETH", "name": "Ethereum", "rank": 2},
+    ]})
+    provider = CoinMarketCapProvider("key", symbols=["BTC", "ETH", "DOGE"], session=session)
+    assert provider.currencies() == {"BTC": "Bitcoin", "ETH": "Ethereum", "DOGE": "DOGE"}
+    # Запрашиваются только монеты, по которым есть котировки
+    assert session.requests[0][1]["params"] == {"symbol": "BTC,ETH,DOGE"}
+
+
+def test_coingecko_names_by_coin_id():
+    session = FakeSession([
+        {"id": "bitcoin-token", "symbol": "btc", "name": "Bitcoin Token"},
+        {"id": "bitcoin", "symbol": "btc", "name": "Bitcoin"},
+        {"id": "ethereum", "symbol": "eth", "name": "Ethereum"},
+        {"id": "shiba", "symbol": "shib", "name": "Shiba"},
+    ])
+    provider = CoinGeckoProvider("key", symbols=["BTC", "ETH"], session=session)
+    assert provider.currencies() == {"BTC": "Bitcoin", "ETH": "Ethereum"}
+
+
+def test_refresh_replaces_codes_without_quotes(tmp_path, clock):
+    path = str(tmp_path / "catalog.json")
+    catalog = CurrencyCatalog(path, clock=clock)
+    catalog.refresh({CRYPTO: ListProvider(CRYPTO, {"BTC": "Bitcoin", "SHIB": "Shiba"})})
+    assert catalog.get("SHIB") is not None
+    catalog.refresh({
+        FIAT: ListProvider(FIAT, {"USD": "US Dollar", "CHF": "Swiss Franc"}),
+        CRYPTO: ListProvider(CRYPTO, {"BTC": "Bitcoin"}),
+    })
+    assert catalog.get("SHIB") is None
+    assert catalog.get("CHF").name == "Swiss Franc"
+    # Встроенные названия и валюты первого ряда сохраняются
+    assert catalog.get("USD").name == "Доллар США"
+    assert catalog.get("ETH") is not None
+    reloaded = CurrencyCatalog(path, clock=clock)
+    assert reloaded.get("SHIB") is None and not reloaded.is_stale()
+
+
+def test_search_by_code_name_and_typo(clock):
+    catalog = CurrencyCatalog(clock=clock)
+    catalog.refresh({FIAT: ListProvider(FIAT, {"CHF": "Swiss Franc", "SEK": "Swedish Krona"})})
+    assert [c.code for c in catalog.search("ch")] == ["CHF"]
+    assert [c.code for c in catalog.search("swe")] == ["SEK"]
+    assert "SEK" in [c.code for c in catalog.search("swedsh")]
+    assert all(c.kind == CRYPTO for c in catalog.search("b", kind=CRYPTO))
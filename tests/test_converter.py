@@ -0,0 +1,55 @@
+import io
+
+import pytest
+
+import converter
+from rates import RateProviderError
+from ratematrix import RateMatrix
+
+SNAPSHOT = RateMatrix(["USD", "EUR", "BTC"], [1.0, 0.5, 0.0001])
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "settlements.csv"
+    path.write_text("amount,from,to\n100,USD,EUR\nx,USD,EUR\n5,USD,XXX\n", encoding="utf-8")
+    return str(path)
+
+
+@pytest.fixture(autouse=True)
+def no_keys(monkeypatch):
+    monkeypatch.delenv("FIAT_API_KEY", raising=False)
+    monkeypatch.delenv("CRYPTO_API_KEY", raising=False)
+
+
+def test_malformed_rows_are_skipped_not_fatal():
+    dst = io.StringIO()
+    src = io.StringIO("amount,from,to\n100,USD,EUR\n,USD,EUR\nabc,USD,EUR\n1,USD\n2,USD,BTC\n")
+    stats = converter.convert_csv(src, dst, SNAPSHOT)
+    assert stats == converter.FileStats(5, 3)
+    lines = dst.getvalue().splitlines()
+    assert lines[1] == "100,USD,EUR,50.0,0.5"
+    assert lines[2] == ",USD,EUR,,"
+
+
+def test_missing_keys_are_an_error_without_offline(source, capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        converter.main([source])
+    assert exit_info.value.code == 2
+    assert "--offline" in capsys.readouterr().err
+
+
+def test_offline_uses_local_quotes(source, tmp_path, capsys):
+    output = tmp_path / "out.csv"
+    assert converter.main([source, "-o", str(output), "--offline"]) == 0
+    assert output.read_text(encoding="utf-8").splitlines()[1] == "100,USD,EUR,85.0,0.85"
+    assert "без результата: 2" in capsys.readouterr().err
+
+
+def test_provider_failure_is_one_line(source, monkeypatch, capsys):
+    def fail(*keys):
+        raise RateProviderError("fiat: сеть недоступна")
+
+    monkeypatch.setattr(converter, "load_snapshot", fail)
+    assert converter.main([source, "--fiat-key", "a", "--crypto-key", "b"]) == 1
+    assert capsys.readouterr().err == "Не удалось получить курсы: fiat: сеть недоступна\n"
@@ -0,0 +1,105 @@
+import csv
+import json
+import threading
+
+import pytest
+
+from export import ExportCancelled, ExportJob, export_history
+from history import HistoryStore
+
+CURRENCIES = ["EUR", "BTC", "JPY"]
+
+
+@pytest.fixture
+def store():
+    store = HistoryStore(memory_limit=10, batch_size=4)
+    for i in range(25):
+        store.append(1000.0 + i, i + 0.5, "USD", CURRENCIES[i % 3], i * 2.0, 2.0)
+    yield store
+    store.close()
+
+
+def read(path, fmt):
+    with open(path, encoding="utf-8", newline="") as f:
+        if fmt == "json":
+            return json.load(f)
+        if fmt == "jsonl":
+            return [json.loads(line) for line in f]
+        return list(csv.DictReader(f))
+
+
+@pytest.mark.parametrize("fmt", ["json", "jsonl", "csv"])
+def test_export_is_written_in_chunks(store, tmp_path, fmt):
+    path = str(tmp_path / f"history.{fmt}")
+    steps = []
+    count = export_history(store, path, fmt, chunk_size=7, progress=lambda done, total: steps.append(done))
+    assert count == 25
+    assert steps == [7, 14, 21, 25]
+    rows = read(path, fmt)
+    assert len(rows) == 25
+    assert [row["to"] for row in rows[:4]] == ["EUR", "BTC", "JPY", "EUR"]
+    assert float(rows[24]["result"]) == 48.0
+    assert list(tmp_path.iterdir()) == [tmp_path / f"history.{fmt}"]
+
+
+def test_empty_json_export_is_valid(tmp_path):
+    path = str(tmp_path / "history.json")
+    store = HistoryStore()
+    assert export_history(store, path, "json") == 0
+    assert read(path, "json") == []
+    store.close()
+
+
+def test_filters(store, tmp_path):
+    path = str(tmp_path / "history.jsonl")
+    count = export_history(store, path, "jsonl", chunk_size=4,
+                           start_time=1003.0, end_time=1015.0, currencies={"BTC", "JPY"})
+    rows = read(path, "jsonl")
+    assert count == len(rows) == 8
+    assert {row["to"] for row in rows} == {"BTC", "JPY"}
+    assert [row["amount"] for row in rows][:2] == [4.5, 5.5]
+
+
+def test_cancelled_export_keeps_previous_file(store, tmp_path):
+    path = tmp_path / "history.json"
+    path.write_text("previous", encoding="utf-8")
+    cancel = threading.Event()
+
+    def progress(done, total):
+        cancel.set()
+
+    with pytest.raises(ExportCancelled):
+        export_history(store, str(path), "json", chunk_size=7, progress=progress, cancel=cancel)
+    assert path.read_text(encoding="utf-8") == "previous"
+    assert list(tmp_path.iterdir()) == [path]
+
+
+def test_failed_export_leaves_no_file(store, tmp_path, monkeypatch):
+    path = tmp_path / "history.csv"
+    scan = store.scan
+
+    def broken_scan(*args):
+        for i, item in enumerate(scan(*args)):
+            if i == 1:
+                raise OSError("диск заполнен")
+            yield item
+
+    monkeypatch.setattr(store, "scan", broken_scan)
+    job = ExportJob(store, str(path), "csv", chunk_size=7).start()
+    job.thread.join(5)
+    assert isinstance(job.error, OSError)
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.parametrize("fmt", ["parquet", "arrow"])
+def test_columnar_formats(store, tmp_path, fmt):
+    pa = pytest.importorskip("pyarrow")
+    path = str(tmp_path / f"history.{fmt}")
+    assert export_history(store, path, fmt, chunk_size=10) == 25
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        table = pq.read_table(path)
+    else:
+        table = pa.ipc.open_file(path).read_all()
+    assert table.num_rows == 25
+    assert table.column("to").to_pylist()[:3] == CURRENCIES
@@ -0,0 +1,69 @@
+import pytest
+
+from history import HistoryStore
+
+
+def fill(store, count, start=0):
+    for i in range(start, start + count):
+        store.append(float(i), i + 0.5, "USD", "EUR" if i % 2 else "BTC", i * 2.0, 2.0)
+
+
+def values(records):
+    return [(op.timestamp, op.amount, op.from_curr, op.to_curr, op.result, op.rate) for op in records]
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "history.sqlite3")
+
+
+def test_appends_are_written_in_batches(path):
+    store = HistoryStore(path, batch_size=4)
+    fill(store, 3)
+    assert (store.disk_count, store.pending) == (0, 3)
+    fill(store, 1, start=3)
+    assert (store.disk_count, store.pending) == (4, 0)
+    store.close()
+
+
+def test_old_records_spill_to_disk(path):
+    store = HistoryStore(path, memory_limit=10, batch_size=4)
+    fill(store, 25)
+    assert len(store) == 25
+    assert len(store._timestamps) <= 10
+    assert store.cache_start > 0
+    expected = HistoryStore(memory_limit=100)
+    fill(expected, 25)
+    assert values(store.slice(0, 25)) == values(expected.slice(0, 25))
+    assert values([store[3], store[-1]]) == values([expected[3], expected[24]])
+    # Фильтр применяется одинаково к записям на диске и в памяти
+    filtered = [op for chunk in store.iter_chunks(chunk_size=7, currencies={"EUR"}) for op in chunk]
+    assert values(filtered) == values(op for op in expected if op.to_curr == "EUR")
+    expected.close()
+    store.close()
+
+
+def test_unflushed_batch_is_lost_on_crash_only(path):
+    store = HistoryStore(path, batch_size=4)
+    fill(store, 7)
+    # Второе подключение видит файл так, как его увидит следующий запуск после сбоя
+    crashed = HistoryStore(path)
+    assert len(crashed) == 4
+    crashed.close()
+    store.close()
+    reopened = HistoryStore(path)
+    assert len(reopened) == 7
+    fill(reopened, 1, start=7)
+    assert [op.timestamp for op in reopened.slice(5, 8)] == [5.0, 6.0, 7.0]
+    reopened.close()
+
+
+def test_clear_removes_disk_records(path):
+    store = HistoryStore(path, memory_limit=4, batch_size=2)
+    fill(store, 10)
+    store.clear()
+    assert len(store) == 0
+    store.close()
+    reopened = HistoryStore(path)
+    assert len(reopened) == 0
+    reopened.close()
@@ -0,0 +1,144 @@
+import glob
+import json
+import random
+
+import numpy as np
+import pytest
+
+import jobs
+from converter import FileStats, convert_csv, convert_jsonl
+from jobs import JobCancelled, JobPool, SharedSnapshot, attach_snapshot
+from ratematrix import RateMatrix
+
+SNAPSHOT = RateMatrix(["USD", "EUR", "RUB", "BTC"], [1.0, 0.92, 91.5, 0.0000155], version=7)
+CODES = SNAPSHOT.codes + ["XXX"]
+ROWS = 3000
+
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = JobPool(max_workers=2)
+    yield pool
+    pool.shutdown()
+
+
+@pytest.fixture(autouse=True)
+def small_parts(monkeypatch):
+    # Маленькие части, чтобы файл делился на много кусков
+    monkeypatch.setattr(jobs, "MIN_TASK_BYTES", 1024)
+
+
+@pytest.fixture
+def attached(monkeypatch):
+    # Кэш исполнителя не должен переживать тест
+    monkeypatch.setattr(jobs, "_attached", {})
+
+
+def amounts():
+    rnd = random.Random(42)
+    for i in range(ROWS):
+        if i % 97 == 0:
+            yield "abc"
+        elif i % 89 == 0:
+            yield ""
+        else:
+            yield f"{rnd.uniform(-1000, 100000):.{rnd.randint(0, 8)}f}"
+
+
+def write_csv(path):
+    rnd = random.Random(7)
+    lines = ["amount,from,to,comment"]
+    for i, amount in enumerate(amounts()):
+        lines.append(f'{amount},{rnd.choice(CODES)},{rnd.choice(CODES)},"платеж, №{i}"')
+    # Последняя строка без перевода строки
+    path.write_text("\r\n".join(lines), encoding="utf-8", newline="")
+
+
+def write_jsonl(path):
+    rnd = random.Random(7)
+    lines = []
+    for i, amount in enumerate(amounts()):
+        if i % 101 == 0:
+            lines.append("не json")
+        else:
+            lines.append(json.dumps({"amount": amount, "from": rnd.choice(CODES), "to": rnd.choice(CODES)},
+                                    ensure_ascii=False))
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8", newline="")
+
+
+def serial(src, dst, fmt, exact):
+    convert = convert_csv if fmt == "csv" else convert_jsonl
+    with open(src, newline="", encoding="utf-8") as f, open(dst, "w", newline="", encoding="utf-8") as out:
+        return convert(f, out, SNAPSHOT, exact=exact)
+
+
+@pytest.mark.parametrize("exact", [False, True])
+@pytest.mark.parametrize("fmt", ["csv", "jsonl"])
+def test_parallel_output_matches_serial(pool, tmp_path, fmt, exact):
+    src = tmp_path / f"input.{fmt}"
+    (write_csv if fmt == "csv" else write_jsonl)(src)
+    expected = serial(src, tmp_path / "serial.out", fmt, exact)
+
+    job = pool.convert_file(str(src), str(tmp_path / "parallel.out"), SNAPSHOT, exact=exact)
+    assert len(job.tasks) > 1
+    assert job.wait(60) == expected
+    assert (job.count, job.skipped) == expected
+    assert job.done == job.total
+    assert (tmp_path / "parallel.out").read_bytes() == (tmp_path / "serial.out").read_bytes()
+    assert glob.glob(str(tmp_path / "parallel.out.part*")) == []
+
+
+def test_empty_csv(pool, tmp_path):
+    src = tmp_path / "input.csv"
+    src.write_text("amount,from,to\n", encoding="utf-8")
+    job = pool.convert_file(str(src), str(tmp_path / "out.csv"), SNAPSHOT)
+    assert job.wait(60) == FileStats(0, 0)
+    assert (tmp_path / "out.csv").read_bytes() == b"amount,from,to,result,rate\r\n"
+
+
+def test_cancel_removes_parts(tmp_path):
+    src = tmp_path / "input.csv"
+    write_csv(src)
+    pool = JobPool(max_workers=2)
+    try:
+        job = pool.convert_file(str(src), str(tmp_path / "out.csv"), SNAPSHOT)
+        job.cancel()
+        with pytest.raises(JobCancelled):
+            job.wait(60)
+    finally:
+        pool.shutdown()
+    assert not (tmp_path / "out.csv").exists()
+    assert glob.glob(str(tmp_path / "out.csv.part*")) == []
+
+
+@pytest.mark.parametrize("dense", [True, False])
+def test_shared_snapshot_round_trip(attached, monkeypatch, dense):
+    if not dense:
+        monkeypatch.setattr("ratematrix.MAX_DENSE", 2)
+    snapshot = RateMatrix(SNAPSHOT.codes, SNAPSHOT.vector, base="USD", version=7)
+    assert (snapshot.matrix is not None) == dense
+    shared = SharedSnapshot(snapshot)
+    try:
+        restored = attach_snapshot(shared.handle)
+        assert restored.codes == snapshot.codes
+        assert (restored.base, restored.version) == ("USD", 7)
+        np.testing.assert_array_equal(restored.vector, snapshot.vector)
+        assert (restored.matrix is not None) == dense
+        for a in snapshot.codes:
+            for b in snapshot.codes:
+                assert restored.rate(a, b) == snapshot.rate(a, b)
+        # Повторная часть того же задания берет таблицу из кэша
+        assert attach_snapshot(shared.handle) is restored
+    finally:
+        shared.close()
+
+
+def test_attach_replaces_previous_snapshot(attached):
+    first, second = SharedSnapshot(SNAPSHOT), SharedSnapshot(SNAPSHOT)
+    try:
+        attach_snapshot(first.handle)
+        attach_snapshot(second.handle)
+        assert list(jobs._attached) == [second.handle.name]
+    finally:
+        first.close()
+        second.close()
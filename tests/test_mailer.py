@@ -0,0 +1,126 @@
+import email
+import socketserver
+import threading
+from email.header import decode_header, make_header
+
+import pytest
+
+from mailer import ALERT, MailDispatcher
+
+TIMEOUT = 5
+
+
+class SmtpHandler(socketserver.StreamRequestHandler):
+    """Минимальный SMTP-сервер: принимает письма и умеет отвечать ошибкой на DATA"""
+
+    def reply(self, line):
+        self.wfile.write(line.encode("ascii") + b"\r\n")
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        self.reply("220 localhost")
+        for raw in self.rfile:
+            command = raw.decode("ascii", "replace").strip().upper()
+            if command.startswith("NOOP"):
+                with server.lock:
+                    server.noops += 1
+                self.reply("250 OK")
+            elif command.startswith("DATA"):
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = b"".join(iter(self.rfile.readline, b".\r\n"))
+                with server.lock:
+                    failed = server.failures > 0
+                    if failed:
+                        server.failures -= 1
+                    else:
+                        server.messages.append(email.message_from_bytes(data))
+                self.reply("451 Try again later" if failed else "250 OK")
+            elif command.startswith("QUIT"):
+                self.reply("221 Bye")
+                return
+            elif command.startswith(("EHLO", "HELO")):
+                self.reply("250 localhost")
+            else:
+                self.reply("250 OK")
+
+
+@pytest.fixture
+def smtp_server():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), SmtpHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.connections = server.noops = server.failures = 0
+    server.messages = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def make_dispatcher(smtp_server):
+    dispatchers = []
+
+    def make(**options):
+        settings = {"smtp": "127.0.0.1", "port": smtp_server.server_address[1],
+                    "starttls": False, "email": "app@example.com"}
+        dispatcher = MailDispatcher(settings, **options)
+        dispatchers.append(dispatcher)
+        return dispatcher
+
+    yield make
+    for dispatcher in dispatchers:
+        dispatcher.stop()
+
+
+def test_connection_is_reused(smtp_server, make_dispatcher):
+    dispatcher = make_dispatcher()
+    for i in range(3):
+        dispatcher.send("user@example.com", f"Письмо {i}", "текст")
+    results = [dispatcher.results.get(timeout=TIMEOUT) for _ in range(3)]
+    assert [result.error for result in results] == [None] * 3
+    assert smtp_server.connections == 1
+    # Перед повторным использованием соединение проверяется NOOP
+    assert smtp_server.noops == 2
+    assert [str(make_header(decode_header(m["Subject"])))
+            for m in smtp_server.messages] == ["Письмо 0", "Письмо 1", "Письмо 2"]
+
+
+def test_digest_merges_messages_per_recipient(smtp_server, make_dispatcher):
+    dispatcher = make_dispatcher(digest_window=0.2)
+    for i in range(3):
+        dispatcher.send("user@example.com", f"Уведомление {i}", f"курс {i}", digest=True, kind=ALERT)
+    dispatcher.send("other@example.com", "Одно уведомление", "курс", digest=True, kind=ALERT)
+    results = sorted((dispatcher.results.get(timeout=TIMEOUT) for _ in range(2)), key=lambda r: r.to)
+    assert [(result.to, result.kind, result.error) for result in results] == [
+        ("other@example.com", ALERT, None),
+        ("user@example.com", ALERT, None),
+    ]
+    assert results[1].subject == "Сводка: 3 уведомлений"
+    digest = next(m for m in smtp_server.messages if m["To"] == "user@example.com")
+    body = digest.get_payload()[0].get_payload(decode=True).decode("utf-8")
+    assert all(f"курс {i}" in body for i in range(3))
+
+
+def test_server_error_is_retried_on_new_connection(smtp_server, make_dispatcher):
+    smtp_server.failures = 1
+    dispatcher = make_dispatcher(retry_delay=0.05)
+    dispatcher.send("user@example.com", "Результат", "текст")
+    result = dispatcher.results.get(timeout=TIMEOUT)
+    assert result.error is None
+    assert result.attempts == 2
+    assert smtp_server.connections == 2
+    assert len(smtp_server.messages) == 1
+
+
+def test_attempts_are_limited(smtp_server, make_dispatcher):
+    smtp_server.failures = 10
+    dispatcher = make_dispatcher(retry_delay=0.01, max_attempts=3)
+    dispatcher.send("user@example.com", "Результат", "текст")
+    result = dispatcher.results.get(timeout=TIMEOUT)
+    assert result.error is not None
+    assert result.attempts == 3
+    assert smtp_server.messages == []
@@ -0,0 +1,74 @@
+import random
+from decimal import Decimal
+
+import numpy as np
+import pytest
+
+from money import CURRENCY_RULES, convert_exact, convert_many_exact, format_rate, format_rates, parse_amounts
+
+CODES = sorted(CURRENCY_RULES)
+
+
+def exact_batch(amounts, from_codes, to_codes, rates):
+    from_idx = np.array([CODES.index(code) for code in from_codes])
+    to_idx = np.array([CODES.index(code) for code in to_codes])
+    results, _ = convert_many_exact(np.array(amounts, dtype=object), from_idx, to_idx, CODES, np.array(rates))
+    return results
+
+
+def reference(amounts, from_codes, to_codes, rates):
+    return [convert_exact(*row)[0] for row in zip(amounts, from_codes, to_codes, rates)]
+
+
+def test_int64_fast_path_matches_decimal():
+    rng = random.Random(1)
+    size = 2000
+    amounts = [f"{rng.randint(-10 ** 7, 10 ** 7) / 100:.2f}" for _ in range(size)]
+    from_codes = [rng.choice(CODES) for _ in range(size)]
+    to_codes = [rng.choice(CODES) for _ in range(size)]
+    rates = [10 ** rng.uniform(-6, 6) for _ in range(size)]
+    results = exact_batch(amounts, from_codes, to_codes, rates)
+    assert results.tolist() == reference(amounts, from_codes, to_codes, rates)
+    # Почти все строки посчитаны в int64, без Decimal
+    assert len(results.decimals) < size // 10
+
+
+@pytest.mark.parametrize("amount, from_curr, to_curr, rate", [
+    # Сумма на середине минорной единицы: важно правило округления валюты
+    ("0.005", "USD", "EUR", 0.85),
+    ("0.125", "EUR", "JPY", 1.0),
+    ("0.000000005", "BTC", "ETH", 1.0),
+    # Произведение не помещается в int64
+    ("123456789012345.67", "USD", "JPY", 150.123),
+    ("-2.5", "JPY", "KRW", 9.5),
+])
+def test_decimal_fallback(amount, from_curr, to_curr, rate):
+    results = exact_batch([amount], [from_curr], [to_curr], [rate])
+    assert 0 in results.decimals
+    assert results.tolist() == reference([amount], [from_curr], [to_curr], [rate])
+
+
+def test_negative_amount_rounded_to_zero_has_no_sign():
+    args = ("-0.02494306", "RUB", "GBP", 0.0098)
+    result, _ = convert_exact(*args)
+    assert str(result) == "0.00"
+    assert exact_batch(*([arg] for arg in args)).to_strings() == ["0.00"]
+
+
+def test_same_currency_is_only_rounded():
+    results = exact_batch(["1.005", "7"], ["USD", "JPY"], ["USD", "JPY"], [1.0, 1.0])
+    assert results.tolist() == [Decimal("1.01"), Decimal("7")]
+
+
+def test_invalid_rows_have_no_result():
+    amounts = ["1", "", "abc", "2", None]
+    results = exact_batch(amounts, ["USD"] * 5, ["EUR"] * 5, [0.5, 0.5, 0.5, np.nan, 0.5])
+    assert results.to_strings() == ["0.50", None, None, None, None]
+    assert np.isnan(parse_amounts(amounts)).tolist() == [False, True, True, False, True]
+
+
+def test_rates_are_formatted_with_fixed_significant_digits():
+    rates = [0.8500000000000001, 1e9, 1.0, 1 / 65000, 9.9999999995]
+    expected = ["0.85", "1000000000", "1", "0.0000153846154", "10"]
+    assert [format_rate(rate) for rate in rates] == expected
+    assert format_rates(rates + [np.nan]) == expected + [None]
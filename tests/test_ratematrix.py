@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+import ratematrix
+from ratematrix import Quotes, RateMatrix
+
+
+def test_route_goes_through_quote_bases():
+    matrix = RateMatrix.from_quotes([
+        Quotes("USD", {"EUR": 0.5, "BTC": 0.0001}, 1.0),
+        Quotes("BTC", {"ETH": 20.0}, 1.0),
+    ])
+    assert matrix.route("EUR", "ETH") == ("EUR", "USD", "BTC", "ETH")
+    assert matrix.route("ETH", "BTC") == ("ETH", "BTC")
+    # 1 EUR = 2 USD = 0.0002 BTC = 0.004 ETH
+    assert matrix.rate("EUR", "ETH") == pytest.approx(0.004)
+    assert matrix.rate("ETH", "EUR") == pytest.approx(250.0)
+
+
+def test_equal_length_routes_prefer_liquid_quotes():
+    matrix = RateMatrix.from_quotes([
+        Quotes("USD", {"EUR": 0.5, "GBP": 0.25}, 1.0),
+        Quotes("GBP", {"XAU": 100.0}, 0.1),
+        Quotes("EUR", {"XAU": 10.0}, 1.0),
+    ])
+    assert matrix.route("USD", "XAU") == ("USD", "EUR", "XAU")
+    assert matrix.rate("USD", "XAU") == pytest.approx(5.0)
+
+
+def test_unknown_codes():
+    matrix = RateMatrix.from_quotes([Quotes("USD", {"EUR": 0.5}, 1.0)])
+    assert matrix.rate("USD", "XXX") is None
+    assert matrix.route("XXX", "USD") is None
+    assert matrix.indices(["EUR", "XXX", "USD"]).tolist() == [matrix.index["EUR"], -1, matrix.index["USD"]]
+
+
+def test_empty_quotes_give_base_only():
+    matrix = RateMatrix.from_quotes([Quotes("USD", {}, 1.0)], base="USD")
+    assert matrix.codes == ["USD"]
+    assert matrix.rate("USD", "USD") == 1.0
+
+
+def test_sparse_table_matches_dense(monkeypatch):
+    codes = ["USD", "EUR", "JPY", "BTC"]
+    vector = [1.0, 0.85, 110.0, 0.00002]
+    dense = RateMatrix(codes, vector)
+    monkeypatch.setattr(ratematrix, "MAX_DENSE", 2)
+    sparse = RateMatrix(codes, vector)
+    assert dense.matrix is not None and sparse.matrix is None
+    from_idx = np.array([0, 1, 2, 3, 3])
+    to_idx = np.array([1, 2, 3, 0, 3])
+    np.testing.assert_allclose(sparse.rates_for(from_idx, to_idx), dense.rates_for(from_idx, to_idx))
+    assert sparse.rate("JPY", "EUR") == pytest.approx(dense.rate("JPY", "EUR"))
@@ -0,0 +1,96 @@
+import pytest
+
+from rates import CRYPTO, FIAT, RateCache, RateProvider, RateProviderError
+
+
+class CountingProvider(RateProvider):
+    name = "counting"
+
+    def __init__(self, source, rates):
+        self.source = source
+        self.rates = rates
+        self.calls = 0
+        self.error = None
+
+    def fetch(self):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        return dict(self.rates)
+
+
+@pytest.fixture
+def cache(clock):
+    providers = {
+        FIAT: CountingProvider(FIAT, {"USD": 1.0, "EUR": 0.5}),
+        CRYPTO: CountingProvider(CRYPTO, {"BTC": 0.001}),
+    }
+    cache = RateCache(providers, ttl={FIAT: 60, CRYPTO: 10}, clock=clock)
+    cache.triggered = []
+    # Вместо фоновых потоков запросы на обновление только записываются
+    cache.refresher = cache.triggered.append
+    return cache
+
+
+def test_fresh_quotes_are_served_without_refresh(cache, clock):
+    cache.refresh(FIAT)
+    clock.now += 59
+    assert cache.get(FIAT) == {"USD": 1.0, "EUR": 0.5}
+    assert not cache.is_stale(FIAT)
+    assert cache.triggered == []
+    assert cache.providers[FIAT].calls == 1
+
+
+def test_stale_quotes_are_served_while_refresh_is_requested(cache, clock):
+    cache.refresh(FIAT)
+    cache.providers[FIAT].rates = {"USD": 1.0, "EUR": 0.6}
+    clock.now += 60
+    # Чтение не ждет сети: возвращаются прежние котировки
+    assert cache.get(FIAT) == {"USD": 1.0, "EUR": 0.5}
+    assert cache.triggered == [FIAT]
+    cache.refresh(FIAT)
+    assert cache.get(FIAT)["EUR"] == 0.6
+    assert cache.fetched_at(FIAT) == clock.now
+
+
+def test_ttl_is_per_source(cache, clock):
+    cache.refresh_all()
+    clock.now += 30
+    assert cache.is_stale(CRYPTO)
+    assert not cache.is_stale(FIAT)
+
+
+def test_failed_refresh_is_retried_after_pause(cache, clock):
+    provider = cache.providers[CRYPTO]
+    provider.error = RateProviderError("сеть недоступна")
+    with pytest.raises(RateProviderError):
+        cache.refresh(CRYPTO)
+    assert cache.get(CRYPTO) == {}
+    assert cache.triggered == []
+    clock.now += cache.retry_interval
+    cache.get(CRYPTO)
+    assert cache.triggered == [CRYPTO]
+
+
+def test_restored_quotes_not_fresh_until_refresh(cache, clock):
+    cache.restore(FIAT, {"USD": 1.0, "EUR": 0.4}, clock.now - 5, fresh=False)
+    assert cache.get(FIAT)["EUR"] == 0.4
+    assert cache.triggered == [FIAT]
+    assert cache.as_of(FIAT) == clock.now - 5
+
+
+def test_next_refresh_in_uses_ttl_or_interval(cache, clock):
+    assert cache.next_refresh_in(FIAT) == 0
+    cache.refresh(FIAT)
+    clock.now += 20
+    assert cache.next_refresh_in(FIAT) == 40
+    assert cache.next_refresh_in(FIAT, interval=600) == 580
+
+
+def test_snapshot_is_rebuilt_only_after_update(cache):
+    cache.refresh_all()
+    snapshot = cache.snapshot()
+    assert cache.snapshot() is snapshot
+    assert cache.rate("EUR", "BTC") == pytest.approx(0.002)
+    cache.refresh(FIAT)
+    assert cache.snapshot() is not snapshot
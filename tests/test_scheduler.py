@@ -0,0 +1,100 @@
+import queue
+import threading
+
+import pytest
+
+from scheduler import RefreshScheduler, _Job
+
+TIMEOUT = 5
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = RefreshScheduler()
+    yield scheduler
+    scheduler.stop()
+
+
+def test_backoff_doubles_up_to_limit():
+    job = _Job("fiat", None, interval=10, max_backoff=35, jitter=0, first_delay=None)
+    delays = []
+    for failures in range(5):
+        job.failures = failures
+        delays.append(job.next_delay())
+    assert delays == [10, 20, 35, 35, 35]
+
+
+def test_jitter_stays_in_bounds():
+    job = _Job("fiat", None, interval=100, max_backoff=1600, jitter=0.1, first_delay=None)
+    assert all(90 <= job.next_delay() <= 110 for _ in range(100))
+
+
+def test_failures_are_reported_and_reset(scheduler):
+    outcomes = iter([ValueError("first"), ValueError("second"), "ok"])
+
+    def func():
+        outcome = next(outcomes)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    job = scheduler.add_job("fiat", func, interval=0.01, max_backoff=0.05, jitter=0, run_at_start=True)
+    scheduler.start()
+    results = [scheduler.results.get(timeout=TIMEOUT) for _ in range(3)]
+    assert [str(result.error) for result in results[:2]] == ["first", "second"]
+    assert results[2].value == "ok" and results[2].error is None
+    assert job.failures == 0
+
+
+def test_triggers_during_run_are_coalesced(scheduler):
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def func():
+        calls.append(None)
+        started.set()
+        release.wait(TIMEOUT)
+
+    scheduler.add_job("crypto", func, interval=3600, run_at_start=True)
+    scheduler.start()
+    assert started.wait(TIMEOUT)
+    for _ in range(5):
+        scheduler.trigger("crypto")
+    release.set()
+    scheduler.results.get(timeout=TIMEOUT)
+    with pytest.raises(queue.Empty):
+        scheduler.results.get(timeout=0.2)
+    assert len(calls) == 1
+
+    # Запрос после завершения запускает задачу сразу, не дожидаясь интервала
+    scheduler.trigger("crypto")
+    scheduler.results.get(timeout=TIMEOUT)
+    assert len(calls) == 2
+
+
+def test_triggers_do_not_shorten_backoff(scheduler):
+    calls = []
+
+    def func():
+        calls.append(None)
+        raise ValueError("поставщик недоступен")
+
+    scheduler.add_job("fiat", func, interval=30, jitter=0, run_at_start=True)
+    scheduler.start()
+    assert scheduler.results.get(timeout=TIMEOUT).error is not None
+    # Так RateCache.get запрашивает обновление при каждом чтении устаревших котировок
+    for _ in range(20):
+        scheduler.trigger("fiat")
+    with pytest.raises(queue.Empty):
+        scheduler.results.get(timeout=0.3)
+    assert len(calls) == 1
+
+
+def test_first_delay_postpones_first_run(scheduler):
+    scheduler.add_job("fiat", lambda: "done", interval=3600, first_delay=3600)
+    scheduler.start()
+    with pytest.raises(queue.Empty):
+        scheduler.results.get(timeout=0.2)
+    scheduler.trigger("fiat")
+    assert scheduler.results.get(timeout=TIMEOUT).value == "done"
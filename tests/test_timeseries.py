@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+
+from timeseries import TimeSeriesStore, downsample, downsample_lttb, downsample_minmax
+
+
+@pytest.fixture
+def store(tmp_path):
+    return TimeSeriesStore(str(tmp_path / "series"))
+
+
+def series(n=10000):
+    t = np.arange(n, dtype=np.float64) * 60
+    v = np.sin(np.linspace(0, 20, n)) + 2
+    # Одиночные выбросы должны пережить прореживание
+    v[n // 8] = 10.0
+    v[n * 7 // 8] = -5.0
+    return t, v
+
+
+def test_append_and_query(store, tmp_path):
+    assert store.append_many("EUR", [10, 20, 30], [0.90, 0.91, 0.92]) == 3
+    # Точки не новее последней сохраненной отбрасываются
+    assert store.append_many("EUR", [30, 40], [0.5, 0.93]) == 1
+    t, v = store.query("EUR", 20, 40)
+    assert t.tolist() == [20, 30]
+    assert v.tolist() == [0.91, 0.92]
+    reopened = TimeSeriesStore(str(tmp_path / "series"))
+    assert reopened.codes() == ["EUR"]
+    assert reopened.last_timestamp("EUR") == 40
+    assert reopened.query("EUR")[1].tolist() == [0.90, 0.91, 0.92, 0.93]
+    assert reopened.query("RUB")[0].tolist() == []
+
+
+def test_query_pair_interpolates_quote(store):
+    store.append_many("EUR", [10, 20, 30, 40], [0.5, 0.5, 0.4, 0.5])
+    store.append_many("RUB", [5, 15, 25, 35, 45], [80, 90, 100, 110, 120])
+    t, rates = store.query_pair("EUR", "RUB", 20, 40)
+    assert t.tolist() == [20, 30]
+    # RUB в моменты 20 и 30 — середины соседних котировок, в том числе вне периода
+    np.testing.assert_allclose(rates, [95 / 0.5, 105 / 0.4])
+
+
+def test_query_pair_holds_edge_values(store):
+    store.append_many("EUR", [10, 20, 30], [0.5, 0.5, 0.5])
+    store.append_many("RUB", [15, 25], [90, 100])
+    _, rates = store.query_pair("EUR", "RUB")
+    np.testing.assert_allclose(rates, [180, 190, 200])
+
+
+def test_query_pair_without_quotes(store):
+    store.append_many("EUR", [10, 20], [0.5, 0.5])
+    assert store.query_pair("EUR", "RUB")[0].tolist() == []
+    assert store.query_pair("EUR", "EUR", 100)[1].tolist() == []
+
+
+def test_minmax_keeps_extremes_of_each_bucket():
+    t, v = series()
+    width = 200
+    dt, dv = downsample_minmax(t, v, width)
+    assert len(dt) == len(dv) == 2 * width
+    assert dv.max() == 10.0 and dv.min() == -5.0
+    edges = np.linspace(0, len(t), width + 1).astype(np.intp)
+    for i in (0, 24, width - 1):
+        bucket = v[edges[i]:edges[i + 1]]
+        assert dt[2 * i] == t[edges[i]]
+        assert dv[2 * i:2 * i + 2].tolist() == [bucket.min(), bucket.max()]
+
+
+def test_minmax_short_series_is_unchanged():
+    t, v = series(100)
+    dt, dv = downsample_minmax(t, v, 50)
+    assert dt is t and dv is v
+
+
+def test_lttb_keeps_endpoints_and_spikes():
+    t, v = series()
+    dt, dv = downsample_lttb(t, v, 300)
+    assert len(dt) == len(dv) == 300
+    assert (dt[0], dt[-1]) == (t[0], t[-1])
+    assert (dv[0], dv[-1]) == (v[0], v[-1])
+    assert np.all(np.diff(dt) > 0)
+    assert 10.0 in dv and -5.0 in dv
+    # Выбранные точки принадлежат исходному ряду
+    np.testing.assert_array_equal(v[(dt / 60).astype(np.intp)], dv)
+
+
+@pytest.mark.parametrize("width", [2, 10, 20])
+def test_lttb_short_series_is_unchanged(width):
+    t, v = series(10)
+    dt, dv = downsample_lttb(t, v, width)
+    np.testing.assert_array_equal(dt, t)
+    np.testing.assert_array_equal(dv, v)
+
+
+def test_downsample_method():
+    t, v = series()
+    assert len(downsample(t, v, 100)[0]) == 100
+    assert len(downsample(t, v, 100, method="minmax")[0]) == 200
@@ -0,0 +1,163 @@
+"""Локальное хранилище исторических котировок.
+
+Для каждой валюты на диске лежат два файла float64: время в секундах
+эпохи и значение (единиц валюты за единицу базы). Запись идет дописыванием
+в конец, чтение — через ``numpy.memmap``, так что выборка диапазона не
+загружает ряд целиком. Перед отрисовкой ряд прореживается до ширины
+графика в пикселях (min/max или LTTB).
+"""
+import os
+import threading
+
+import numpy as np
+
+
+class TimeSeriesStore:
+    """Ряды котировок по валютам в каталоге ``directory``"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._last = {}
+        self._maps = {}
+
+    def _paths(self, code):
+        base = os.path.join(self.directory, code)
+        return base + ".time", base + ".value"
+
+    def codes(self):
+        """Валюты, для которых есть сохраненные котировки"""
+        return sorted(name[:-5] for name in os.listdir(self.directory) if name.endswith(".time"))
+
+    def last_timestamp(self, code):
+        if code not in self._last:
+            t, _ = self._arrays(code)
+            self._last[code] = float(t[-1]) if len(t) else None
+        return self._last[code]
+
+    def append(self, code, timestamp, value):
+        """Добавление одной котировки"""
+        self.append_many(code, [timestamp], [value])
+
+    def append_many(self, code, timestamps, values):
+        """Добавление котировок; точки не новее последней сохраненной отбрасываются"""
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64)
+        with self._lock:
+            last = self.last_timestamp(code)
+            if last is not None:
+                keep = timestamps > last
+                timestamps, values = timestamps[keep], values[keep]
+            if not len(timestamps):
+                return 0
+            time_path, value_path = self._paths(code)
+            # Значение пишется первым: при сбое лишнее значение без времени
+            # не попадет в выборку, так как длина ряда берется по времени
+            with open(value_path, "ab") as f:
+                f.write(values.tobytes())
+            with open(time_path, "ab") as f:
+                f.write(timestamps.tobytes())
+            self._last[code] = float(timestamps[-1])
+            return len(timestamps)
+
+    def append_snapshot(self, timestamp, rates):
+        """Сохранение котировок всех валют на один момент времени"""
+        for code, value in rates.items():
+            self.append(code, timestamp, value)
+
+    def _arrays(self, code):
+        time_path, value_path = self._paths(code)
+        if not os.path.exists(time_path):
+            empty = np.empty(0)
+            return empty, empty
+        size = os.path.getsize(time_path) // 8
+        cached = self._maps.get(code)
+        if cached is not None and len(cached[0]) == size:
+            return cached
+        if size == 0:
+            empty = np.empty(0)
+            return empty, empty
+        t = np.memmap(time_path, dtype=np.float64, mode="r", shape=(size,))
+        v = np.memmap(value_path, dtype=np.float64, mode="r", shape=(size,))
+        self._maps[code] = (t, v)
+        return t, v
+
+    def query(self, code, start=None, end=None):
+        """Котировки валюты за период [start, end) без копирования"""
+        t, v = self._arrays(code)
+        lo = 0 if start is None else np.searchsorted(t, start, side="left")
+        hi = len(t) if end is None else np.searchsorted(t, end, side="left")
+        return t[lo:hi], v[lo:hi]
+
+    def query_pair(self, code, quote, start=None, end=None):
+        """Курс ``code`` в единицах ``quote`` за период.
+
+        Ряды разных источников сняты в разные моменты, поэтому значения
+        ``quote`` интерполируются на моменты ряда ``code``.
+        """
+        t, v = self.query(code, start, end)
+        qt, qv = self._arrays(quote)
+        if not len(t) or not len(qt):
+            return np.empty(0), np.empty(0)
+        # Соседние точки за границами периода нужны для интерполяции краев
+        lo = max(np.searchsorted(qt, t[0], side="right") - 1, 0)
+        hi = np.searchsorted(qt, t[-1], side="left") + 1
+        qt, qv = qt[lo:hi], qv[lo:hi]
+        if not len(qt):
+            return np.empty(0), np.empty(0)
+        return t, np.interp(t, qt, qv) / v
+
+    def __contains__(self, code):
+        return os.path.exists(self._paths(code)[0])
+
+
+def downsample_minmax(t, v, width):
+    """Прореживание до ``width`` корзин с сохранением минимума и максимума каждой"""
+    n = len(t)
+    if n <= 2 * width:
+        return np.asarray(t), np.asarray(v)
+    edges = np.linspace(0, n, width + 1).astype(np.intp)[:-1]
+    lo = np.minimum.reduceat(v, edges)
+    hi = np.maximum.reduceat(v, edges)
+    # Внутри корзины порядок min/max не важен для отрисовки линии шириной в пиксель
+    bucket_t = np.asarray(t)[edges]
+    return np.repeat(bucket_t, 2), np.column_stack([lo, hi]).ravel()
+
+
+def downsample_lttb(t, v, width):
+    """Прореживание алгоритмом Largest-Triangle-Three-Buckets до ``width`` точек"""
+    t = np.asarray(t, dtype=np.float64)
+    v = np.asarray(v, dtype=np.float64)
+    n = len(t)
+    if width >= n or width < 3:
+        return t, v
+    edges = np.linspace(1, n - 1, width - 1).astype(np.intp)
+    out = np.empty(width, dtype=np.intp)
+    out[0] = 0
+    out[-1] = n - 1
+    selected = 0
+    for i in range(width - 2):
+        start, stop = edges[i], edges[i + 1]
+        # Средняя точка следующей корзины (для последней — последняя точка ряда)
+        if i + 2 < len(edges):
+            next_t = t[stop:edges[i + 2]].mean()
+            next_v = v[stop:edges[i + 2]].mean()
+        else:
+            next_t, next_v = t[-1], v[-1]
+        bucket_t = t[start:stop]
+        bucket_v = v[start:stop]
+        area = np.abs(
+            (t[selected] - next_t) * (bucket_v - v[selected])
+            - (t[selected] - bucket_t) * (next_v - v[selected])
+        )
+        selected = start + int(np.argmax(area))
+        out[i + 1] = selected
+    return t[out], v[out]
+
+
+def downsample(t, v, width, method="lttb"):
+    """Прореживание ряда до ширины графика в пикселях"""
+    if method == "minmax":
+        return downsample_minmax(t, v, width)
+    return downsample_lttb(t, v, width)